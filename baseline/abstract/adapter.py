@@ -3,15 +3,18 @@ Abstract adapter base class for baseline models.
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, List, Union, Any
+from typing import Dict, List, Union, Any, Optional
 import logging
+import multiprocessing
+import time
 import torch
 from torch.utils.data import Dataset, DataLoader
 from datasets import Dataset as HFDataset
 import datasets
 
 from common.distributed.loader import DistributedGroupBatchSampler
-from data.processor.wrapper import load_concat_eeg_datasets, get_dataset_montage
+from common.log import setup_log
+from data.processor.wrapper import load_concat_eeg_datasets, get_dataset_montage, InMemoryEEGDataset, ConcatEEGIndex
 
 
 logger = logging.getLogger('baseline')
@@ -140,7 +143,10 @@ class AbstractDatasetAdapter(Dataset, ABC):
             idx = int(idx.item())
         
         sample = self.dataset[idx]
-        return self._process_sample(sample)
+        result = self._process_sample(sample)
+        # row position in the split, lets per-sample results be written into preallocated tensors
+        result['index'] = idx
+        return result
     
     @abstractmethod
     def get_supported_channels(self) -> List[str]:
@@ -155,16 +161,84 @@ class AbstractDatasetAdapter(Dataset, ABC):
             raise ValueError(f"Montage {montage} not found")
 
 
+class IndexedDataset(Dataset):
+    """Adds the row position as ``index`` to every row of a dataset used without adapter."""
+
+    def __init__(self, dataset: Union[HFDataset, InMemoryEEGDataset]):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        row = self.dataset[idx]
+        row['index'] = idx
+        return row
+
+    def __getitems__(self, indices: List[int]) -> List[Dict[str, Any]]:
+        if not hasattr(self.dataset, '__getitems__'):
+            return [self[idx] for idx in indices]
+        rows = self.dataset.__getitems__(indices)
+        for idx, row in zip(indices, rows):
+            row['index'] = idx
+        return rows
+
+
+class WorkerStartupTimer:
+    """DataLoader ``worker_init_fn`` reporting how long a worker took to become ready.
+
+    The spawn time is taken when the timer is pickled, which happens in the main process right
+    before a spawn/forkserver worker is started. Forked workers inherit the object unpickled and
+    only report that they are ready.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spawned_at: Optional[float] = None
+
+    def __getstate__(self):
+        return {'name': self.name, 'spawned_at': time.time()}
+
+    def __call__(self, worker_id: int):
+        worker_logger = logging.getLogger('baseline')
+        if not worker_logger.handlers:
+            setup_log(name='baseline')
+
+        if self.spawned_at is None:
+            worker_logger.info(f"{self.name} worker {worker_id} ready")
+        else:
+            worker_logger.info(f"{self.name} worker {worker_id} ready in {time.time() - self.spawned_at:.2f}s")
+
+
 class AbstractDataLoaderFactory(ABC):
     """Abstract factory for creating data loaders."""
+
+    MP_CONTEXTS = ('spawn', 'forkserver', 'fork')
     
     def __init__(self, batch_size: int = 32, num_workers: int = 4, seed: int = 42,
-                 exp_name: str = None, exp_config: dict = None):
+                 exp_name: str = None, exp_config: dict = None,
+                 in_memory: bool = False, in_memory_max_gb: float = 4.0,
+                 mp_context: str = 'spawn', lazy_batches: bool = False,
+                 batch_schedule: str = 'uniform', schedule_temperature: float = 1.0,
+                 schedule_quotas: Optional[Dict[str, float]] = None):
         self.batch_size = batch_size
         self.num_workers = num_workers
         self.seed = seed
         self.exp_name = exp_name
         self.exp_config = exp_config
+        self.in_memory = in_memory
+        self.in_memory_max_gb = in_memory_max_gb
+        self.mp_context = mp_context
+        self.lazy_batches = lazy_batches
+        self.batch_schedule = batch_schedule
+        self.schedule_temperature = schedule_temperature
+        self.schedule_quotas = schedule_quotas
+
+        # In-memory splits are kept for the lifetime of the factory, so repeated loader creation reuses them
+        self._memory_cache: dict[tuple, tuple[Union[HFDataset, InMemoryEEGDataset], ConcatEEGIndex]] = {}
+        # With keep_resident every split and its loader is kept, e.g. for the runs of an in-process sweep
+        self.keep_resident = False
+        self._loader_cache: dict[tuple, tuple[DataLoader, DistributedGroupBatchSampler]] = {}
     
     @abstractmethod
     def create_adapter(
@@ -193,29 +267,76 @@ class AbstractDataLoaderFactory(ABC):
         config_names = list(datasets_config.values())
         
         # Load combined dataset
-        combined_dataset, _ = load_concat_eeg_datasets(
+        cache_key = (tuple(dataset_names), tuple(config_names), str(split), self.exp_name)
+        loader_key = (*cache_key, num_replicas, rank)
+        if self.keep_resident and loader_key in self._loader_cache:
+            logger.info(f"Reusing resident {split} loader of {dataset_names}")
+            return self._loader_cache[loader_key]
+
+        if (self.in_memory or self.keep_resident) and cache_key in self._memory_cache:
+            combined_dataset, eeg_index = self._memory_cache[cache_key]
+        else:
+            combined_dataset, _, eeg_index = load_concat_eeg_datasets(
+                dataset_names=dataset_names,
+                builder_configs=config_names,
+                split=split,
+                cast_label=True,
+                exp_name=self.exp_name,
+                exp_config=self.exp_config,
+                in_memory=self.in_memory,
+                in_memory_max_gb=self.in_memory_max_gb,
+                return_index=True,
+            )
+            if self.in_memory or self.keep_resident:
+                self._memory_cache[cache_key] = (combined_dataset, eeg_index)
+
+        loader = self.create_dataloader_from_dataset(
+            combined_dataset,
             dataset_names=dataset_names,
-            builder_configs=config_names,
+            dataset_configs=config_names,
             split=split,
-            cast_label=True,
-            exp_name=self.exp_name,
-            exp_config=self.exp_config,
+            num_replicas=num_replicas,
+            rank=rank,
+            eeg_index=eeg_index,
         )
+        if self.keep_resident:
+            self._loader_cache[loader_key] = loader
+        return loader
 
+    def create_dataloader_from_dataset(
+        self,
+        dataset: Union[HFDataset, InMemoryEEGDataset],
+        dataset_names: List[str],
+        dataset_configs: List[str],
+        split: datasets.NamedSplit,
+        num_replicas: int = 1,
+        rank: int = 0,
+        eeg_index: Optional[ConcatEEGIndex] = None,
+    ):
+        """Create data loader for an already loaded dataset, e.g. a pruned subset of a split."""
         # Create adapter
         adapter = self.create_adapter(
-            dataset=combined_dataset,
+            dataset=dataset,
             dataset_names=dataset_names,
-            dataset_configs=config_names
+            dataset_configs=dataset_configs
         )
+        if not isinstance(adapter, AbstractDatasetAdapter):
+            adapter = IndexedDataset(adapter)
 
         sampler = DistributedGroupBatchSampler(
-            dataset=combined_dataset,
+            dataset=dataset,
             batch_size=self.batch_size,
             num_replicas=num_replicas,
             rank=rank,
             shuffle=True,
-            seed=self.seed
+            seed=self.seed,
+            lazy=self.lazy_batches,
+            eeg_index=eeg_index,
+            schedule=self.batch_schedule,
+            temperature=self.schedule_temperature,
+            quotas=self.schedule_quotas,
+            # ranks evaluate disjoint shares of every batch, only training needs them in lockstep
+            even_batches=split == datasets.Split.TRAIN,
         )
 
         dataloader_kwargs = {
@@ -223,16 +344,34 @@ class AbstractDataLoaderFactory(ABC):
             'num_workers': self.num_workers,
             'persistent_workers': self.num_workers > 0,
             'prefetch_factor': 2 if self.num_workers > 0 else None,
+            'pin_memory': isinstance(dataset, InMemoryEEGDataset) and torch.cuda.is_available(),
         }
 
         if self.num_workers > 0:
+            if isinstance(dataset, InMemoryEEGDataset):
+                dataset.share_memory_()
             # noinspection PyTypeChecker
-            dataloader_kwargs['multiprocessing_context'] = 'spawn'
+            dataloader_kwargs['multiprocessing_context'] = self._get_mp_context()
+            dataloader_kwargs['worker_init_fn'] = WorkerStartupTimer(f"{'+'.join(dataset_names)} {split}")
 
         dataloader = torch.utils.data.DataLoader(adapter, **dataloader_kwargs)
 
         return dataloader, sampler
 
+    def _get_mp_context(self):
+        """Resolve the multiprocessing context used by DataLoader workers.
+
+        'spawn' re-imports all modules in every worker, 'forkserver' imports the heavy modules once
+        in the server process, 'fork' shares the parent's address space (workers never touch CUDA).
+        """
+        if self.mp_context not in self.MP_CONTEXTS:
+            raise ValueError(f"Unknown multiprocessing context {self.mp_context}, expected one of {self.MP_CONTEXTS}")
+
+        context = multiprocessing.get_context(self.mp_context)
+        if self.mp_context == 'forkserver':
+            context.set_forkserver_preload(['torch', 'datasets', type(self).__module__])
+        return context
+
     def create_dataloader(
         self,
         datasets_config: Dict[str, str],
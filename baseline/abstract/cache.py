@@ -0,0 +1,183 @@
+"""
+Caches shared by repeated training runs.
+
+With a frozen encoder only the classification heads are trained and the pooled head input of a
+sample never changes. The embedding cache computes it once per split and stores it as a memory-mapped
+[n_sample, embed_dim] array next to the labels and montages, so every epoch only runs the head MLPs.
+
+Pretrained checkpoints can be kept resident in the process, so that runs of an in-process sweep
+read them from disk only once.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from numpy import ndarray
+from torch.utils.data import Dataset
+
+
+logger = logging.getLogger('baseline')
+
+_FILE_DIGESTS: Dict[tuple, str] = {}
+# loaded pretrained checkpoints, only kept inside ``resident_pretrained_states``
+_RESIDENT_STATES: Optional[Dict[tuple, Any]] = None
+
+
+def file_digest(path: str) -> str:
+    """Content hash of a file, memoized on path, size and modification time."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _FILE_DIGESTS:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 24), b''):
+                sha.update(chunk)
+        _FILE_DIGESTS[memo_key] = sha.hexdigest()
+    return _FILE_DIGESTS[memo_key]
+
+
+def embedding_cache_key(**parts) -> str:
+    """Stable key of a cache entry from JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+class CachedFeatureDataset(Dataset):
+    """Rows of cached pooled features, shaped like the adapter rows the trainer reads."""
+
+    def __init__(self, features: ndarray, label: ndarray, montage_id: ndarray, montage_names: List[str]):
+        self.features = features
+        self.label = label
+        self.montage_id = montage_id
+        self.montage_names = montage_names
+
+    def __len__(self):
+        return len(self.label)
+
+    def __getitem__(self, idx: int) -> dict:
+        return self.__getitems__([idx])[0]
+
+    def __getitems__(self, indices: Sequence[int]) -> List[dict]:
+        # one fancy-indexed read of the memory map per batch
+        features = torch.from_numpy(np.asarray(self.features[np.asarray(indices)], dtype=np.float32))
+        return [
+            {
+                'features': features[i],
+                'label': torch.tensor(self.label[idx], dtype=torch.long),
+                'montage': self.montage_names[self.montage_id[idx]],
+                'index': idx,
+            }
+            for i, idx in enumerate(indices)
+        ]
+
+
+class EmbeddingCacheWriter:
+    """Fill a cache entry row by row, the entry becomes visible only after ``close``."""
+
+    def __init__(self, path: Path, n_sample: int, feature_shape: Sequence[int]):
+        self.path = path
+        self.tmp_path = path.with_name(path.name + '.tmp')
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        self.tmp_path.mkdir(parents=True)
+
+        self.features = np.lib.format.open_memmap(
+            self.tmp_path / EmbeddingCache.FEATURES, mode='w+', dtype=np.float32, shape=(n_sample, *feature_shape)
+        )
+        self.label = np.zeros(n_sample, dtype=np.int64)
+        self.montage_id = np.full(n_sample, -1, dtype=np.int32)
+        self.montage_names: List[str] = []
+
+    def write(self, index: ndarray, features: ndarray, label: ndarray, montages: List[str]):
+        for montage in montages:
+            if montage not in self.montage_names:
+                self.montage_names.append(montage)
+        self.features[index] = features
+        self.label[index] = label
+        self.montage_id[index] = [self.montage_names.index(m) for m in montages]
+
+    def close(self) -> CachedFeatureDataset:
+        missing = int((self.montage_id < 0).sum())
+        if missing:
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
+            raise RuntimeError(f"Embedding cache {self.path.name}: {missing} rows were never written")
+
+        self.features.flush()
+        del self.features
+        np.save(self.tmp_path / EmbeddingCache.LABELS, self.label)
+        np.save(self.tmp_path / EmbeddingCache.MONTAGES, self.montage_id)
+        with open(self.tmp_path / EmbeddingCache.META, 'w') as f:
+            json.dump({'montage_names': self.montage_names}, f)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.tmp_path, self.path)
+        return EmbeddingCache.read(self.path)
+
+
+class EmbeddingCache:
+    """Directory of cached split features, one sub directory per key."""
+
+    FEATURES = 'features.npy'
+    LABELS = 'label.npy'
+    MONTAGES = 'montage.npy'
+    META = 'meta.json'
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+
+    @classmethod
+    def read(cls, path: Path) -> CachedFeatureDataset:
+        with open(path / cls.META) as f:
+            meta = json.load(f)
+        return CachedFeatureDataset(
+            features=np.load(path / cls.FEATURES, mmap_mode='r'),
+            label=np.load(path / cls.LABELS),
+            montage_id=np.load(path / cls.MONTAGES),
+            montage_names=meta['montage_names'],
+        )
+
+    def load(self, key: str) -> Optional[CachedFeatureDataset]:
+        path = self.cache_dir / key
+        if not (path / self.META).exists():
+            return None
+        logger.info(f"Loading cached embeddings from {path}")
+        return self.read(path)
+
+    def writer(self, key: str, n_sample: int, feature_shape: Sequence[int]) -> EmbeddingCacheWriter:
+        return EmbeddingCacheWriter(self.cache_dir / key, n_sample, feature_shape)
+
+
+@contextmanager
+def resident_pretrained_states():
+    """Keep the checkpoints read by ``load_pretrained_state`` in memory until the context exits."""
+    global _RESIDENT_STATES
+    previous = _RESIDENT_STATES
+    _RESIDENT_STATES = {} if previous is None else previous
+    try:
+        yield
+    finally:
+        _RESIDENT_STATES = previous
+
+
+def load_pretrained_state(path: str, map_location: Any = None) -> Any:
+    """``torch.load`` a pretrained checkpoint, reusing the resident copy when there is one.
+
+    Resident checkpoints are shared, callers must not modify the returned object.
+    """
+    if _RESIDENT_STATES is None:
+        return torch.load(path, map_location=map_location, weights_only=False)
+
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, str(map_location))
+    if key in _RESIDENT_STATES:
+        logger.info(f"Reusing resident pretrained checkpoint {path}")
+    else:
+        _RESIDENT_STATES[key] = torch.load(path, map_location=map_location, weights_only=False)
+    return _RESIDENT_STATES[key]
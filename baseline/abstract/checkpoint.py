@@ -0,0 +1,135 @@
+"""
+Background checkpoint writing with retention.
+
+The state is copied to CPU on the calling thread, so training can continue to update the
+parameters while a single writer thread serializes the snapshot. Files are written to a
+temporary name and atomically renamed, a checkpoint on disk is therefore always complete.
+"""
+
+import logging
+import os
+import re
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+from torch import Tensor
+
+
+logger = logging.getLogger('baseline')
+
+# retained checkpoints are named <prefix>_epoch_<n>.pt
+EPOCH_PATTERN = re.compile(r'^(?P<prefix>.+)_epoch_(?P<epoch>\d+)\.pt$')
+
+
+def snapshot_to_cpu(state: Any) -> Any:
+    """Copy all tensors of a nested checkpoint structure to CPU."""
+    if isinstance(state, Tensor):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return type(state)((key, snapshot_to_cpu(value)) for key, value in state.items())
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot_to_cpu(value) for value in state)
+    return state
+
+
+class CheckpointWriter:
+    """Write checkpoints in a background thread and prune old epoch checkpoints.
+
+    Per directory the ``keep_last`` most recent and the ``keep_best`` best scored epoch checkpoints
+    are kept, 0 disables the respective limit. Checkpoints saved with ``retain=False`` (e.g. the
+    ``last`` milestone) are never pruned. A ``latest`` path receives a copy of the written file, this
+    keeps the resumable ``last`` checkpoint current without a second snapshot.
+
+    Retained checkpoints carry their score, the history of a directory is seeded from the epoch
+    checkpoints already on disk when it is first written to, e.g. by an earlier run that is resumed.
+    """
+
+    def __init__(self, asynchronous: bool = True, keep_last: int = 0, keep_best: int = 0,
+                 higher_is_better: bool = True):
+        self.asynchronous = asynchronous
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self.higher_is_better = higher_is_better
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ckpt') if asynchronous else None
+        self._pending: Optional[Future] = None
+        self._history: Dict[Path, List[Tuple[Path, Optional[float]]]] = {}
+
+    def save(self, checkpoint: dict, path: Path, score: Optional[float] = None, retain: bool = True,
+             latest: Optional[Path] = None):
+        snapshot = snapshot_to_cpu(checkpoint)
+        if retain:
+            snapshot['retention_score'] = score
+        if not self.asynchronous:
+            self._write(snapshot, path, score, retain, latest)
+            return
+
+        # one write in flight, a slow disk throttles training instead of piling up snapshots
+        self.wait()
+        self._pending = self._executor.submit(self._write, snapshot, path, score, retain, latest)
+
+    def wait(self):
+        """Block until the pending write is on disk, re-raising its error."""
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def _write(self, snapshot: dict, path: Path, score: Optional[float], retain: bool, latest: Optional[Path]):
+        tmp_path = path.with_name(path.name + '.tmp')
+        torch.save(snapshot, tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"Checkpoint written: {path}")
+
+        if latest is not None:
+            tmp_latest = latest.with_name(latest.name + '.tmp')
+            shutil.copyfile(path, tmp_latest)
+            os.replace(tmp_latest, latest)
+
+        if retain:
+            if path.parent not in self._history:
+                self._history[path.parent] = self._existing_history(path)
+            history = self._history[path.parent]
+            history[:] = [(p, s) for p, s in history if p != path] + [(path, score)]
+            self._prune(history)
+
+    @staticmethod
+    def _existing_history(path: Path) -> List[Tuple[Path, Optional[float]]]:
+        """Epoch checkpoints with the prefix of ``path`` written before, ordered by epoch."""
+        match = EPOCH_PATTERN.match(path.name)
+        if match is None:
+            return []
+
+        existing = []
+        for candidate in path.parent.glob(f"{match['prefix']}_epoch_*.pt"):
+            candidate_match = EPOCH_PATTERN.match(candidate.name)
+            if candidate == path or candidate_match is None or candidate_match['prefix'] != match['prefix']:
+                continue
+            try:
+                # tensors are memory mapped, only the pickled metadata is read
+                score = torch.load(candidate, map_location='cpu', mmap=True, weights_only=False).get('retention_score')
+            except Exception as e:
+                logger.warning(f"Unreadable checkpoint {candidate} is left out of retention: {e}")
+                continue
+            existing.append((int(candidate_match['epoch']), candidate, score))
+        return [(p, s) for _, p, s in sorted(existing)]
+
+    def _prune(self, history: List[Tuple[Path, Optional[float]]]):
+        if self.keep_last <= 0 and self.keep_best <= 0:
+            return
+
+        keep = {p for p, _ in history[-self.keep_last:]} if self.keep_last > 0 else set()
+        if self.keep_best > 0:
+            scored = sorted(
+                ((p, s) for p, s in history if s is not None),
+                key=lambda item: item[1], reverse=self.higher_is_better,
+            )
+            keep.update(p for p, _ in scored[:self.keep_best])
+
+        for entry in list(history):
+            if entry[0] not in keep:
+                entry[0].unlink(missing_ok=True)
+                history.remove(entry)
+                logger.info(f"Checkpoint removed by retention policy: {entry[0]}")
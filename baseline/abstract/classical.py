@@ -11,8 +11,7 @@ from torch.utils.data import DataLoader
 from pydantic import Field
 
 from common.config import AbstractConfig, BaseDataArgs, BaseModelArgs, BaseTrainingArgs, BaseLoggingArgs
-from baseline.abstract.trainer import AbstractTrainer, format_console_log_dict
-from common.distributed.env import get_is_master
+from baseline.abstract.trainer import AbstractTrainer
 from common.distributed.loader import DistributedGroupBatchSampler
 from data.processor.wrapper import get_dataset_montage, get_dataset_n_class, get_dataset_category, get_dataset_patch_len
 
@@ -100,7 +99,10 @@ class ClassicalTrainer(AbstractTrainer, ABC):
         self.loss_fn = nn.CrossEntropyLoss()
 
     def load_checkpoint(self, checkpoint_path: str):
-        pass
+        """Load the model weights of a checkpoint written by ``save_checkpoint``."""
+        checkpoint = torch.load(checkpoint_path, map_location=self.device, weights_only=False)
+        self.model.load_state_dict(checkpoint['model_state_dict'])
+        logger.info(f"Loaded model weights from {checkpoint_path}")
 
     def collect_dataset_info(self, mixed: bool, ds_name: str = ''):
         logger.info(f"Collecting dataset information for {'multitask' if self.multitask else 'per dataset'} ...")
@@ -141,49 +143,40 @@ class ClassicalTrainer(AbstractTrainer, ABC):
         self.model.train()
         train_sampler.set_epoch(self.epoch)
 
-        batch: dict
-        for step_in_epoch, batch in enumerate(train_loader):
-            self.optimizer.zero_grad()
+        accum_steps = self.cfg.training.grad_accum_steps
+        n_batches = len(train_loader)
+        window, outputs = [], []
+        self.optimizer.zero_grad()
 
+        batch: dict
+        for batch_idx, batch in enumerate(train_loader):
             batch = {k: v.to(self.device) if isinstance(v, torch.Tensor) else v for k, v in batch.items()}
-            labels = batch['label']
             ds_name = batch['montage'][0].split('/')[0]
+            window.append(batch)
 
-            # Forward pass with mixed precision
-            logits, loss = self.train_step(batch, labels)
-
-            # Check for NaN loss
-            if torch.isnan(loss):
-                logger.warning(f"NaN loss detected at step {self.current_step}")
+            # Forward and backward pass with mixed precision, the last step of the epoch takes the remaining batches
+            window_size = min(accum_steps, n_batches - (batch_idx + 1 - len(window)))
+            self.backward_window(window, outputs, window_size)
+            if len(window) < window_size:
+                continue
 
-            # Backward pass
-            self.scaler.scale(loss).backward()
+            loss, step_acc, grad_norm = self.optimizer_step(window, outputs)
+            window, outputs = [], []
 
-            grad_norm = self._clip_grad_norm_()
-
-            # Optimizer step
-            self.scaler.step(self.optimizer)
-            self.scaler.update()
+            # Check for NaN loss, reported when the step logs are flushed
+            self.step_logs.track_loss(loss, self.current_step)
 
             # Logging with distributed reduction
             if self.current_step % self.cfg.logging.log_step_interval == 0:
-                # Calculate step accuracy
-                preds = torch.argmax(logits, dim=-1)
-                step_acc = (preds == labels).float().mean()
-
-                # Create tensors for distributed reduction
-                loss_tensor = loss.clone().detach()
-                acc_tensor = step_acc.clone().detach()
+                loss_tensor = self.mean_across_ranks(loss.detach())
+                acc_tensor = self.mean_across_ranks(step_acc.detach())
 
-                torch.distributed.all_reduce(loss_tensor, op=torch.distributed.ReduceOp.AVG)
-                torch.distributed.all_reduce(acc_tensor, op=torch.distributed.ReduceOp.AVG)
-
-                if get_is_master():
+                if self.is_master:
                     log_data = {
                         'train/epoch': self.epoch,
                         'train/step': self.current_step,
-                        'train/loss_ce': loss_tensor.cpu().item(),
-                        'train/acc': acc_tensor.cpu().item(),
+                        'train/loss_ce': loss_tensor,
+                        'train/acc': acc_tensor,
                         'train/grad_norm': grad_norm,
                         'train/encoder_lr': self.scheduler.get_last_lr()[0],
                     }
@@ -191,11 +184,18 @@ class ClassicalTrainer(AbstractTrainer, ABC):
                     if not self.multitask:
                         log_data = {f"{ds_name}/{key}": value for key, value in log_data.items()}
 
-                    # Log to cloud services
-                    if self.cfg.logging.use_cloud:
-                        self._log_to_cloud(log_data)
-
-                    logger.info(format_console_log_dict(log_data, prefix='train'))
+                    self.step_logs.append(log_data)
 
             self.current_step += 1
-            self.scheduler.step()
\ No newline at end of file
+            self.scheduler.step()
+
+            if len(self.step_logs) >= self.cfg.logging.log_flush_interval:
+                self.flush_step_logs()
+
+            if self.step_eval_due():
+                self.flush_step_logs()
+                self.evaluate()
+                if self.early_stopping.should_stop:
+                    break
+
+        self.flush_step_logs()
\ No newline at end of file
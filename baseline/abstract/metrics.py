@@ -0,0 +1,213 @@
+"""
+Streaming metrics for training and evaluation.
+
+Evaluation batches update a confusion matrix, the running loss and, for binary tasks, histograms of
+the positive class probability per label, all on the evaluation device. The metrics are derived once
+at the end of the epoch, so memory does not grow with the split size and there is no per-batch sync.
+Training step logs are buffered on the device in the same way and flushed every few steps.
+The early stopping controller follows a metric over the evaluations of a run.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+import torch
+from torch import Tensor
+
+
+logger = logging.getLogger('baseline')
+
+
+class StreamingClassificationMetrics:
+    """Accumulate classification results of one dataset batch by batch.
+
+    Accuracy, balanced accuracy, Cohen's kappa and weighted F1 follow from the confusion matrix and
+    equal the sklearn scores. AUROC and AUC-PR are computed on ``n_bins`` probability bins, which
+    differs from sklearn only for distinct scores falling into the same bin.
+    """
+
+    def __init__(self, n_class: int, device: Optional[torch.device] = None, n_bins: int = 4096):
+        self.n_class = n_class
+        self.n_bins = n_bins
+        self.cm = torch.zeros((n_class, n_class), dtype=torch.int64, device=device)
+        self.loss_sum = torch.zeros((), dtype=torch.float64, device=device)
+        self.count = torch.zeros((), dtype=torch.int64, device=device)
+        # [label, bin] counts of the positive class probability
+        self.score_hist = torch.zeros((2, n_bins), dtype=torch.int64, device=device) if n_class == 2 else None
+
+    @torch.no_grad()
+    def update(self, logits: Tensor, labels: Tensor, loss: Optional[Tensor] = None):
+        logits = logits.detach().float()
+        labels = labels.detach().long()
+        pred = torch.argmax(logits, dim=-1)
+
+        linear_indices = labels * self.n_class + pred
+        self.cm += torch.bincount(linear_indices, minlength=self.n_class ** 2).view(self.n_class, self.n_class)
+        self.count += labels.numel()
+        if loss is not None:
+            self.loss_sum += loss.detach().double() * labels.numel()
+
+        if self.score_hist is not None:
+            prob = torch.softmax(logits, dim=-1)[:, 1]
+            bins = (prob * self.n_bins).long().clamp_(0, self.n_bins - 1)
+            self.score_hist += torch.bincount(labels * self.n_bins + bins, minlength=2 * self.n_bins).view(2, self.n_bins)
+
+    def all_reduce(self):
+        """Sum the statistics of all data-parallel ranks, afterwards every rank computes the same metrics."""
+        stats = [self.cm, self.loss_sum, self.count]
+        if self.score_hist is not None:
+            stats.append(self.score_hist)
+        for stat in stats:
+            torch.distributed.all_reduce(stat, op=torch.distributed.ReduceOp.SUM)
+
+    def compute(self) -> Dict[str, float]:
+        """Metrics named like the keys of ``_calculate_metrics_for_dataset``."""
+        cm = self.cm.double().cpu()
+        total = cm.sum()
+        support = cm.sum(dim=1)
+        predicted = cm.sum(dim=0)
+        tp = torch.diag(cm)
+
+        metrics = {
+            'loss': (self.loss_sum / self.count.clamp(min=1)).item(),
+            'acc': (tp.sum() / total).item(),
+            # classes never seen as label are left out, like sklearn
+            'balanced_acc': (tp[support > 0] / support[support > 0]).mean().item(),
+        }
+
+        if self.score_hist is not None:
+            metrics['auroc'], metrics['auc_pr'] = self._binned_auc()
+        else:
+            expected = torch.outer(support, predicted) / total
+            off_diagonal = 1.0 - torch.eye(self.n_class, dtype=torch.float64)
+            metrics['cohen_kappa'] = (1.0 - (off_diagonal * cm).sum() / (off_diagonal * expected).sum()).item()
+
+            denom = support + predicted
+            f1 = torch.where(denom > 0, 2 * tp / denom.clamp(min=1), torch.zeros_like(tp))
+            metrics['f1'] = ((f1 * support).sum() / support.sum()).item()
+
+        return metrics
+
+    def _binned_auc(self) -> tuple[float, float]:
+        # thresholds from the highest probability bin down, only bins holding samples
+        neg, pos = self.score_hist.double().cpu().flip(dims=[1])
+        keep = (neg + pos) > 0
+        tps, fps = torch.cumsum(pos, 0)[keep], torch.cumsum(neg, 0)[keep]
+        n_pos, n_neg = pos.sum(), neg.sum()
+
+        if n_pos == 0 or n_neg == 0:
+            logger.warning('Only one class present in labels, AUROC and AUC-PR are set to 0')
+            return 0.0, 0.0
+
+        zero = torch.zeros(1, dtype=torch.float64)
+        tpr = torch.cat([zero, tps / n_pos])
+        fpr = torch.cat([zero, fps / n_neg])
+        auroc = torch.trapezoid(tpr, fpr).item()
+
+        # step-wise average precision as in sklearn
+        precision = tps / (tps + fps)
+        recall = tpr
+        auc_pr = ((recall[1:] - recall[:-1]) * precision).sum().item()
+        return auroc, auc_pr
+
+
+class StepLogBuffer:
+    """Training step logs kept on the device until flushed.
+
+    Values may be 0-dim tensors, all of them are copied to the host with one transfer at ``flush``,
+    so logging does not force a device sync every step. NaN losses are counted on the device.
+    """
+
+    def __init__(self):
+        self.entries: List[dict] = []
+        self.nan_count: Optional[Tensor] = None
+        self.first_step: Optional[int] = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def track_loss(self, loss: Tensor, step: int):
+        nan = torch.isnan(loss.detach()).to(torch.int64)
+        self.nan_count = nan if self.nan_count is None else self.nan_count + nan
+        if self.first_step is None:
+            self.first_step = step
+
+    def append(self, log_data: dict):
+        self.entries.append(log_data)
+
+    def flush(self, last_step: int) -> List[dict]:
+        """Return the buffered logs with host values and warn about NaN losses since the last flush."""
+        tensors = [value for entry in self.entries for value in entry.values() if isinstance(value, Tensor)]
+        if self.nan_count is not None:
+            tensors.append(self.nan_count)
+
+        values = torch.stack([t.detach().float() for t in tensors]).tolist() if tensors else []
+        if self.nan_count is not None:
+            n_nan = int(values.pop())
+            if n_nan:
+                logger.warning(f"NaN loss detected in {n_nan} steps between step {self.first_step} and {last_step}")
+
+        value_iter = iter(values)
+        logs = [
+            {key: next(value_iter) if isinstance(value, Tensor) else value for key, value in entry.items()}
+            for entry in self.entries
+        ]
+
+        self.entries = []
+        self.nan_count = None
+        self.first_step = None
+        return logs
+
+
+class EarlyStopping:
+    """Track the best value of a monitored metric and stop after ``patience`` evaluations without improvement.
+
+    An evaluation improves when it beats the best value by more than ``min_delta``, ``patience=0`` only tracks
+    the best value.
+    """
+
+    def __init__(self, patience: int = 0, min_delta: float = 0.0, higher_is_better: bool = True):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.higher_is_better = higher_is_better
+
+        self.best: Optional[float] = None
+        self.best_epoch: Optional[int] = None
+        self.best_step: Optional[int] = None
+        self.num_bad_evals = 0
+
+    @property
+    def should_stop(self) -> bool:
+        return self.patience > 0 and self.num_bad_evals >= self.patience
+
+    def update(self, value: Optional[float], epoch: int, step: int) -> bool:
+        """Record an evaluation, return whether it is the new best."""
+        if value is None:
+            return False
+
+        if self.best is None:
+            improved = True
+        else:
+            delta = value - self.best if self.higher_is_better else self.best - value
+            improved = delta > self.min_delta
+
+        if improved:
+            self.best, self.best_epoch, self.best_step = value, epoch, step
+            self.num_bad_evals = 0
+        else:
+            self.num_bad_evals += 1
+        return improved
+
+    def state_dict(self) -> dict:
+        return {
+            'best': self.best,
+            'best_epoch': self.best_epoch,
+            'best_step': self.best_step,
+            'num_bad_evals': self.num_bad_evals,
+        }
+
+    def load_state_dict(self, state: dict):
+        self.best = state['best']
+        self.best_epoch = state['best_epoch']
+        self.best_step = state['best_step']
+        self.num_bad_evals = state['num_bad_evals']
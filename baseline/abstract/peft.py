@@ -0,0 +1,92 @@
+"""
+Parameter-efficient fine-tuning of the encoder blocks.
+
+LoRA adds a trainable low-rank update to the weights of the linear and attention layers through
+``torch.nn.utils.parametrize``, bottleneck adapters are added to the block outputs by forward hooks.
+Both start as the identity of the pretrained encoder, whose own weights stay frozen.
+"""
+
+import math
+from typing import List
+
+import torch
+from torch import nn, Tensor
+from torch.nn.utils import parametrize
+
+
+PEFT_METHODS = ('lora', 'adapter')
+
+
+class LoRAParametrization(nn.Module):
+    """Low-rank update ``W + B @ A * alpha / rank`` of a weight matrix, B is zero at initialization."""
+
+    def __init__(self, out_features: int, in_features: int, rank: int, alpha: float):
+        super().__init__()
+        self.lora_A = nn.Parameter(torch.empty(rank, in_features))
+        self.lora_B = nn.Parameter(torch.zeros(out_features, rank))
+        self.scale = alpha / rank
+        nn.init.kaiming_uniform_(self.lora_A, a=math.sqrt(5))
+
+    def forward(self, weight: Tensor) -> Tensor:
+        return weight + (self.lora_B @ self.lora_A).to(weight.dtype) * self.scale
+
+
+class BottleneckAdapter(nn.Module):
+    """Residual down- and up-projection, the up-projection is zero at initialization."""
+
+    def __init__(self, dim: int, bottleneck_dim: int):
+        super().__init__()
+        self.down = nn.Linear(dim, bottleneck_dim)
+        self.act = nn.GELU()
+        self.up = nn.Linear(bottleneck_dim, dim)
+        nn.init.zeros_(self.up.weight)
+        nn.init.zeros_(self.up.bias)
+
+    def forward(self, x: Tensor) -> Tensor:
+        return x + self.up(self.act(self.down(x)))
+
+
+def _add_adapter(block: nn.Module, args, output):
+    if isinstance(output, tuple):
+        return (block.adapter(output[0]),) + output[1:]
+    return block.adapter(output)
+
+
+def inject_lora(blocks: nn.ModuleList, rank: int, alpha: float, targets: List[str]) -> int:
+    """
+    Parametrize the linear layers and the input projections of nn.MultiheadAttention in the blocks.
+    ``targets`` restricts them to the given module names, e.g. ['qkv', 'proj'], all are adapted if empty.
+    Returns the number of adapted weights.
+    """
+    n_adapted = 0
+    for block in blocks:
+        for name, module in list(block.named_modules()):
+            if targets and name.split('.')[-1] not in targets:
+                continue
+            if isinstance(module, nn.Linear):
+                tensor_name = 'weight'
+            elif isinstance(module, nn.MultiheadAttention) and module._qkv_same_embed_dim:
+                tensor_name = 'in_proj_weight'
+            else:
+                continue
+
+            out_features, in_features = getattr(module, tensor_name).shape
+            parametrize.register_parametrization(
+                module, tensor_name, LoRAParametrization(out_features, in_features, rank, alpha)
+            )
+            n_adapted += 1
+    return n_adapted
+
+
+def inject_adapters(blocks: nn.ModuleList, bottleneck_dim: int) -> int:
+    """Add a bottleneck adapter to the output of every block, returns the number of adapters."""
+    for block in blocks:
+        # the first layer norm of a transformer block normalizes its input, which has the output width
+        norm = next(module for module in block.modules() if isinstance(module, nn.LayerNorm))
+        block.adapter = BottleneckAdapter(norm.normalized_shape[-1], bottleneck_dim)
+        block.register_forward_hook(_add_adapter)
+    return len(blocks)
+
+
+def is_peft_parameter(name: str) -> bool:
+    return '.lora_' in name or '.adapter.' in name
@@ -2,30 +2,50 @@
 Abstract trainer base class for baseline models.
 """
 import datetime
+import math
+import multiprocessing
 import os
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from abc import ABC, abstractmethod
 from copy import deepcopy
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 import comet_ml
 import datasets
 import pandas as pd
 import torch
 import wandb
-from sklearn.metrics import balanced_accuracy_score, roc_auc_score, average_precision_score, cohen_kappa_score, f1_score
-from torch import Tensor
+from torch import Tensor, nn
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader
 
 from baseline.abstract.adapter import AbstractDataLoaderFactory
+from baseline.abstract.cache import EmbeddingCache, embedding_cache_key, file_digest, load_pretrained_state
+from baseline.abstract.checkpoint import CheckpointWriter
+from baseline.abstract.classifier import MultiHeadClassifier
+from baseline.abstract.metrics import EarlyStopping, StreamingClassificationMetrics, StepLogBuffer
+from baseline.abstract.peft import PEFT_METHODS, inject_adapters, inject_lora, is_peft_parameter
 from common.config import AbstractConfig
-from baseline.utils.utils import seed_torch
+from common.distributed.env import get_cpu_bf16_support, get_local_rank, get_process_cpu
+from baseline.utils.network import checkpoint_blocks
+from baseline.utils.utils import get_rng_state, seed_torch, set_rng_state
 from common.log import setup_log
-from data.processor.wrapper import get_dataset_n_class, get_dataset_category
+from data.processor.wrapper import get_dataset_n_class, get_dataset_category, get_dataset_n_sample
 
 logger = logging.getLogger("baseline")
 
+# settings that may change between a run and its resumption
+RESUME_IGNORED_KEYS = {
+    'datasets', 'device', 'parallel_datasets', 'resume', 'num_workers', 'mp_context',
+    'eval_interval', 'eval_step_interval', 'eval_time_interval', 'early_stopping_patience',
+    'micro_batch_size', 'oom_micro_batch', 'thread_budget', 'cpu_budget',
+    'use_compile', 'compile_mode', 'compile_dynamic', 'compile_cache_dir',
+}
+
 
 METRIC_PRECISION_DICT = {
     "lr": "6e",
@@ -69,6 +89,37 @@ def format_console_log_dict(log_data: dict, prefix: str = 'train') -> str:
     return formatted_log
 
 
+def run_dataset_job(
+        cfg: dict,
+        datasets_config: Dict[str, str],
+        device: str,
+        num_threads: int,
+        results_dir: str,
+        exp_name: Optional[str] = None,
+        preproc_exp_config: Optional[dict] = None,
+        mc_dropout_pruning: bool = False,
+        mc_prune_ratio: float = 0.4,
+) -> list[str]:
+    """Train separate models for a group of datasets in a worker process, return the result CSVs."""
+    from baseline.abstract.factory import ModelRegistry
+
+    torch.set_num_threads(num_threads)
+    cfg = deepcopy(cfg)
+    cfg['data']['datasets'] = datasets_config
+    cfg['training']['device'] = device
+    cfg['training']['cpu_budget'] = num_threads
+    cfg['training']['parallel_datasets'] = 1
+    config = ModelRegistry.get_config_class(cfg['model_type']).model_validate(cfg)
+
+    trainer = ModelRegistry.create_trainer(config)
+    trainer.exp_name = exp_name
+    trainer.preproc_exp_config = preproc_exp_config
+    trainer.results_dir = Path(results_dir)
+    trainer.setup_run()
+    trainer.run_separate_training(mc_dropout_pruning, mc_prune_ratio)
+    return [str(path) for path in trainer.saved_results]
+
+
 class AbstractTrainer(ABC):
     """Abstract base trainer for all baseline models."""
     
@@ -78,14 +129,37 @@ class AbstractTrainer(ABC):
         self.multitask = cfg.multitask
 
         self.device = None
+        # Autocast dtype on the training device, None computes in fp32
+        self.amp_dtype: Optional[torch.dtype] = None
         self.model = None
         self.optimizer = None
         self.scheduler = None
         self.scaler = None
         self.loss_fn = None
+        # DistributedDataParallel wrapper of the model, used for the training forward pass
+        self.ddp_model: Optional[DistributedDataParallel] = None
+        # parameter groups of the optimizer, split by build_model before the encoder is frozen and wrapped
+        self.optim_params: Optional[list[dict]] = None
+
+        # Data-parallel replica of this process, set by setup_distributed
+        self.rank = 0
+        self.local_rank = 0
+        self.world_size = 1
+        self.is_master = True
 
         self.epoch = 0
         self.current_step = 0
+        self.step_logs = StepLogBuffer()
+        # Samples per forward pass, 0 runs whole loader batches, halved on out-of-memory
+        self.micro_batch_size = cfg.training.micro_batch_size
+
+        # Evaluation cadence and early stopping of the running fit
+        self.early_stopping: Optional[EarlyStopping] = None
+        self.eval_loaders: Optional[tuple] = None
+        self.eval_ds_name: Optional[str] = None
+        self.eval_checkpoint = True
+        self.last_eval_step: Optional[int] = None
+        self.last_eval_time = 0.0
         
         # Dataset information
         self.ds_conf = cfg.data.datasets
@@ -94,12 +168,24 @@ class AbstractTrainer(ABC):
         self.ds_info = {}
         self.montage_info = {}
         self.dataloader_factory: Optional[AbstractDataLoaderFactory] = None
+        self.embedding_cache = EmbeddingCache(cfg.training.embedding_cache_dir) if cfg.training.embedding_cache else None
+        self.checkpoint_writer = CheckpointWriter(
+            asynchronous=cfg.logging.ckpt_async,
+            keep_last=cfg.logging.ckpt_keep_last,
+            keep_best=cfg.logging.ckpt_keep_best,
+            higher_is_better='loss' not in cfg.logging.ckpt_metric,
+        )
 
         self.start_time = datetime.datetime.now()
         self.comet_experiment = None
         
         # CSV results tracking
         self.results_history = []
+        # overrides of the in-process sweep point, tagged on the result rows and file
+        self.sweep_point: Dict[str, object] = {}
+        self.results_tag: Optional[str] = None
+        self.results_dir: Optional[Path] = None
+        self.saved_results: list[Path] = []
         self.mc_iteration = 1  # Track MC dropout iteration (1 or 2)
         
         # Experiment info for dataset loading (set by run_training)
@@ -107,13 +193,66 @@ class AbstractTrainer(ABC):
         self.preproc_exp_config: Optional[dict] = None
 
     
+    def setup_distributed(self):
+        """Pick up rank and world size of the process group joined by the launcher."""
+        if torch.distributed.is_initialized():
+            self.rank = torch.distributed.get_rank()
+            self.world_size = torch.distributed.get_world_size()
+            self.local_rank = get_local_rank()
+        self.is_master = self.rank == 0
+
     def setup_device(self):
         """Setup device for training."""
-        self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-        if torch.cuda.is_available():
-            torch.cuda.set_device(0)
+        if self.cfg.training.device is not None:
+            self.device = torch.device(self.cfg.training.device)
+        elif torch.cuda.is_available():
+            self.device = torch.device(f"cuda:{self.local_rank}")
+        else:
+            self.device = torch.device("cpu")
+        if self.device.type == 'cuda':
+            torch.cuda.set_device(self.device)
         logger.info(f"Using device: {self.device}")
 
+    def setup_precision(self):
+        """Pick the autocast dtype of the device, CPUs without native bf16 stay in fp32."""
+        self.amp_dtype = None
+        if self.cfg.training.use_amp:
+            if self.device.type == 'cuda':
+                self.amp_dtype = torch.bfloat16
+            elif self.device.type == 'cpu':
+                policy = self.cfg.training.cpu_precision
+                if policy not in ('auto', 'bf16', 'fp32'):
+                    raise ValueError(f"Unknown cpu_precision {policy}, expected 'auto', 'bf16' or 'fp32'")
+                if policy == 'bf16' or (policy == 'auto' and get_cpu_bf16_support()):
+                    self.amp_dtype = torch.bfloat16
+        logger.info(f"Mixed precision: {self.amp_dtype or 'fp32'}")
+
+    def setup_threads(self):
+        """Split the cores of the process between intra-op threads and DataLoader workers."""
+        if not self.cfg.training.thread_budget:
+            return
+
+        budget = self.cfg.training.cpu_budget or get_process_cpu()
+        num_workers = self.cfg.data.num_workers
+        if num_workers >= budget:
+            logger.warning(f"{num_workers} DataLoader workers exceed the budget of {budget} cores")
+        num_threads = max(1, budget - num_workers)
+
+        torch.set_num_threads(num_threads)
+        # eager models run their ops one after another, inter-op threads would only idle
+        if torch.get_num_interop_threads() != 1:
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                logger.warning("Inter-op threads are already in use and keep their count")
+        logger.info(f"CPU budget {budget}: {num_threads} intra-op threads, {num_workers} DataLoader workers")
+
+    def autocast(self):
+        """Autocast context of the precision policy."""
+        return torch.amp.autocast(
+            self.device.type, dtype=self.amp_dtype or torch.bfloat16, enabled=self.amp_dtype is not None
+        )
+
     
     def setup_logging(self):
         """Setup logging configuration."""
@@ -125,15 +264,21 @@ class AbstractTrainer(ABC):
             file_path=str(log_file),
             start_time=self.start_time.timestamp(),
             name="baseline",
-            level="INFO"
+            # replicas only report problems
+            level="INFO" if self.is_master else "WARNING"
         )
 
         logger.info(f"Starting {self.cfg.model_type} training with "
                    f"{self.num_ds} dataset(s): {list(self.ds_conf.keys())}")
 
+    @property
+    def use_cloud(self) -> bool:
+        """Cloud logging is done by the master rank only."""
+        return self.cfg.logging.use_cloud and self.is_master
+
     def init_cloud_logging(self):
         """Initialize cloud logging (wandb, comet, etc.)."""
-        if not self.cfg.logging.use_cloud:
+        if not self.use_cloud:
             return
 
         # Initialize logging based on backend configuration
@@ -296,6 +441,9 @@ class AbstractTrainer(ABC):
                     for k, v in section.items():
                         result_entry[f'exp_{k}'] = v
 
+        for k, v in self.sweep_point.items():
+            result_entry[f'sweep_{k}'] = v
+
         # Add metrics
         for key, value in metrics.items():
             clean_key = key.replace(f'{ds_name}/{prefix}/', '')
@@ -303,16 +451,27 @@ class AbstractTrainer(ABC):
 
         self.results_history.append(result_entry)
     
+    def get_results_dir(self) -> Path:
+        """Directory of the result CSVs, the Hydra output directory when running under Hydra."""
+        from hydra.core.hydra_config import HydraConfig
+
+        if self.results_dir is not None:
+            return self.results_dir
+        if HydraConfig.initialized():
+            return Path(HydraConfig.get().runtime.output_dir)
+        return Path(self.cfg.logging.output_dir)
+
     def save_results_to_csv(self, ds_name: Optional[str] = None):
         """Save accumulated results to CSV file with descriptive filename."""
-        from hydra.core.hydra_config import HydraConfig
-        
+        if not self.is_master:
+            return
         if not self.results_history:
             logger.warning("No results to save to CSV")
             return
         
         # Write results to the same directory as Hydra output
-        results_dir = Path(HydraConfig.get().runtime.output_dir)
+        results_dir = self.get_results_dir()
+        results_dir.mkdir(parents=True, exist_ok=True)
         logging.info(f"Saving training results to directory: {results_dir}")
 
         # Build descriptive filename
@@ -327,6 +486,8 @@ class AbstractTrainer(ABC):
         
         
         filename_parts.append(f"seed_{self.cfg.seed}")
+        if self.results_tag:
+            filename_parts.append(self.results_tag)
         filename_parts.append(self.start_time.strftime("%Y%m%d_%H%M%S"))
         
         filename = "_".join(filename_parts) + ".csv"
@@ -338,7 +499,8 @@ class AbstractTrainer(ABC):
         
         logger.info(f"Results saved to CSV: {csv_path}")
         logger.info(f"Total records: {len(df)}")
-        
+
+        self.saved_results.append(csv_path)
         return csv_path
 
     def _create_ft_cloud_log_data(self, log_data: dict, prefix: str, ds_metric: dict):
@@ -347,7 +509,7 @@ class AbstractTrainer(ABC):
 
         # Add raw confusion matrix data for cloud logging backends
         for ds_name in ds_metric.keys():
-            matrix = ds_metric[ds_name]['cm'].cpu().numpy()
+            matrix = ds_metric[ds_name].cm.cpu().numpy()
             labels = self.ds_info[ds_name]['category']
 
             # Store raw matrix and labels for both wandb and comet to handle
@@ -433,61 +595,24 @@ class AbstractTrainer(ABC):
 
     def _calculate_metrics_for_dataset(
             self,
-            labels: torch.Tensor,
-            logits: torch.Tensor,
+            stream: StreamingClassificationMetrics,
             ds_name: str,
             prefix: str,
-            loss: float,
     ) -> Dict[str, float]:
-        label_np = labels.numpy()
-        pred_np = torch.argmax(logits, dim=-1).numpy()
-
-        n_class = self.ds_info[ds_name]['n_class']
-        
         # Debug: log prediction distribution
-        import numpy as np
-        unique_preds, pred_counts = np.unique(pred_np, return_counts=True)
-        unique_labels, label_counts = np.unique(label_np, return_counts=True)
-        logger.info(f"DEBUG {prefix} - Predictions: {dict(zip(unique_preds, pred_counts))}, Labels: {dict(zip(unique_labels, label_counts))}")
+        pred_counts = stream.cm.sum(dim=0).tolist()
+        label_counts = stream.cm.sum(dim=1).tolist()
+        logger.info(
+            f"DEBUG {prefix} - Predictions: { {c: n for c, n in enumerate(pred_counts) if n} }, "
+            f"Labels: { {c: n for c, n in enumerate(label_counts) if n} }"
+        )
 
         metrics = {
             f'{ds_name}/{prefix}/epoch': self.epoch,
-            f'{ds_name}/{prefix}/loss': loss,
+            f'{ds_name}/{prefix}/step': self.current_step,
         }
-
-        # Basic accuracy
-        # noinspection PyUnresolvedReferences
-        accuracy = (pred_np == label_np).mean()
-        metrics[f'{ds_name}/{prefix}/acc'] = float(accuracy)
-
-        # Balanced accuracy
-        balanced_acc = balanced_accuracy_score(label_np, pred_np)
-        metrics[f'{ds_name}/{prefix}/balanced_acc'] = float(balanced_acc)
-
-        if n_class == 2:
-            # Binary classification metrics
-            probs = torch.softmax(logits, dim=1)[:, 1].numpy()
-
-            try:
-                auroc = roc_auc_score(label_np, probs)
-                metrics[f'{ds_name}/{prefix}/auroc'] = float(auroc)
-            except ValueError as e:
-                logger.warning(f'Error calculating AUROC for {ds_name} {prefix}: {e}')
-                metrics[f'{ds_name}/{prefix}/auroc'] = 0.0
-
-            try:
-                auc_pr = average_precision_score(label_np, probs)
-                metrics[f'{ds_name}/{prefix}/auc_pr'] = float(auc_pr)
-            except ValueError as e:
-                logger.warning(f'Error calculating AUC-PR for {ds_name} {prefix}: {e}')
-                metrics[f'{ds_name}/{prefix}/auc_pr'] = 0.0
-        else:
-            # Multi-class classification metrics
-            cohen_kappa = cohen_kappa_score(label_np, pred_np)
-            metrics[f'{ds_name}/{prefix}/cohen_kappa'] = float(cohen_kappa)
-
-            f1_weighted = f1_score(label_np, pred_np, average='weighted')
-            metrics[f'{ds_name}/{prefix}/f1'] = float(f1_weighted)
+        for key, value in stream.compute().items():
+            metrics[f'{ds_name}/{prefix}/{key}'] = value
 
         return metrics
 
@@ -514,38 +639,52 @@ class AbstractTrainer(ABC):
                 }}
             logger.info(f"Dataset {ds_name} - {ds_conf} only")
 
-    @staticmethod
-    def _calc_confusion_matrix(pred: Tensor, target: Tensor, n_class: int) -> Tensor:
-        pred, target = pred.long(), target.long()
-
-        linear_indices = target * n_class + pred
-        conf_matrix_flat = torch.bincount(linear_indices, minlength=n_class * n_class)
-        conf_matrix = conf_matrix_flat.reshape(n_class, n_class)
-
-        return conf_matrix
+    def mean_across_ranks(self, value: Tensor) -> Tensor:
+        """Average of a tensor over the data-parallel ranks, gloo has no AVG reduction."""
+        if self.world_size == 1:
+            return value
+        value = value.clone()
+        torch.distributed.all_reduce(value, op=torch.distributed.ReduceOp.SUM)
+        return value / self.world_size
 
     def _clip_grad_norm_(self):
         self.scaler.unscale_(self.optimizer)
         grad_norm = torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.cfg.training.max_grad_norm)
-        return grad_norm.detach().cpu().item()
+        return grad_norm.detach()
+
+    def flush_step_logs(self):
+        """Send the buffered training step logs to the console and cloud loggers."""
+        for log_data in self.step_logs.flush(self.current_step):
+            # Log to cloud services
+            if self.use_cloud:
+                self._log_to_cloud(log_data)
+
+            logger.info(format_console_log_dict(log_data, prefix='train'))
+
+    def _configure_dataloader_factory(self):
+        """Propagate experiment info and data loading options to the factory."""
+        self.dataloader_factory.exp_name = self.exp_name
+        self.dataloader_factory.exp_config = self.preproc_exp_config
+        self.dataloader_factory.in_memory = self.cfg.data.in_memory
+        self.dataloader_factory.in_memory_max_gb = self.cfg.data.in_memory_max_gb
+        self.dataloader_factory.mp_context = self.cfg.data.mp_context
+        self.dataloader_factory.lazy_batches = self.cfg.data.lazy_batches
+        self.dataloader_factory.batch_schedule = self.cfg.data.batch_schedule
+        self.dataloader_factory.schedule_temperature = self.cfg.data.schedule_temperature
+        self.dataloader_factory.schedule_quotas = self.cfg.data.schedule_quotas
 
     def create_dataloader(self, split: datasets.NamedSplit = datasets.Split.TRAIN):
         logger.info("Creating main training dataloader...")
         mixed = (split == datasets.Split.TRAIN and self.cfg.multitask)
 
-        # Set experiment info on factory for dataset loading
-        self.dataloader_factory.exp_name = self.exp_name
-        self.dataloader_factory.exp_config = self.preproc_exp_config
+        self._configure_dataloader_factory()
 
         dataloaders, samplers = self.dataloader_factory.create_dataloader(
             datasets_config=self.ds_conf,
             mixed=mixed,
-            num_replicas=1,
-            rank=0,
+            num_replicas=self.world_size,
+            rank=self.rank,
             split=split,
-            random_dropout=self.cfg.data.random_dropout,
-            dropout_rate=self.cfg.data.dropout_rate,
-            dropout_seed=self.cfg.data.dropout_seed,
         )
 
         return dataloaders, samplers
@@ -553,15 +692,13 @@ class AbstractTrainer(ABC):
     def create_single_dataloader(self, ds_name: str, ds_config: str, split: datasets.NamedSplit = datasets.Split.TRAIN):
         logger.info("Creating single main training dataloader...")
 
-        # Set experiment info on factory for dataset loading
-        self.dataloader_factory.exp_name = self.exp_name
-        self.dataloader_factory.exp_config = self.preproc_exp_config
+        self._configure_dataloader_factory()
 
         dataloader, sampler = self.dataloader_factory.create_dataloader(
             datasets_config={ds_name: ds_config},
             mixed=False,
-            num_replicas=1,
-            rank=0,
+            num_replicas=self.world_size,
+            rank=self.rank,
             split=split,
         )
 
@@ -575,12 +712,102 @@ class AbstractTrainer(ABC):
         """Setup model architecture."""
         pass
 
+    def encoder_blocks(self, model: nn.Module) -> Optional[nn.ModuleList]:
+        """Transformer blocks of the encoder for activation checkpointing, None if the model has none."""
+        return None
+
+    def setup_peft(self, model: nn.Module):
+        """Inject LoRA or bottleneck adapters into the encoder blocks, trained with the heads on the frozen encoder."""
+        cfg = self.cfg.training
+        if cfg.peft not in PEFT_METHODS:
+            raise ValueError(f"Unknown peft method {cfg.peft}, expected one of {PEFT_METHODS}")
+        if not cfg.freeze_encoder:
+            logger.warning("peft trains adapters instead of the encoder, the pretrained weights are frozen")
+            cfg.freeze_encoder = True
+        blocks = self.encoder_blocks(model)
+        if blocks is None:
+            raise ValueError(f"{self.model_type} does not support peft")
+
+        if cfg.peft == 'lora':
+            n_adapted = inject_lora(blocks, cfg.lora_rank, cfg.lora_alpha, cfg.lora_targets)
+        else:
+            n_adapted = inject_adapters(blocks, cfg.adapter_dim)
+        if n_adapted == 0:
+            raise ValueError(f"lora_targets {cfg.lora_targets} match no layer of the {self.model_type} encoder blocks")
+        model.to(self.device)
+
+        n_params = sum(param.numel() for name, param in model.named_parameters() if is_peft_parameter(name))
+        logger.info(f"Injected {cfg.peft} into {n_adapted} modules of {len(blocks)} blocks, {n_params} parameters")
+
+    def setup_activation_checkpointing(self, model: nn.Module):
+        every = self.cfg.training.activation_checkpointing
+        blocks = self.encoder_blocks(model)
+        if blocks is None:
+            logger.warning(f"Activation checkpointing is not supported by {self.model_type}")
+            return
+        if self.cfg.training.freeze_encoder:
+            logger.warning("Activation checkpointing with a frozen encoder only saves memory for trainable inputs")
+
+        n_checkpointed = checkpoint_blocks(blocks, every)
+        logger.info(f"Activation checkpointing of {n_checkpointed}/{len(blocks)} encoder blocks")
+
+    def compile_targets(self, model: nn.Module) -> List[nn.Module]:
+        """Submodules compiled by training.use_compile.
+
+        The unified models pick the head and the channel router from the montage string of the batch, this
+        Python routing stays eager. The shared encoder modules are compiled once and every head separately,
+        a head only ever sees the shapes of its own montages.
+        """
+        targets = [module for name, module in model.named_children() if name not in ('classifier', 'conv_router')]
+        classifier = getattr(model, 'classifier', None)
+        if isinstance(classifier, MultiHeadClassifier):
+            targets.extend(classifier.heads.values())
+        return targets
+
+    def compile_model(self, model: nn.Module):
+        """Compile the targets in place, parameter names and checkpoints are the same as in eager mode."""
+        cfg = self.cfg.training
+        if cfg.compile_cache_dir:
+            # inductor and autograd artifacts are reused by later runs with the same graphs
+            os.environ['TORCHINDUCTOR_CACHE_DIR'] = str(Path(cfg.compile_cache_dir).absolute())
+            torch._inductor.config.fx_graph_cache = True
+
+        targets = self.compile_targets(model)
+        # the heads share one forward, every head needs graphs for training and eval and a static and
+        # dynamic batch size, past the limit dynamo would fall back to eager
+        torch._dynamo.config.recompile_limit = max(torch._dynamo.config.recompile_limit, 4 * len(targets))
+
+        for module in targets:
+            module.compile(mode=cfg.compile_mode, dynamic=cfg.compile_dynamic)
+        logger.info(f"Compiled {len(targets)} submodules with mode {cfg.compile_mode or 'default'}")
+
+    def build_model(self):
+        """Set up the model with its adapters, checkpoint and compile it and wrap it for data-parallel training."""
+        model = self.setup_model()
+        if self.cfg.training.peft:
+            self.setup_peft(model)
+        # DDP registers the parameters requiring gradients when it wraps the model, freeze the encoder first
+        self.optim_params = self.setup_optim_params(model)
+        if self.cfg.training.activation_checkpointing > 0:
+            self.setup_activation_checkpointing(model)
+        if self.cfg.training.use_compile:
+            self.compile_model(model)
+        self.ddp_model = None
+        if self.world_size > 1:
+            # every batch feeds a single classification head, the other heads get no gradient
+            self.ddp_model = DistributedDataParallel(
+                model,
+                device_ids=[self.device.index] if self.device.type == 'cuda' else None,
+                find_unused_parameters=True,
+            )
+        return model
+
     def setup_optim_params(self, model):
         head_params = []
         encoder_params = []
 
         for name, param in model.named_parameters():
-            if 'classifier' in name or 'conv_router' in name:
+            if 'classifier' in name or 'conv_router' in name or is_peft_parameter(name):
                 head_params.append(param)
             else:
                 encoder_params.append(param)
@@ -600,7 +827,7 @@ class AbstractTrainer(ABC):
         return params
 
     def setup_optimizer_and_scheduler(self, model, train_loader: DataLoader):
-        params = self.setup_optim_params(model)
+        params = self.optim_params if self.optim_params is not None else self.setup_optim_params(model)
 
         optimizer = torch.optim.AdamW(
             params,
@@ -608,11 +835,16 @@ class AbstractTrainer(ABC):
         )
 
         # Gradient scaler for mixed precision
-        scaler = torch.amp.GradScaler(enabled=self.cfg.training.use_amp)
-
-        # Learning rate scheduler
-        warmup_steps = len(train_loader) * self.cfg.training.warmup_epochs
-        total_steps = len(train_loader) * self.cfg.training.max_epochs
+        scaler = torch.amp.GradScaler(enabled=self.cfg.training.use_amp and self.device.type == 'cuda')
+
+        # Learning rate scheduler, stepped once per optimizer step of grad_accum_steps loader batches
+        steps_per_epoch = math.ceil(len(train_loader) / self.cfg.training.grad_accum_steps)
+        warmup_steps = steps_per_epoch * self.cfg.training.warmup_epochs
+        total_steps = steps_per_epoch * self.cfg.training.max_epochs
+        logger.info(
+            f"Effective batch size {train_loader.batch_sampler.batch_size} x {self.cfg.training.grad_accum_steps} "
+            f"accumulation steps x {self.world_size} ranks"
+        )
         print("Total steps:", total_steps)
         if total_steps == 5:
             logger.warning("Total training steps is only 5, which will crash OneCycleLR due to being low. Decrease data dropout rate.")
@@ -648,59 +880,213 @@ class AbstractTrainer(ABC):
         self.scaler = scaler
         self.scheduler = scheduler
 
+    def _forward(self, batch) -> Tensor:
+        """Model logits, batches of cached embeddings only run the head MLP."""
+        if 'features' in batch:
+            head_name = batch['montage'][0].split('/')[0]
+            return self.model.classifier.heads[head_name].mlp(batch['features'])
+        # evaluation stays local, ranks evaluate different numbers of batches
+        if self.ddp_model is not None and torch.is_grad_enabled():
+            return self.ddp_model(batch)
+        return self.model(batch)
+
+    def _classifier_input(self, batch) -> tuple[Tensor, str]:
+        """Run the model on a batch and return the input of its classifier and the head name."""
+        captured = {}
+
+        def capture_input(module, args):
+            captured['args'] = args
+
+        handle = self.model.classifier.register_forward_pre_hook(capture_input)
+        try:
+            self.model(batch)
+        finally:
+            handle.remove()
+
+        x, head_name = captured['args']
+        return x, head_name
+
+    def use_embedding_cache(self) -> bool:
+        """Whether the current model can be trained from cached encoder features."""
+        if self.embedding_cache is None:
+            return False
+
+        reason = None
+        if not self.cfg.training.freeze_encoder:
+            reason = "the encoder is trained"
+        elif self.cfg.training.peft:
+            reason = "the adapters in the encoder are trained"
+        elif not isinstance(getattr(self.model, 'classifier', None), MultiHeadClassifier):
+            reason = "the model has no multi-head classifier"
+        elif any('conv_router' in name for name, _ in self.model.named_parameters()):
+            reason = "the channel router in front of the encoder is trained"
+        elif self.cfg.model.grad_cam or self.cfg.model.t_sne:
+            reason = "grad-cam and t-SNE need the encoder activations"
+        elif self.world_size > 1:
+            reason = "distributed training shards the splits across ranks"
+
+        if reason is not None:
+            logger.warning(f"Embedding cache disabled: {reason}")
+            return False
+        return True
+
+    def cached_loader(self, loader: DataLoader, split: datasets.NamedSplit) -> DataLoader:
+        """Loader yielding the same batches as ``loader`` with pooled encoder features instead of signals."""
+        sampler = loader.batch_sampler
+        dataset = sampler.dataset
+        pretrained_path = self.cfg.model.pretrained_path
+        key = embedding_cache_key(
+            # randomly initialized encoders depend on the seed
+            encoder=file_digest(pretrained_path) if pretrained_path else f'seed_{self.cfg.seed}',
+            model_type=self.model_type,
+            model=self.cfg.model.model_dump(),
+            # features computed under autocast differ from fp32 ones
+            amp_dtype=str(self.amp_dtype),
+            datasets={name: self.ds_conf.get(name) for name in sampler.dataset_names},
+            split=str(split),
+            experiment=self.cfg.experiment.model_dump(),
+            fingerprint=getattr(dataset, '_fingerprint', None),
+            n_sample=len(dataset),
+        )
+
+        cached = self.embedding_cache.load(key)
+        if cached is None:
+            cached = self._compute_embeddings(loader, key)
+
+        return DataLoader(cached, batch_sampler=sampler, num_workers=0, pin_memory=torch.cuda.is_available())
+
+    @torch.no_grad()
+    def _compute_embeddings(self, loader: DataLoader, key: str):
+        """Run the frozen encoder once over a split and write the pooled head inputs to the cache."""
+        logger.info(f"Computing embeddings for cache entry {key}...")
+        self.model.eval()
+
+        writer = None
+        for batch in loader:
+            batch = {k: v.to(self.device) if isinstance(v, torch.Tensor) else v for k, v in batch.items()}
+            with self.autocast():
+                x, head_name = self._classifier_input(batch)
+                pooled = self.model.classifier.heads[head_name](x, capture_features=True)
+
+            if writer is None:
+                writer = self.embedding_cache.writer(key, len(loader.batch_sampler.dataset), pooled.shape[1:])
+            writer.write(
+                batch['index'].cpu().numpy(),
+                pooled.float().cpu().numpy(),
+                batch['label'].cpu().numpy(),
+                batch['montage'],
+            )
+
+        return writer.close()
+
     def train_step(self, batch, labels):
-        with torch.amp.autocast('cuda', enabled=self.cfg.training.use_amp, dtype=torch.bfloat16):
-            logits = self.model(batch)
+        with self.autocast():
+            logits = self._forward(batch)
 
         loss = self.loss_fn(logits, labels)
         return logits, loss
 
+    def _backward_batch(self, batch: dict, window_size: int, sync: bool) -> tuple[Tensor, Tensor]:
+        """Forward and backward pass of a loader batch in micro-batches, returns its logits and mean loss.
+
+        Each micro-batch loss is scaled by its share of the optimizer step, the accumulated gradient is the
+        gradient of the mean loss over the window. Gradients are only all-reduced by the last backward pass
+        of the window.
+        """
+        n_sample = batch['label'].shape[0]
+        size = self.micro_batch_size or n_sample
+
+        logits, loss = [], 0.0
+        for start in range(0, n_sample, size):
+            micro_batch = {k: v[start:start + size] for k, v in batch.items()}
+            labels = micro_batch['label']
+            share = labels.shape[0] / n_sample
+
+            skip_sync = self.ddp_model is not None and not (sync and start + size >= n_sample)
+            with self.ddp_model.no_sync() if skip_sync else nullcontext():
+                micro_logits, micro_loss = self.train_step(micro_batch, labels)
+                self.scaler.scale(micro_loss * share / window_size).backward()
+
+            logits.append(micro_logits.detach())
+            loss = loss + micro_loss.detach() * share
+        return torch.cat(logits), loss
+
+    def backward_window(self, window: list[dict], outputs: list[tuple[Tensor, Tensor]], window_size: int):
+        """Accumulate the gradients of the newest batch of an optimizer step of ``window_size`` batches.
+
+        Out of memory, the micro-batch size is halved and all batches of the step so far are replayed, the
+        failed pass may already have added to some gradients. Under DDP a retry on one rank would desynchronize
+        the collectives, micro_batch_size has to be set instead.
+        """
+        pending = window[len(outputs):]
+        while True:
+            try:
+                for batch in pending:
+                    outputs.append(self._backward_batch(batch, window_size, sync=len(outputs) == window_size - 1))
+                return
+            except torch.OutOfMemoryError:
+                size = self.micro_batch_size or window[-1]['label'].shape[0]
+                if not self.cfg.training.oom_micro_batch or self.world_size > 1 or size <= 1:
+                    raise
+
+            # outside the except block the traceback no longer holds the activations of the failed pass
+            self.optimizer.zero_grad(set_to_none=True)
+            outputs.clear()
+            pending = window
+            if self.device.type == 'cuda':
+                torch.cuda.empty_cache()
+            self.micro_batch_size = math.ceil(size / 2)
+            logger.warning(f"Out of memory with {size} samples per pass, retrying with {self.micro_batch_size}")
+
+    def optimizer_step(self, window: list[dict], outputs: list[tuple[Tensor, Tensor]]) -> tuple[Tensor, Tensor, Tensor]:
+        """Clip and apply the accumulated gradients, returns the mean loss, accuracy and gradient norm."""
+        grad_norm = self._clip_grad_norm_()
+        self.scaler.step(self.optimizer)
+        self.scaler.update()
+        self.optimizer.zero_grad()
+
+        # every batch has the same weight in the step, batches of different heads have different logits
+        loss = torch.stack([batch_loss for _, batch_loss in outputs]).mean()
+        correct = sum((torch.argmax(logits, dim=-1) == batch['label']).sum() for batch, (logits, _) in zip(window, outputs))
+        acc = correct.float() / sum(batch['label'].shape[0] for batch in window)
+        return loss, acc, grad_norm
+
     def train_epoch(self, train_loader: DataLoader, train_sampler):
         self.model.train()
         if hasattr(train_sampler, 'set_epoch'):
             train_sampler.set_epoch(self.epoch)
 
-        batch: dict
-        for step_in_epoch, batch in enumerate(train_loader):
-            self.optimizer.zero_grad()
+        accum_steps = self.cfg.training.grad_accum_steps
+        n_batches = len(train_loader)
+        window, outputs = [], []
+        self.optimizer.zero_grad()
 
+        batch: dict
+        for batch_idx, batch in enumerate(train_loader):
             batch = {k: v.to(self.device) if isinstance(v, torch.Tensor) else v for k, v in batch.items()}
-            labels = batch['label']
             ds_name = batch['montage'][0].split('/')[0]
+            window.append(batch)
 
-            # Forward pass with mixed precision
-            logits, loss = self.train_step(batch, labels)
-
-            # Check for NaN loss
-            if torch.isnan(loss):
-                logger.warning(f"NaN loss detected at step {self.current_step}")
+            # Forward and backward pass with mixed precision, the last step of the epoch takes the remaining batches
+            window_size = min(accum_steps, n_batches - (batch_idx + 1 - len(window)))
+            self.backward_window(window, outputs, window_size)
+            if len(window) < window_size:
+                continue
 
-            # Backward pass
-            self.scaler.scale(loss).backward()
-            # for name, param in self.model.named_parameters():
-            #     if param.grad is not None:
-            #         logger.info(
-            #             f"{name} "
-            #             f"Range: [{param.grad.min():.8f}, {param.grad.max():.8f}], "
-            #             f"Scale: {param.grad.abs().mean():.8f}")
+            loss, step_acc, grad_norm = self.optimizer_step(window, outputs)
+            window, outputs = [], []
 
-            grad_norm = self._clip_grad_norm_()
-
-            # Optimizer step
-            self.scaler.step(self.optimizer)
-            self.scaler.update()
+            # Check for NaN loss, reported when the step logs are flushed
+            self.step_logs.track_loss(loss, self.current_step)
 
             # Logging
             if self.current_step % self.cfg.logging.log_step_interval == 0:
-                # Calculate step accuracy
-                preds = torch.argmax(logits, dim=-1)
-                step_acc = (preds == labels).float().mean()
-
+                # Device values stay tensors until the buffer is flushed
                 log_data = {
                     'train/epoch': self.epoch,
                     'train/step': self.current_step,
-                    'train/loss_ce': loss.cpu().item(),
-                    'train/acc': step_acc.cpu().item(),
+                    'train/loss_ce': self.mean_across_ranks(loss.detach()),
+                    'train/acc': self.mean_across_ranks(step_acc),
                     'train/grad_norm': grad_norm,
                     'train/header_lr': self.scheduler.get_last_lr()[0],
                 }
@@ -711,19 +1097,32 @@ class AbstractTrainer(ABC):
                 if not self.multitask:
                     log_data = {f"{ds_name}/{key}": value for key, value in log_data.items()}
 
-                # Log to cloud services
-                if self.cfg.logging.use_cloud:
-                    self._log_to_cloud(log_data)
-
-                logger.info(format_console_log_dict(log_data, prefix='train'))
+                self.step_logs.append(log_data)
 
             self.current_step += 1
             self.scheduler.step()
+
+            if len(self.step_logs) >= self.cfg.logging.log_flush_interval:
+                self.flush_step_logs()
+
+            if self.step_eval_due():
+                self.flush_step_logs()
+                self.evaluate()
+                if self.early_stopping.should_stop:
+                    break
+
+        self.flush_step_logs()
+
+        if self.multitask and hasattr(train_sampler, 'dataset_step_counts'):
+            step_counts = {f'train/steps/{name}': cnt for name, cnt in train_sampler.dataset_step_counts.items()}
+            if self.use_cloud:
+                self._log_to_cloud(step_counts)
+            logger.info(format_console_log_dict(step_counts, prefix='train'))
     
 
     def eval_step(self, batch, labels):
-        with torch.amp.autocast('cuda', enabled=self.cfg.training.use_amp, dtype=torch.bfloat16):
-            logits = self.model(batch)
+        with self.autocast():
+            logits = self._forward(batch)
 
         loss = self.loss_fn(logits, labels)
         return logits, loss
@@ -734,16 +1133,10 @@ class AbstractTrainer(ABC):
 
         self.model.eval()
 
-        overall_metrics = {}
-        for ds_name in self.ds_info.keys():
-            n_class = self.ds_info[ds_name]['n_class']
-            overall_metrics[ds_name] = {
-                'loss_sum': torch.zeros([1], dtype=torch.float64, device=self.device),
-                'cm': torch.zeros((n_class, n_class), dtype=torch.int64, device=self.device),
-                'cnt': torch.zeros(1, dtype=torch.int64, device=self.device),
-                'logits': [],
-                'labels': [],
-            }
+        overall_metrics = {
+            ds_name: StreamingClassificationMetrics(info['n_class'], device=self.device)
+            for ds_name, info in self.ds_info.items()
+        }
 
         with torch.no_grad():
             for dataloader in dataloaders:
@@ -751,36 +1144,22 @@ class AbstractTrainer(ABC):
                     batch = {k: v.to(self.device) if isinstance(v, torch.Tensor) else v for k, v in batch.items()}
                     labels = batch['label']
                     ds_name = batch['montage'][0].split('/')[0]
-                    n_class = self.ds_info[ds_name]['n_class']
 
                     # Forward pass with mixed precision
                     logits, loss = self.train_step(batch, labels)
+                    overall_metrics[ds_name].update(logits, labels, loss)
 
-                    logits = logits.float()
-                    pred = torch.argmax(logits, dim=1).detach()
-                    cm = self._calc_confusion_matrix(pred, labels.detach(), n_class)
-
-                    overall_metrics[ds_name]['loss_sum'] += loss.detach() * len(batch)
-                    overall_metrics[ds_name]['cnt'] += len(batch)
-                    overall_metrics[ds_name]['cm'] += cm.detach()
-                    overall_metrics[ds_name]['logits'].append(logits.detach().cpu())
-                    overall_metrics[ds_name]['labels'].append(labels.detach().cpu())
+            if self.world_size > 1:
+                for stream in overall_metrics.values():
+                    stream.all_reduce()
 
             log_dict = {}
             for ds_name in self.ds_info.keys():
-                overall_metrics[ds_name]['loss'] = overall_metrics[ds_name]['loss_sum'] / overall_metrics[ds_name][
-                    'cnt'].float()
-
-                # Calculate metrics on aggregated data
-                labels_all = torch.concat(overall_metrics[ds_name]['labels'], dim=0)
-                logits_all = torch.concat(overall_metrics[ds_name]['logits'], dim=0)
-                loss_metric = overall_metrics[ds_name]['loss'].detach().cpu().item()
+                # Calculate metrics on accumulated statistics
                 metrics = self._calculate_metrics_for_dataset(
-                    labels=labels_all,
-                    logits=logits_all,
+                    stream=overall_metrics[ds_name],
                     ds_name=ds_name,
                     prefix=prefix,
-                    loss=loss_metric
                 )
 
                 log_dict = log_dict | metrics
@@ -791,55 +1170,206 @@ class AbstractTrainer(ABC):
                 if prefix in ['eval', 'test']:
                     self._store_results_for_csv(metrics, ds_name, prefix)
 
-            if self.cfg.logging.use_cloud:
+            if self.use_cloud:
                 log_cloud = self._create_ft_cloud_log_data(log_dict, prefix, overall_metrics)
                 self._log_to_cloud(log_cloud)
 
+    def load_pretrained_file(self, path: str):
+        """Read a pretrained checkpoint file, shared between the runs of an in-process sweep."""
+        return load_pretrained_state(path, map_location=self.device)
+
     @abstractmethod
     def load_checkpoint(self, checkpoint_path: str):
         """Load model checkpoint."""
         pass
     
-    def save_checkpoint(self, ds_name: Optional[str] = None, is_milestone: bool = False, **kwargs):
+    def checkpoint_path(self, ds_name: Optional[str] = None, suffix: str = 'last') -> Path:
         if ds_name is None:
             ds_name = 'unified'
             checkpoint_dir = Path(self.cfg.logging.ckpt_dir, ds_name)
         else:
             checkpoint_dir = Path(self.cfg.logging.ckpt_dir, 'seperated', ds_name)
+        return checkpoint_dir / f'{self.model_type}_{ds_name}_{suffix}.pt'
 
+    def save_checkpoint(self, ds_name: Optional[str] = None, is_milestone: bool = False, is_best: bool = False, **kwargs):
+        if not self.is_master:
+            return
 
-        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        last_path = self.checkpoint_path(ds_name, 'last')
+        last_path.parent.mkdir(parents=True, exist_ok=True)
 
         checkpoint = {
             'epoch': self.epoch,
             'step': self.current_step,
-            'model_state_dict': self.model.state_dict(),
+            'model_state_dict': self._checkpoint_model_state(),
             'optimizer_state_dict': self.optimizer.state_dict(),
+            'scheduler_state_dict': self.scheduler.state_dict(),
             'scaler_state_dict': self.scaler.state_dict(),
+            'rng_state': get_rng_state(),
+            'results_history': self.results_history,
             'config': self.cfg.model_dump(),
-            'dataset_name': ds_name,
+            'data_experiment': self._data_experiment(),
+            'dataset_name': ds_name or 'unified',
         }
+        if self.early_stopping is not None:
+            checkpoint['early_stopping'] = self.early_stopping.state_dict()
+        if self.trainable_only_checkpoints:
+            checkpoint['trainable_only'] = True
+            checkpoint['pretrained'] = self._pretrained_references()
+
+        # Epoch checkpoints are subject to the retention policy and refresh the resumable 'last' one
+        if is_milestone:
+            checkpoint_path = last_path
+            self.checkpoint_writer.save(checkpoint, checkpoint_path, retain=False)
+            self.checkpoint_writer.wait()
+        elif is_best:
+            checkpoint_path = self.checkpoint_path(ds_name, 'best')
+            self.checkpoint_writer.save(checkpoint, checkpoint_path, retain=False)
+        else:
+            checkpoint_path = self.checkpoint_path(ds_name, f'epoch_{self.epoch}')
+            self.checkpoint_writer.save(checkpoint, checkpoint_path, score=self._latest_eval_score(self.cfg.logging.ckpt_metric), latest=last_path)
+
+        logger.info(f"Checkpoint saved: {ds_name or 'unified'}: {checkpoint_path}")
+
+    def load_resume_checkpoint(self, ds_name: Optional[str] = None) -> Optional[dict]:
+        """The ``last`` checkpoint if resuming is enabled and it matches the current configuration."""
+        path = self.checkpoint_path(ds_name, 'last')
+        if not self.cfg.training.resume or not path.exists():
+            return None
+
+        checkpoint = torch.load(path, map_location='cpu', weights_only=False)
+        mismatch = self._resume_mismatch(checkpoint, ds_name)
+        if mismatch:
+            logger.warning(f"Not resuming from {path}: {mismatch} differs from the current configuration")
+            return None
+        return checkpoint
+
+    def resume_from_checkpoint(self, train_sampler=None, ds_name: Optional[str] = None) -> int:
+        """Restore the training state from a matching ``last`` checkpoint, return the first epoch to run.
+
+        Called after the model, optimizer and scheduler are set up. Returns 0 when there is nothing to resume.
+        """
+        checkpoint = self.load_resume_checkpoint(ds_name)
+        if checkpoint is None:
+            return 0
+
+        # trainable-only checkpoints complete the pretrained weights loaded by setup_model
+        self.model.load_state_dict(checkpoint['model_state_dict'], strict=not checkpoint.get('trainable_only', False))
+        self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        self.scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+        self.scaler.load_state_dict(checkpoint['scaler_state_dict'])
+        set_rng_state(checkpoint['rng_state'])
+        self.results_history = checkpoint['results_history']
+        if 'early_stopping' in checkpoint:
+            self.early_stopping.load_state_dict(checkpoint['early_stopping'])
+
+        self.epoch = checkpoint['epoch']
+        self.current_step = checkpoint['step']
+        start_epoch = self.epoch + 1
+        if hasattr(train_sampler, 'set_epoch'):
+            train_sampler.set_epoch(start_epoch)
 
-        # Save checkpoint
-        suffix = 'last' if is_milestone else f'epoch_{self.epoch}'
-        checkpoint_path = checkpoint_dir / f'{self.model_type}_{ds_name}_{suffix}.pt'
-        torch.save(checkpoint, checkpoint_path)
-
-        logger.info(f"Checkpoint saved: {ds_name}: {checkpoint_path}")
+        path = self.checkpoint_path(ds_name, 'last')
+        if self._checkpoint_complete(checkpoint):
+            logger.info(f"{path} already finished training after epoch {self.epoch}, its results are restored")
+        else:
+            logger.info(f"Resumed from {path} after epoch {self.epoch}, step {self.current_step}")
+        return start_epoch
+
+    def _resume_mismatch(self, checkpoint: dict, ds_name: Optional[str] = None) -> Optional[str]:
+        """Name of the first setting that makes a checkpoint unusable for resuming, None if it matches."""
+        if 'scheduler_state_dict' not in checkpoint:
+            return 'checkpoint format'
+        if checkpoint.get('trainable_only') and checkpoint['pretrained'] != self._pretrained_references():
+            return 'pretrained checkpoint'
+
+        # a separate model only depends on its own dataset, parallel jobs see a subset of the datasets
+        saved_datasets = checkpoint['config']['data']['datasets']
+        if ds_name is None and saved_datasets != self.ds_conf:
+            return 'data.datasets'
+        if ds_name is not None and saved_datasets.get(ds_name) != self.ds_conf[ds_name]:
+            return f'data.datasets.{ds_name}'
+
+        if checkpoint['config']['seed'] != self.cfg.seed:
+            return 'seed'
+        # the experiment selects the preprocessed variant of the datasets, e.g. its random dropout rate
+        if checkpoint.get('data_experiment') != self._data_experiment():
+            return 'experiment'
+        current = self.cfg.model_dump()
+        for section in ('model', 'data', 'training', 'experiment'):
+            for key, value in current[section].items():
+                if key not in RESUME_IGNORED_KEYS and checkpoint['config'][section].get(key) != value:
+                    return f'{section}.{key}'
+        return None
+
+    def _data_experiment(self) -> dict:
+        """Experiment name and preprocessing parameters the data loaders are built with."""
+        return {'exp_name': self.exp_name or None, 'preproc_exp_config': dict(self.preproc_exp_config or {})}
+
+    def _checkpoint_complete(self, checkpoint: dict) -> bool:
+        """Whether the run of a checkpoint reached max_epochs or was stopped early."""
+        if checkpoint['epoch'] + 1 >= self.cfg.training.max_epochs:
+            return True
+        patience = self.cfg.training.early_stopping_patience
+        state = checkpoint.get('early_stopping')
+        return patience > 0 and state is not None and state['num_bad_evals'] >= patience
+
+    @property
+    def trainable_only_checkpoints(self) -> bool:
+        # with adapters the frozen encoder is identical for every dataset and only stored once, as pretrained file
+        return self.cfg.logging.ckpt_trainable_only or bool(self.cfg.training.peft)
+
+    def _checkpoint_model_state(self) -> Dict[str, Tensor]:
+        state = self.model.state_dict()
+        if not self.trainable_only_checkpoints:
+            return state
+
+        # frozen parameters are restored from the pretrained checkpoint, buffers are always kept
+        named_params = dict(self.model.named_parameters(remove_duplicate=False))
+        return {
+            key: value for key, value in state.items()
+            if key not in named_params or named_params[key].requires_grad
+        }
 
-    def run(self):
+    def _pretrained_references(self) -> Dict[str, Dict[str, str]]:
+        """Path and content hash of each pretrained file of the model config."""
+        references = {}
+        for key, value in self.cfg.model.model_dump().items():
+            if key.startswith('pretrained') and key.endswith('_path') and value and os.path.isfile(value):
+                references[key] = {'path': os.path.abspath(value), 'sha256': file_digest(value)}
+        return references
+
+    def _latest_eval_score(self, metric: str) -> Optional[float]:
+        """Metric of the latest eval results, averaged over the datasets of the current model."""
+        latest = {}
+        for entry in reversed(self.results_history):
+            if entry['split'] == 'eval' and entry['dataset'] not in latest:
+                latest[entry['dataset']] = entry.get(metric)
+
+        values = [v for v in latest.values() if v is not None]
+        return sum(values) / len(values) if values else None
+
+    def setup_run(self):
         seed_torch(self.cfg.seed)
-        logger.info(f"Random seed set to {self.cfg.seed}")
+        self.setup_distributed()
         self.setup_device()
+        self.setup_precision()
+        self.setup_threads()
         self.setup_logging()
         self.init_cloud_logging()
 
+        logger.info(f"Random seed set to {self.cfg.seed}")
+        if self.world_size > 1:
+            logger.info(f"Data-parallel training on {self.world_size} ranks")
         logger.info(f"Starting {self.cfg.model_type} training with configuration:")
         logger.info(f"  - Datasets: {self.num_ds} {list(self.cfg.data.datasets.keys())}")
         logger.info(f"  - Multitask: {self.cfg.multitask}")
         logger.info(f"  - Max epochs: {self.cfg.training.max_epochs}")
         logger.info(f"  - Output directory: {self.cfg.logging.output_dir}")
 
+    def run(self):
+        self.setup_run()
+
         """Main training loop - supports both multitask and separate models patterns."""
         if self.cfg.multitask:
             logger.info("Using separate models training pattern - one model per dataset")
@@ -848,10 +1378,99 @@ class AbstractTrainer(ABC):
             logger.info("Using unified/multitask training pattern - single shared model")
             self.run_separate_training()
 
+    def fit(
+            self,
+            train_loader: DataLoader,
+            train_sampler,
+            valid_loaders: list[DataLoader],
+            test_loaders: list[DataLoader],
+            ds_name: Optional[str] = None,
+            checkpoint: bool = True,
+    ):
+        """Epoch loop of the training patterns, with evaluation cadence, early stopping and checkpoints."""
+        train_cfg = self.cfg.training
+        self.early_stopping = EarlyStopping(
+            patience=train_cfg.early_stopping_patience,
+            min_delta=train_cfg.early_stopping_min_delta,
+            higher_is_better='loss' not in train_cfg.early_stopping_metric,
+        )
+        self.eval_loaders = (valid_loaders, test_loaders)
+        self.eval_ds_name = ds_name
+        self.eval_checkpoint = checkpoint
+        self.last_eval_step = None
+        self.last_eval_time = time.monotonic()
+
+        start_epoch = self.resume_from_checkpoint(train_sampler, ds_name) if checkpoint else 0
+
+        for epoch in range(start_epoch, train_cfg.max_epochs):
+            if self.early_stopping.should_stop:
+                break
+            self.epoch = epoch
+
+            self.train_epoch(train_loader, train_sampler)
+
+            last_epoch = epoch == train_cfg.max_epochs - 1
+            epoch_due = train_cfg.eval_interval > 0 and (epoch + 1) % train_cfg.eval_interval == 0
+            if (epoch_due or last_epoch) and self.last_eval_step != self.current_step:
+                self.evaluate()
+
+            stopping = self.early_stopping.should_stop
+            if stopping:
+                logger.info(
+                    f"Early stopping after epoch {epoch}: no {train_cfg.early_stopping_metric} improvement in "
+                    f"{self.early_stopping.num_bad_evals} evaluations"
+                )
+
+            # Save checkpoint, also when stopping so a resumed run does not train on
+            if checkpoint and ((epoch + 1) % self.cfg.logging.ckpt_interval == 0 or stopping):
+                self.save_checkpoint(ds_name=ds_name)
+
+        if self.early_stopping.best is not None:
+            logger.info(
+                f"Best {train_cfg.early_stopping_metric}: {self.early_stopping.best:.4f} at epoch "
+                f"{self.early_stopping.best_epoch}, step {self.early_stopping.best_step}"
+            )
+        self.eval_loaders = None
+
+    def evaluate(self):
+        """Evaluate the valid and test splits of the running fit and update early stopping."""
+        valid_loaders, test_loaders = self.eval_loaders
+        was_training = self.model.training
+
+        self.eval_epoch(valid_loaders, 'eval')
+        self.eval_epoch(test_loaders, 'test')
+        self.model.train(was_training)
+
+        self.last_eval_step = self.current_step
+        self.last_eval_time = time.monotonic()
+
+        score = self._latest_eval_score(self.cfg.training.early_stopping_metric)
+        improved = self.early_stopping.update(score, self.epoch, self.current_step)
+        if improved and self.eval_checkpoint and self.cfg.logging.ckpt_best:
+            self.save_checkpoint(self.eval_ds_name, is_best=True)
+
+    def step_eval_due(self) -> bool:
+        """Whether the step or time based cadence asks for an evaluation after the current step."""
+        if self.eval_loaders is None:
+            return False
+        train_cfg = self.cfg.training
+        if train_cfg.eval_step_interval > 0 and self.current_step % train_cfg.eval_step_interval == 0:
+            return True
+        if train_cfg.eval_time_interval <= 0:
+            return False
+
+        due = time.monotonic() - self.last_eval_time >= train_cfg.eval_time_interval
+        if self.world_size > 1:
+            # the master's clock decides, all ranks have to join the evaluation
+            flag = torch.tensor(float(due), device=self.device)
+            torch.distributed.broadcast(flag, src=0)
+            due = bool(flag.item())
+        return due
+
     def run_unified_training(self):
         """Original unified training loop for multitask or single dataset training."""
         self.collect_dataset_info(mixed=True)
-        model = self.setup_model()
+        model = self.build_model()
 
         train_loader, train_sampler = self.create_dataloader(datasets.Split.TRAIN)
         valid_loaders, _ = self.create_dataloader(datasets.Split.VALIDATION)
@@ -860,23 +1479,18 @@ class AbstractTrainer(ABC):
         if not isinstance(train_loader, DataLoader):
             raise TypeError('train_loader must be of type DataLoader')
 
+        if self.use_embedding_cache():
+            train_loader = self.cached_loader(train_loader, datasets.Split.TRAIN)
+            valid_loaders = [self.cached_loader(loader, datasets.Split.VALIDATION) for loader in valid_loaders]
+            test_loaders = [self.cached_loader(loader, datasets.Split.TEST) for loader in test_loaders]
+
         # Setup optimizer and scheduler
         self.setup_optimizer_and_scheduler(model, train_loader)
 
         logger.info(f"Training setup complete. Starting {self.cfg.training.max_epochs} epochs...")
 
         # Training loop
-        for epoch in range(self.cfg.training.max_epochs):
-            self.epoch = epoch
-
-            self.train_epoch(train_loader, train_sampler)
-
-            self.eval_epoch(valid_loaders, 'eval')
-            self.eval_epoch(test_loaders, 'test')
-
-            # Save checkpoint
-            if (epoch + 1) % self.cfg.logging.ckpt_interval == 0:
-                self.save_checkpoint()
+        self.fit(train_loader, train_sampler, valid_loaders, test_loaders)
 
         self.save_checkpoint(is_milestone=True)
         
@@ -889,14 +1503,27 @@ class AbstractTrainer(ABC):
 
     def run_separate_training(self, mc_dropout_pruning: bool = False, mc_prune_ratio: float = 0.4):
         """Main training loop for separate models pattern - train one model per dataset."""
+        if self.cfg.training.parallel_datasets > 1 and self.num_ds > 1 and self.world_size == 1:
+            self.run_parallel_separate_training(mc_dropout_pruning, mc_prune_ratio)
+            return
+
         logger.info(f"Starting separate models training for {self.num_ds} datasets")
 
         # Train each dataset separately
         for i, (ds_name, ds_config) in enumerate(self.ds_conf.items()):
             logger.info(f"Training dataset {i + 1}/{self.num_ds}: {ds_name}")
 
+            # datasets finished before an interruption keep their results, pruning still needs the loaders
+            checkpoint = None if mc_dropout_pruning else self.load_resume_checkpoint(ds_name)
+            if checkpoint is not None and self._checkpoint_complete(checkpoint):
+                logger.info(f"Skipping {ds_name}: it already finished training after epoch {checkpoint['epoch']}")
+                self.results_history = checkpoint['results_history']
+                self.save_results_to_csv(ds_name=ds_name)
+                self.results_history = []
+                continue
+
             self.collect_dataset_info(mixed=False, ds_name=ds_name)
-            model = self.setup_model()
+            model = self.build_model()
 
             train_loader, train_sampler = self.create_single_dataloader(ds_name, ds_config, datasets.Split.TRAIN)
             valid_loader, _ = self.create_single_dataloader(ds_name, ds_config, datasets.Split.VALIDATION)
@@ -911,6 +1538,14 @@ class AbstractTrainer(ABC):
             if not isinstance(test_loader, DataLoader):
                 raise TypeError('test_loader must be of type DataLoader')
 
+            # MC dropout scoring and pruning need the signals, keep the source loader around
+            source_train_loader = train_loader
+            use_cache = self.use_embedding_cache()
+            if use_cache:
+                train_loader = self.cached_loader(train_loader, datasets.Split.TRAIN)
+                valid_loader = self.cached_loader(valid_loader, datasets.Split.VALIDATION)
+                test_loader = self.cached_loader(test_loader, datasets.Split.TEST)
+
             # Setup optimizer and scheduler
             self.setup_optimizer_and_scheduler(model, train_loader)
 
@@ -918,53 +1553,44 @@ class AbstractTrainer(ABC):
             logger.info(f"Starting {self.cfg.training.max_epochs} epochs...")
 
             # Training loop for this dataset
-            for epoch in range(self.cfg.training.max_epochs):
-                self.epoch = epoch
-
-                self.train_epoch(train_loader, train_sampler)
-
-                self.eval_epoch([valid_loader], 'eval')
-                self.eval_epoch([test_loader], 'test')
-
-                # Save checkpoint
-                if (epoch + 1) % self.cfg.logging.ckpt_interval == 0:
-                    self.save_checkpoint(ds_name=ds_name)
+            self.fit(train_loader, train_sampler, [valid_loader], [test_loader], ds_name=ds_name)
 
             self.save_checkpoint(ds_name, is_milestone=True)
 
             if mc_dropout_pruning:
                 logger.info(f"Computing MC Dropout scores for {ds_name}...")
-                score_dict = self.compute_mc_dropout_scores(train_loader, ds_name)
+                scores = self.compute_mc_dropout_scores(source_train_loader, ds_name)
 
                 # ---- STEP 3: PRUNE DATASET ----
-                scores = pd.Series(score_dict)
-                threshold = scores.quantile(1.0 - mc_prune_ratio)
-                bad_ids = set(scores[scores >= threshold].index)
-
-                logger.info(f"Pruning {len(bad_ids)} samples from {ds_name}")
+                keep = self.select_mc_dropout_keep(scores, mc_prune_ratio)
+                logger.info(f"Pruning {len(scores) - len(keep)} samples from {ds_name}")
 
-                # Get HF dataset and prune it
-                dataset = self.dataloader_factory.datasets[ds_name]["train"]
-                pruned_dataset = dataset.filter(lambda x: x["sample_id"] not in bad_ids)
+                # Select the kept rows of the HF dataset, no row is decoded
+                dataset = source_train_loader.dataset.dataset
+                pruned_dataset = dataset.select(keep)
+                eeg_index = train_sampler.eeg_index.select(keep) if train_sampler.eeg_index is not None else None
 
                 # Rebuild dataloader from pruned dataset
                 train_loader, train_sampler = self.dataloader_factory.create_dataloader_from_dataset(
                     pruned_dataset,
+                    dataset_names=[ds_name],
+                    dataset_configs=[ds_config],
                     split=datasets.Split.TRAIN,
+                    num_replicas=self.world_size,
+                    rank=self.rank,
+                    eeg_index=eeg_index,
                 )
 
                 # ---- STEP 4: RETRAIN FROM SCRATCH ----
                 self.epoch = 0
                 self.current_step = 0
-                self.model = self.setup_model()
+                self.model = self.build_model()
+                if use_cache:
+                    train_loader = self.cached_loader(train_loader, datasets.Split.TRAIN)
                 self.setup_optimizer_and_scheduler(self.model, train_loader)
 
                 logger.info(f"Retraining {ds_name} on pruned dataset...")
-                for epoch in range(self.cfg.training.max_epochs):
-                    self.epoch = epoch
-                    self.train_epoch(train_loader, train_sampler)
-                    self.eval_epoch([valid_loader], 'eval')
-                    self.eval_epoch([test_loader], 'test')
+                self.fit(train_loader, train_sampler, [valid_loader], [test_loader], ds_name=ds_name, checkpoint=False)
             
             # Save results to CSV for this dataset
             self.save_results_to_csv(ds_name=ds_name)
@@ -980,39 +1606,156 @@ class AbstractTrainer(ABC):
         self.finish_cloud_logging()
         logger.info("Separate models training completed for all datasets!")
 
+    def pack_dataset_jobs(self, n_slots: int) -> list[Dict[str, str]]:
+        """Distribute the datasets over slots, balancing the number of training samples.
+
+        Longest processing time first: the largest remaining dataset goes to the least loaded
+        slot, so big datasets end up alone while small ones share a slot.
+        """
+        sizes = {
+            ds_name: get_dataset_n_sample(ds_name, ds_config, datasets.Split.TRAIN, self.exp_name, self.preproc_exp_config)
+            for ds_name, ds_config in self.ds_conf.items()
+        }
+        slots: list[Dict[str, str]] = [{} for _ in range(n_slots)]
+        loads = [0] * n_slots
+        for ds_name in sorted(sizes, key=sizes.get, reverse=True):
+            slot = loads.index(min(loads))
+            slots[slot][ds_name] = self.ds_conf[ds_name]
+            loads[slot] += sizes[ds_name]
+
+        for slot, (jobs, load) in enumerate(zip(slots, loads)):
+            logger.info(f"Slot {slot}: {list(jobs.keys())} with {load} training samples")
+        return [jobs for jobs in slots if jobs]
+
+    def run_parallel_separate_training(self, mc_dropout_pruning: bool = False, mc_prune_ratio: float = 0.4):
+        """Separate models training with one worker process per slot of datasets."""
+        n_slots = min(self.cfg.training.parallel_datasets, self.num_ds)
+        slots = self.pack_dataset_jobs(n_slots)
+
+        if torch.cuda.is_available():
+            n_gpu = torch.cuda.device_count()
+            devices = [f'cuda:{slot % n_gpu}' for slot in range(len(slots))]
+        else:
+            devices = ['cpu'] * len(slots)
+        num_threads = max(1, get_process_cpu() // len(slots))
+
+        logger.info(f"Training {self.num_ds} datasets in {len(slots)} parallel jobs on {sorted(set(devices))}")
+        results_dir = self.get_results_dir()
+        cfg = self.cfg.model_dump()
+
+        csv_paths = []
+        with ProcessPoolExecutor(max_workers=len(slots), mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [
+                executor.submit(
+                    run_dataset_job, cfg, jobs, device, num_threads, str(results_dir),
+                    self.exp_name, self.preproc_exp_config, mc_dropout_pruning, mc_prune_ratio,
+                )
+                for jobs, device in zip(slots, devices)
+            ]
+            for future in futures:
+                csv_paths.extend(future.result())
+
+        # Merge the per-dataset results into one CSV
+        if csv_paths:
+            df = pd.concat([pd.read_csv(path) for path in csv_paths], ignore_index=True)
+            filename = f"{self.model_type}_separate_seed_{self.cfg.seed}_{self.start_time.strftime('%Y%m%d_%H%M%S')}.csv"
+            merged_path = results_dir / filename
+            df.to_csv(merged_path, index=False)
+            self.saved_results.append(merged_path)
+            logger.info(f"Merged results of {len(csv_paths)} datasets saved to CSV: {merged_path}")
+
+        self.finish_cloud_logging()
+        logger.info("Parallel separate models training completed for all datasets!")
+
     def _enable_dropout_only(self):
         """Enable dropout layers during inference."""
         for m in self.model.modules():
             if isinstance(m, torch.nn.Dropout):
                 m.train()
 
+    def _mc_dropout_classifier(self) -> Optional[MultiHeadClassifier]:
+        """Return the classifier if it holds every active dropout layer of the model.
+
+        Everything up to the pooled head features is then deterministic and has to be computed only
+        once per batch, only the head MLP is evaluated for every MC sample.
+        """
+        classifier = getattr(self.model, 'classifier', None)
+        active = [
+            name for name, m in self.model.named_modules()
+            if isinstance(m, torch.nn.Dropout) and m.training and m.p > 0
+        ]
+        if not isinstance(classifier, MultiHeadClassifier) or not active:
+            return None
+        outside = [name for name in active if not name.startswith('classifier.')]
+        if outside:
+            logger.info(f"Active dropout outside the classifier ({', '.join(outside[:3])}, ...), running the full model per MC sample")
+            return None
+        return classifier
+
+    def _mc_dropout_head_probs(self, classifier: MultiHeadClassifier, batch: dict, mc_samples: int) -> Tensor:
+        """Max class probability of all MC samples, [mc_samples, B], from a single encoder pass."""
+        x, head_name = self._classifier_input(batch)
+        head = classifier.heads[head_name]
+        pooled = head(x, capture_features=True)
+
+        # Tile the features along the batch dimension, dropout masks are drawn independently per row
+        logits = head.mlp(pooled.repeat(mc_samples, 1)).view(mc_samples, pooled.shape[0], -1)
+        return torch.softmax(logits, dim=-1).max(dim=-1).values
+
+    @staticmethod
+    def select_mc_dropout_keep(scores: Tensor, prune_ratio: float) -> list[int]:
+        """Sorted row indices that remain after pruning the ``prune_ratio`` most uncertain scored rows."""
+        scores = scores.cpu()
+        scored = ~torch.isnan(scores)
+        if prune_ratio <= 0 or not scored.any():
+            return list(range(len(scores)))
+
+        threshold = torch.quantile(scores[scored].double(), 1.0 - prune_ratio)
+        keep = torch.nonzero(~(scores.double() >= threshold), as_tuple=True)[0]
+        return keep.tolist()
+
     @torch.no_grad()
     def compute_mc_dropout_scores(
         self,
         dataloader: DataLoader,
         ds_name: str,
         mc_samples: int = 50,
-    ):
+    ) -> Tensor:
         self.model.eval()
         self._enable_dropout_only()
 
-        scores = {}
-        
+        classifier = self._mc_dropout_classifier()
+        if classifier is not None:
+            logger.info(f"MC dropout for {ds_name}: encoder runs once per batch, {mc_samples} samples of the classifier head")
+
+        # Rows dropped by the sampler are never scored and stay NaN
+        scores = torch.full((len(dataloader.dataset),), float('nan'), device=self.device)
+
         for batch in dataloader:
             batch = {k: v.to(self.device) if isinstance(v, torch.Tensor) else v for k, v in batch.items()}
-            sample_ids = batch["sample_id"]  # list[str]
 
-            probs_mc = []
-            for _ in range(mc_samples):
-                logits = self.model(batch)
-                probs = torch.softmax(logits, dim=1)
-                probs_mc.append(probs.max(dim=1).values)
+            if classifier is not None:
+                probs_mc = self._mc_dropout_head_probs(classifier, batch, mc_samples)
+            else:
+                probs_mc = []
+                for _ in range(mc_samples):
+                    logits = self.model(batch)
+                    probs = torch.softmax(logits, dim=1)
+                    probs_mc.append(probs.max(dim=1).values)
+                probs_mc = torch.stack(probs_mc, dim=0)
 
-            probs_mc = torch.stack(probs_mc, dim=0)
             uncertainty = (probs_mc - probs_mc.pow(2)).mean(dim=0)
 
-            for sid, u in zip(sample_ids, uncertainty):
-                scores[sid] = u.item()
+            scores[batch['index']] = uncertainty.float()
+
+        if self.world_size > 1:
+            # every row is scored on exactly one rank, rows no rank scored stay NaN
+            scored = ~torch.isnan(scores)
+            count = scored.float()
+            scores = torch.where(scored, scores, torch.zeros_like(scores))
+            torch.distributed.all_reduce(scores, op=torch.distributed.ReduceOp.SUM)
+            torch.distributed.all_reduce(count, op=torch.distributed.ReduceOp.SUM)
+            scores = torch.where(count > 0, scores / count.clamp(min=1), torch.full_like(scores, float('nan')))
 
         return scores
 
@@ -222,8 +222,8 @@ class BendrTrainer(AbstractTrainer):
 
         logger.info(f"Loading separate checkpoints: {context_path} and {conv_path}")
 
-        context_ckpt = torch.load(context_path, map_location=self.device, weights_only=False)
-        conv_ckpt = torch.load(conv_path, map_location=self.device, weights_only=False)
+        context_ckpt = self.load_pretrained_file(context_path)
+        conv_ckpt = self.load_pretrained_file(conv_path)
 
         missing_keys, unexpected_keys = self.encoder.load_state_dict(conv_ckpt)
 
@@ -10,7 +10,6 @@ import logging
 import os
 from typing import List
 
-import torch
 from torch import nn
 from datasets import Dataset as HFDataset
 
@@ -160,7 +159,7 @@ class BiotTrainer(AbstractTrainer):
 
         logger.info(f"Loading pretrained weights from: {checkpoint_path}")
 
-        pretrain_ckpt = torch.load(checkpoint_path, map_location=self.device, weights_only=False)
+        pretrain_ckpt = self.load_pretrained_file(checkpoint_path)
 
         missing_keys, unexpected_keys = self.encoder.load_state_dict(pretrain_ckpt, strict=False)
 
@@ -108,36 +108,41 @@ class BIOTEncoder(nn.Module):
         )
         return torch.abs(spectral)
 
-    def forward(self, x, n_channel_offset=0, perturb=False):
+    def channel_embedding(self, x, n_channel_offset=0, perturb=False):
         """
         x: [batch_size, channel, ts]
-        output: [batch_size, emb_size]
+        output: [batch_size, channel * ts, emb_size], the token sequence of the transformer
         """
-        emb_seq = []
-        for i in range(x.shape[1]):
-            channel_spec_emb = self.stft(x[:, i : i + 1, :])
-            channel_spec_emb = self.patch_embedding(channel_spec_emb)
-            batch_size, ts, _ = channel_spec_emb.shape
-            # (batch_size, ts, emb)
-            channel_token_emb = (
-                self.channel_tokens(self.index[i + n_channel_offset])
-                .unsqueeze(0)
-                .unsqueeze(0)
-                .repeat(batch_size, ts, 1)
-            )
-            # (batch_size, ts, emb)
-            channel_emb = self.positional_encoding(channel_spec_emb + channel_token_emb)
-
-            # perturb
-            if perturb:
-                ts = channel_emb.shape[1]
+        batch_size, n_channels, _ = x.shape
+        # all channels in one STFT and embedding, (batch_size * channel, ts, emb)
+        channel_spec_emb = self.patch_embedding(self.stft(x.reshape(batch_size * n_channels, 1, -1)))
+        # (batch_size, channel, ts, emb) with the channel tokens broadcast over batch and time
+        channel_spec_emb = channel_spec_emb.unflatten(0, (batch_size, n_channels))
+        channel_token_emb = self.channel_tokens(self.index[n_channel_offset: n_channel_offset + n_channels])
+        channel_emb = channel_spec_emb + channel_token_emb[None, :, None, :]
+        # positional encoding over the time steps of every channel
+        channel_emb = self.positional_encoding(channel_emb.flatten(0, 1)).unflatten(0, (batch_size, n_channels))
+
+        if perturb:
+            # a random subset of time steps per channel, the channels then differ in length
+            emb_seq = []
+            for channel_emb_i in channel_emb.unbind(1):
+                ts = channel_emb_i.shape[1]
                 ts_new = np.random.randint(ts // 2, ts)
                 selected_ts = np.random.choice(range(ts), ts_new, replace=False)
-                channel_emb = channel_emb[:, selected_ts]
-            emb_seq.append(channel_emb)
+                emb_seq.append(channel_emb_i[:, selected_ts])
+            emb = torch.cat(emb_seq, dim=1)
+        else:
+            # (batch_size, channel * ts, emb), channel-major like the concatenated channels
+            emb = channel_emb.flatten(1, 2)
+        return emb
 
-        # (batch_size, 16 * ts, emb)
-        emb = torch.cat(emb_seq, dim=1)
+    def forward(self, x, n_channel_offset=0, perturb=False):
+        """
+        x: [batch_size, channel, ts]
+        output: [batch_size, emb_size]
+        """
+        emb = self.channel_embedding(x, n_channel_offset, perturb)
 
         # (batch_size, emb)
         emb = self.transformer(emb).mean(dim=1)
@@ -1,7 +1,6 @@
 import logging
 import os
 
-import torch
 from torch import nn
 
 from baseline.abstract.classifier import MultiHeadClassifier
@@ -122,6 +121,9 @@ class CBraModTrainer(AbstractTrainer):
 
         return model
 
+    def encoder_blocks(self, model):
+        return model.encoder.encoder.layers
+
     def load_checkpoint(self, checkpoint_path: str):
         """Load model checkpoint."""
         if not checkpoint_path or not os.path.exists(checkpoint_path):
@@ -130,7 +132,7 @@ class CBraModTrainer(AbstractTrainer):
 
         logger.info(f"Loading pretrained weights from: {checkpoint_path}")
 
-        pretrain_ckpt = torch.load(checkpoint_path, map_location=self.device, weights_only=False)
+        pretrain_ckpt = self.load_pretrained_file(checkpoint_path)
         missing_keys, unexpected_keys = self.encoder.load_state_dict(pretrain_ckpt, strict=False)
 
         if missing_keys:
@@ -128,6 +128,29 @@ class TransformerEncoder(nn.Module):
         return output
 
 
+def _packed_self_attention(mha: nn.MultiheadAttention, x: Tensor, seq_dim: int) -> Tensor:
+    """
+    Self-attention of ``mha`` over dimension ``seq_dim`` (1 channels, 2 patches) of x [bz, ch_num, patch_num, dim].
+    Uses the packed input projection and the output projection of the module, q, k and v stay strided views of
+    the projection, scaled_dot_product_attention takes the remaining dimensions as batch dimensions.
+    """
+    qkv = F.linear(x, mha.in_proj_weight, mha.in_proj_bias).unflatten(-1, (3, mha.num_heads, -1))
+    # [3, bz, other, n_head, seq, head_dim]
+    if seq_dim == 1:
+        qkv = qkv.permute(3, 0, 2, 4, 1, 5)
+    else:
+        qkv = qkv.permute(3, 0, 1, 4, 2, 5)
+    q, k, v = qkv.unbind(0)
+
+    x = F.scaled_dot_product_attention(q, k, v, dropout_p=mha.dropout if mha.training else 0.)
+    # back to [bz, ch_num, patch_num, n_head, head_dim]
+    if seq_dim == 1:
+        x = x.permute(0, 3, 1, 2, 4)
+    else:
+        x = x.permute(0, 1, 3, 2, 4)
+    return mha.out_proj(x.flatten(-2))
+
+
 class TransformerEncoderLayer(nn.Module):
     __constants__ = ['norm_first']
 
@@ -190,6 +213,18 @@ class TransformerEncoderLayer(nn.Module):
     # self-attention block
     def _sa_block(self, x: Tensor,
                   attn_mask: Optional[Tensor], key_padding_mask: Optional[Tensor], is_causal: bool = False) -> Tensor:
+        if attn_mask is not None or key_padding_mask is not None:
+            return self._sa_block_masked(x, attn_mask, key_padding_mask)
+
+        # spatial attention across channels on the first half of the features, temporal across patches on the second
+        half = x.shape[-1] // 2
+        xs = _packed_self_attention(self.self_attn_s, x[..., :half], seq_dim=1)
+        xt = _packed_self_attention(self.self_attn_t, x[..., half:], seq_dim=2)
+        x = torch.concat((xs, xt), dim=3)
+        return self.dropout1(x)
+
+    # self-attention block through nn.MultiheadAttention, which applies the masks
+    def _sa_block_masked(self, x: Tensor, attn_mask: Optional[Tensor], key_padding_mask: Optional[Tensor]) -> Tensor:
         bz, ch_num, patch_num, patch_size = x.shape
         xs = x[:, :, :, :patch_size // 2]
         xt = x[:, :, :, patch_size // 2:]
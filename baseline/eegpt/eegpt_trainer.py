@@ -3,7 +3,6 @@
 import logging
 import os
 
-import torch
 from torch import nn
 
 from baseline.abstract.classifier import MultiHeadClassifier
@@ -136,6 +135,9 @@ class EegptTrainer(AbstractTrainer):
 
         return model
 
+    def encoder_blocks(self, model):
+        return model.encoder.blocks
+
     def load_checkpoint(self, checkpoint_path: str):
         """Load model checkpoint."""
         if not checkpoint_path or not os.path.exists(checkpoint_path):
@@ -144,7 +146,7 @@ class EegptTrainer(AbstractTrainer):
 
         logger.info(f"Loading pretrained weights from: {checkpoint_path}")
 
-        pretrain_ckpt = torch.load(checkpoint_path, map_location=self.device, weights_only=False)
+        pretrain_ckpt = self.load_pretrained_file(checkpoint_path)
 
         # Extract encoder weights
         target_encoder_state = {}
@@ -2,7 +2,6 @@ import logging
 import os
 from functools import partial
 
-import torch
 from torch import nn
 from timm.loss.cross_entropy import LabelSmoothingCrossEntropy
 
@@ -45,8 +44,8 @@ class LabramUnifiedModel(nn.Module):
 
         chans_id = nn.functional.pad(chans_id+1, (1, 0), value=0)
 
-        # Get features from encoder
-        features = self.encoder.forward_features(
+        # Get features from encoder, its head is an identity and forward keeps the encoder compilable as a module
+        features = self.encoder(
             data,
             input_chans=chans_id,
             return_patch_tokens=True
@@ -145,6 +144,9 @@ class LabramTrainer(AbstractTrainer):
 
         return model
 
+    def encoder_blocks(self, model):
+        return model.encoder.blocks
+
     def load_checkpoint(self, checkpoint_path: str):
         """Load model checkpoint."""
         if not checkpoint_path or not os.path.exists(checkpoint_path):
@@ -154,7 +156,7 @@ class LabramTrainer(AbstractTrainer):
         logger.info(f"Loading pretrained weights from: {checkpoint_path}")
         
         # Load checkpoint
-        checkpoint = torch.load(checkpoint_path, map_location=self.device, weights_only=False)
+        checkpoint = self.load_pretrained_file(checkpoint_path)
 
         encoder_state_dict = {}
         for k, v in checkpoint['model'].items():
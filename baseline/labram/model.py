@@ -177,27 +177,34 @@ class Attention(nn.Module):
         if self.k_norm is not None:
             k = self.k_norm(k).type_as(v)
 
-        q = q * self.scale
-        attn = (q @ k.transpose(-2, -1))
-
+        # relative position biases are added to the attention logits
+        attn_bias = None
         if self.relative_position_bias_table is not None:
             relative_position_bias = \
                 self.relative_position_bias_table[self.relative_position_index.view(-1)].view(
                     self.window_size[0] * self.window_size[1] + 1,
                     self.window_size[0] * self.window_size[1] + 1, -1)  # Wh*Ww,Wh*Ww,nH
             relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
-            attn = attn + relative_position_bias.unsqueeze(0)
+            attn_bias = relative_position_bias.unsqueeze(0)
 
         if rel_pos_bias is not None:
-            attn = attn + rel_pos_bias
-
-        attn = attn.softmax(dim=-1)
-        attn = self.attn_drop(attn)
+            attn_bias = rel_pos_bias if attn_bias is None else attn_bias + rel_pos_bias
 
         if return_attention:
-            return attn
-
-        x = (attn @ v).transpose(1, 2).reshape(B, N, -1)
+            # the attention matrix for visualization, the fused kernel below never materializes it
+            attn = (q * self.scale) @ k.transpose(-2, -1)
+            if attn_bias is not None:
+                attn = attn + attn_bias
+            attn = attn.softmax(dim=-1)
+            return self.attn_drop(attn)
+
+        x = F.scaled_dot_product_attention(
+            q, k, v,
+            attn_mask=attn_bias.to(q.dtype) if attn_bias is not None else None,
+            dropout_p=self.attn_drop.p if self.training else 0.,
+            scale=self.scale,
+        )
+        x = x.transpose(1, 2).reshape(B, N, -1)
 
         x = self.proj(x)
         x = self.proj_drop(x)
@@ -1,6 +1,9 @@
+from functools import partial
+
 import torch.nn as nn
 import torch
 from torch.autograd import Function
+from torch.utils.checkpoint import checkpoint
 
 
 class ReverseLayerF(Function):
@@ -121,3 +124,22 @@ def SMMDL_conditional(Cs, s_label, Ct, t_label):
 
     return all_loss / class_num
 
+
+def _checkpointed_forward(forward, *args, **kwargs):
+    if not torch.is_grad_enabled():
+        return forward(*args, **kwargs)
+    return checkpoint(forward, *args, use_reentrant=False, **kwargs)
+
+
+def checkpoint_blocks(blocks: nn.ModuleList, every: int = 1) -> int:
+    """
+    Recompute the activations of every k-th block in the backward pass instead of storing them.
+    The forward of the block instances is replaced, parameter names and checkpoints stay the same.
+    Returns the number of checkpointed blocks.
+    """
+    n_checkpointed = 0
+    for i, block in enumerate(blocks):
+        if i % every == 0:
+            block.forward = partial(_checkpointed_forward, block.forward)
+            n_checkpointed += 1
+    return n_checkpointed
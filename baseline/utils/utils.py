@@ -27,6 +27,24 @@ def seed_torch(seed=1029):
     torch.backends.cudnn.deterministic = True
 
 
+def get_rng_state() -> dict:
+    """States of all random generators seeded by ``seed_torch``."""
+    return {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+    }
+
+
+def set_rng_state(state: dict):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
 def EA(x, new_R=None):
     # print(x.shape)
     """
@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 import sys
+import itertools
 import logging
+from copy import deepcopy
 from pathlib import Path
 
 from omegaconf import DictConfig, OmegaConf
 import hydra
+import torch
 
+from baseline.abstract.cache import resident_pretrained_states
 from baseline.abstract.factory import ModelRegistry
+from common.distributed.env import init_distributed
 from common.log import setup_log
 from common.path import get_conf_file_path
 from common.utils import setup_yaml
@@ -14,6 +19,11 @@ from common.utils import setup_yaml
 
 logger = logging.getLogger('baseline')
 
+# sweep keys that change how the loaders are built, the model type selects the factory and the seed
+# orders the batches of its samplers
+LOADER_SWEEP_KEYS = ('seed', 'multitask', 'model_type')
+LOADER_SWEEP_SECTIONS = ('data.', 'experiment.')
+
 
 def run_training(cfg: DictConfig | dict, exp_name: str = None, preproc_exp_config: dict = None):
     setup_yaml()
@@ -22,6 +32,29 @@ def run_training(cfg: DictConfig | dict, exp_name: str = None, preproc_exp_confi
     if isinstance(cfg, DictConfig):
         cfg = OmegaConf.to_container(cfg, resolve=True, throw_on_missing=True)
 
+    # torchrun and SLURM launches train one data-parallel replica per process
+    distributed = init_distributed(cfg.get("training", {}).get("dist_backend"), cfg.get("master_port", 41001))
+    try:
+        if cfg.get("sweep"):
+            run_sweep(cfg, exp_name=exp_name, preproc_exp_config=preproc_exp_config)
+            return
+
+        config = validate_config(cfg)
+
+        output_dir = Path(config.logging.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        trainer = ModelRegistry.create_trainer(config)
+        # Pass experiment info for dataloader to find correct preprocessed dataset
+        trainer.exp_name = exp_name
+        trainer.preproc_exp_config = preproc_exp_config
+        trainer.run()
+    finally:
+        if distributed:
+            torch.distributed.destroy_process_group()
+
+
+def validate_config(cfg: dict):
     model_type = cfg.get("model_type")
     available_models = ModelRegistry.list_models()
     if model_type not in available_models:
@@ -32,15 +65,60 @@ def run_training(cfg: DictConfig | dict, exp_name: str = None, preproc_exp_confi
 
     if not config.validate_config():
         raise ValueError(f"Invalid configuration for model type: {model_type}")
-
-    output_dir = Path(config.logging.output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    trainer = ModelRegistry.create_trainer(config)
-    # Pass experiment info for dataloader to find correct preprocessed dataset
-    trainer.exp_name = exp_name
-    trainer.preproc_exp_config = preproc_exp_config
-    trainer.run()
+    return config
+
+
+def set_dotted_key(cfg: dict, key: str, value):
+    *parents, leaf = key.split('.')
+    node = cfg
+    for part in parents:
+        node = node.setdefault(part, {})
+    node[leaf] = value
+
+
+def run_sweep(cfg: dict, exp_name: str = None, preproc_exp_config: dict = None):
+    """Train every point of the ``sweep`` grid in this process.
+
+    Pretrained checkpoints, loaded splits and their data loaders stay resident and are shared by
+    all points, only model, optimizer and logging are rebuilt. A grid over the seed, multitask or the
+    data and experiment sections builds the loaders per point instead. Points write their own result CSV,
+    tagged with the point number, and checkpoints to ``<ckpt_dir>/sweep_<n>``.
+    """
+    grid: dict = cfg["sweep"]
+    points = [dict(zip(grid.keys(), values)) for values in itertools.product(*grid.values())]
+    # the factory and its resident loaders can only be shared if everything they are built from stays fixed
+    share_factory = not any(key in LOADER_SWEEP_KEYS or key.startswith(LOADER_SWEEP_SECTIONS) for key in grid)
+    if not share_factory:
+        logger.info("Sweep changes the data loading, every point builds its own loaders")
+    logger.info(f"In-process sweep over {list(grid.keys())}: {len(points)} points")
+
+    ckpt_dir = validate_config({**cfg, "sweep": {}}).logging.ckpt_dir
+
+    factory = None
+    with resident_pretrained_states():
+        for point_idx, point in enumerate(points):
+            logger.info(f"Sweep point {point_idx + 1}/{len(points)}: {point}")
+
+            point_cfg = deepcopy(cfg)
+            point_cfg["sweep"] = {}
+            for key, value in point.items():
+                set_dotted_key(point_cfg, key, value)
+            set_dotted_key(point_cfg, "logging.ckpt_dir", str(Path(ckpt_dir, f"sweep_{point_idx}")))
+            config = validate_config(point_cfg)
+
+            Path(config.logging.output_dir).mkdir(parents=True, exist_ok=True)
+            trainer = ModelRegistry.create_trainer(config)
+            if share_factory and factory is not None:
+                trainer.dataloader_factory = factory
+            elif share_factory:
+                factory = trainer.dataloader_factory
+                factory.keep_resident = True
+
+            trainer.exp_name = exp_name
+            trainer.preproc_exp_config = preproc_exp_config
+            trainer.sweep_point = point
+            trainer.results_tag = f"sweep_{point_idx}"
+            trainer.run()
 
 
 def list_available_models():
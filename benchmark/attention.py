@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Fused scaled_dot_product_attention of LaBraM and CBraMod against their original attention.
+
+For LaBraM the original path materializes the [B, H, N, N] attention matrix, it runs with and without a
+relative position bias. For CBraMod it is the criss-cross attention through nn.MultiheadAttention on
+contiguous copies of the spatial and temporal halves. The maximum output and gradient deviation of
+the fused path is printed next to the forward and backward time of both. Example:
+
+    python -m benchmark.attention --channels 64 --patches 10 --batch-size 32 --device cuda
+"""
+import argparse
+import time
+from functools import partial
+
+import torch
+from torch import nn
+
+from baseline.cbramod.model import TransformerEncoderLayer
+from baseline.labram.model import Attention
+from benchmark.utils import synchronize
+
+
+def explicit_attention_weights(attn: Attention, x, rel_pos_bias=None):
+    """Explicit softmax(q k^T + bias) of LaBraM attention with its values, ([B, H, N, N], [B, H, N, D])."""
+    B, N, C = x.shape
+    qkv_bias = None
+    if attn.q_bias is not None:
+        qkv_bias = torch.cat((attn.q_bias, torch.zeros_like(attn.v_bias, requires_grad=False), attn.v_bias))
+    qkv = nn.functional.linear(input=x, weight=attn.qkv.weight, bias=qkv_bias)
+    qkv = qkv.reshape(B, N, 3, attn.num_heads, -1).permute(2, 0, 3, 1, 4)
+    q, k, v = qkv[0], qkv[1], qkv[2]
+    if attn.q_norm is not None:
+        q = attn.q_norm(q).type_as(v)
+    if attn.k_norm is not None:
+        k = attn.k_norm(k).type_as(v)
+
+    attn_matrix = (q * attn.scale) @ k.transpose(-2, -1)
+    if attn.relative_position_bias_table is not None:
+        n_tokens = attn.window_size[0] * attn.window_size[1] + 1
+        bias = attn.relative_position_bias_table[attn.relative_position_index.view(-1)].view(n_tokens, n_tokens, -1)
+        attn_matrix = attn_matrix + bias.permute(2, 0, 1).unsqueeze(0)
+    if rel_pos_bias is not None:
+        attn_matrix = attn_matrix + rel_pos_bias
+    return attn.attn_drop(attn_matrix.softmax(dim=-1)), v
+
+
+def explicit_attention(attn: Attention, x, rel_pos_bias=None):
+    """LaBraM attention computed with the explicit attention matrix."""
+    weights, v = explicit_attention_weights(attn, x, rel_pos_bias)
+    x = (weights @ v).transpose(1, 2).reshape(x.shape[0], x.shape[1], -1)
+    return attn.proj_drop(attn.proj(x))
+
+
+def build_attention(dim: int, num_heads: int, window_size, device: torch.device) -> Attention:
+    attn = Attention(
+        dim, num_heads=num_heads, qkv_bias=True, qk_norm=partial(nn.LayerNorm, eps=1e-6), window_size=window_size,
+    ).to(device)
+    with torch.no_grad():
+        for param in (attn.q_bias, attn.v_bias, attn.relative_position_bias_table):
+            if param is not None:
+                param.normal_(std=0.02)
+    return attn.eval()
+
+
+def run(forward, x: torch.Tensor, dtype: torch.dtype):
+    with torch.autocast(x.device.type, dtype=dtype, enabled=dtype != torch.float32):
+        out = forward(x)
+    out.float().sum().backward()
+    return out
+
+
+def measure(forward, x: torch.Tensor, dtype: torch.dtype, iters: int) -> float:
+    """Milliseconds of a forward and backward pass."""
+    run(forward, x, dtype)
+    synchronize(x.device)
+    start = time.perf_counter()
+    for _ in range(iters):
+        run(forward, x, dtype)
+    synchronize(x.device)
+    return (time.perf_counter() - start) / iters * 1000
+
+
+def build_criss_cross(d_model: int, num_heads: int, device: torch.device) -> TransformerEncoderLayer:
+    layer = TransformerEncoderLayer(
+        d_model=d_model, n_head=num_heads, dim_ffn=4 * d_model, batch_first=True, norm_first=True,
+    ).to(device)
+    return layer.eval()
+
+
+def compare(fused, original, x: torch.Tensor, dtype: torch.dtype) -> tuple[float, float]:
+    """Maximum deviation of the fused output and input gradient from the original path."""
+    results = []
+    for forward in (fused, original):
+        x_grad = x.detach().clone().requires_grad_()
+        out = run(forward, x_grad, dtype)
+        results.append((out.detach().float(), x_grad.grad.float()))
+    (out, grad), (ref_out, ref_grad) = results
+    return (out - ref_out).abs().max().item(), (grad - ref_grad).abs().max().item()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', default=['labram', 'cbramod'])
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--channels', type=int, default=64)
+    parser.add_argument('--patches', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--dim', type=int, default=200)
+    parser.add_argument('--num-heads', type=int, default=10)
+    parser.add_argument('--iters', type=int, default=10)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    print(f"{args.channels} channels x {args.patches} patches, batch {args.batch_size}, dim {args.dim}, "
+          f"{args.num_heads} heads on {device}")
+    print(f"{'model':<8} {'bias':<9} {'dtype':<6} {'out err':>9} {'grad err':>9} {'original ms':>12} {'fused ms':>9}")
+
+    cases = []
+    if 'labram' in args.models:
+        x = torch.randn(args.batch_size, args.channels * args.patches + 1, args.dim, device=device)
+        for window_size in (None, (args.channels, args.patches)):
+            attn = build_attention(args.dim, args.num_heads, window_size, device)
+            bias = 'relative' if window_size else 'none'
+            cases.append(('labram', bias, attn, partial(explicit_attention, attn), x))
+    if 'cbramod' in args.models:
+        x = torch.randn(args.batch_size, args.channels, args.patches, args.dim, device=device)
+        layer = build_criss_cross(args.dim, args.num_heads, device)
+        fused = partial(layer._sa_block, attn_mask=None, key_padding_mask=None)
+        original = partial(layer._sa_block_masked, attn_mask=None, key_padding_mask=None)
+        cases.append(('cbramod', 'none', fused, original, x))
+
+    for model_type, bias, fused, original, x in cases:
+        for dtype in (torch.float32, torch.bfloat16):
+            out_err, grad_err = compare(fused, original, x, dtype)
+            original_time = measure(original, x, dtype, args.iters)
+            fused_time = measure(fused, x, dtype, args.iters)
+            dtype_name = 'fp32' if dtype == torch.float32 else 'bf16'
+            print(f"{model_type:<8} {bias:<9} {dtype_name:<6} {out_err:>9.2e} {grad_err:>9.2e} "
+                  f"{original_time:>12.1f} {fused_time:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+BIOT encoder forward with one batched STFT against the original loop over channels.
+
+The loop is the original implementation of BIOTEncoder.forward, it runs the STFT, the patch embedding
+and the channel token of every channel separately. Both paths run the same encoder in eval mode, the
+maximum deviation of the encoder output and of the perturbed token sequence is printed next to the
+time of the channel embedding alone and of the full encoder forward. Example:
+
+    python -m benchmark.biot --channels 19 32 64 --batch-size 64 --device cuda
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from baseline.biot.model import BIOTEncoder
+from benchmark.utils import synchronize
+
+
+def loop_channel_embedding(encoder: BIOTEncoder, x: torch.Tensor, n_channel_offset: int = 0, perturb: bool = False):
+    """Channel sequence of the original forward, (batch_size, channel * ts, emb)."""
+    emb_seq = []
+    for i in range(x.shape[1]):
+        channel_spec_emb = encoder.stft(x[:, i: i + 1, :])
+        channel_spec_emb = encoder.patch_embedding(channel_spec_emb)
+        batch_size, ts, _ = channel_spec_emb.shape
+        channel_token_emb = (
+            encoder.channel_tokens(encoder.index[i + n_channel_offset])
+            .unsqueeze(0)
+            .unsqueeze(0)
+            .repeat(batch_size, ts, 1)
+        )
+        channel_emb = encoder.positional_encoding(channel_spec_emb + channel_token_emb)
+        if perturb:
+            ts = channel_emb.shape[1]
+            ts_new = np.random.randint(ts // 2, ts)
+            selected_ts = np.random.choice(range(ts), ts_new, replace=False)
+            channel_emb = channel_emb[:, selected_ts]
+        emb_seq.append(channel_emb)
+    return torch.cat(emb_seq, dim=1)
+
+
+def loop_forward(encoder: BIOTEncoder, x: torch.Tensor, n_channel_offset: int = 0, perturb: bool = False):
+    return encoder.transformer(loop_channel_embedding(encoder, x, n_channel_offset, perturb)).mean(dim=1)
+
+
+@torch.no_grad()
+def measure(forward, iters: int, device: torch.device) -> float:
+    """Milliseconds per call."""
+    forward()
+    synchronize(device)
+    start = time.perf_counter()
+    for _ in range(iters):
+        forward()
+    synchronize(device)
+    return (time.perf_counter() - start) / iters * 1000
+
+
+@torch.no_grad()
+def max_deviation(encoder: BIOTEncoder, x: torch.Tensor, offset: int) -> tuple[float, float]:
+    """Deviation of the batched forward and of its perturbed sequence from the loop."""
+    forward_err = (encoder(x, n_channel_offset=offset) - loop_forward(encoder, x, offset)).abs().max().item()
+
+    np.random.seed(0)
+    perturbed = encoder.channel_embedding(x, n_channel_offset=offset, perturb=True)
+    np.random.seed(0)
+    reference = loop_channel_embedding(encoder, x, offset, perturb=True)
+    perturb_err = (perturbed - reference).abs().max().item()
+    return forward_err, perturb_err
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--channels', nargs='+', type=int, default=[19, 32, 64])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--n-samples', type=int, default=2000, help='10 s at the 200 Hz BIOT was pretrained with')
+    parser.add_argument('--offset', type=int, default=2, help='n_channel_offset of the channel tokens')
+    parser.add_argument('--iters', type=int, default=10)
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    print(f"batch {args.batch_size}, {args.n_samples} samples, channel offset {args.offset} on {device}")
+    print(f"{'channels':>8} {'fwd err':>9} {'perturb err':>11} "
+          f"{'loop emb ms':>11} {'batched emb ms':>14} {'loop fwd ms':>11} {'batched fwd ms':>14}")
+
+    for n_channels in args.channels:
+        encoder = BIOTEncoder(n_channels=n_channels + args.offset).to(device).eval()
+        x = torch.randn(args.batch_size, n_channels, args.n_samples, device=device)
+
+        forward_err, perturb_err = max_deviation(encoder, x, args.offset)
+        loop_emb = measure(lambda: loop_channel_embedding(encoder, x, args.offset), args.iters, device)
+        batched_emb = measure(lambda: encoder.channel_embedding(x, args.offset), args.iters, device)
+        loop_fwd = measure(lambda: loop_forward(encoder, x, args.offset), args.iters, device)
+        batched_fwd = measure(lambda: encoder(x, n_channel_offset=args.offset), args.iters, device)
+        print(f"{n_channels:>8} {forward_err:>9.2e} {perturb_err:>11.2e} "
+              f"{loop_emb:>11.1f} {batched_emb:>14.1f} {loop_fwd:>11.1f} {batched_fwd:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Peak memory and step time of full fine-tuning with activation checkpointing of every k-th encoder block.
+
+On CUDA the peak allocated memory of a training step is reported. On CPU the allocator keeps no
+statistics, the bytes of the tensors saved for the backward pass are counted instead, which is the
+part of the memory activation checkpointing reduces. Example:
+
+    python -m benchmark.checkpointing --models labram eegpt cbramod --every 0 1 2 4 --batch-size 64
+"""
+import argparse
+import time
+from contextlib import nullcontext
+from typing import Optional
+
+import torch
+
+from benchmark import utils
+from benchmark.utils import default_n_samples, make_batch, synchronize
+from common.log import setup_log
+
+
+def build_trainer(model_type: str, device: str, every: int):
+    trainer, model = utils.build_trainer(
+        model_type, device=device, freeze_encoder=False, activation_checkpointing=every,
+    )
+    if every > 0:
+        trainer.setup_activation_checkpointing(model)
+    optimizer = torch.optim.AdamW(trainer.setup_optim_params(model))
+    return trainer, model, optimizer
+
+
+class SavedTensorCounter:
+    """Bytes of the distinct tensors autograd saves for the backward pass."""
+
+    def __init__(self):
+        self.storages = {}
+
+    def pack(self, tensor):
+        storage = tensor.untyped_storage()
+        self.storages[storage.data_ptr()] = storage.nbytes()
+        return tensor
+
+    def hooks(self):
+        return torch.autograd.graph.saved_tensors_hooks(self.pack, lambda tensor: tensor)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.storages.values())
+
+
+def train_step(trainer, model, optimizer, batch: dict, counter: Optional[SavedTensorCounter] = None):
+    with trainer.autocast(), counter.hooks() if counter else nullcontext():
+        logits = model(batch)
+        loss = torch.nn.functional.cross_entropy(logits.float(), batch['label'])
+    optimizer.zero_grad(set_to_none=True)
+    loss.backward()
+    optimizer.step()
+
+
+def measure(trainer, model, optimizer, batch: dict, warmup: int, iters: int) -> tuple[float, float]:
+    """Memory in MB and milliseconds per training step."""
+    device = trainer.device
+    model.train()
+    for _ in range(warmup):
+        train_step(trainer, model, optimizer, batch)
+
+    if device.type == 'cuda':
+        synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        train_step(trainer, model, optimizer, batch)
+        memory = torch.cuda.max_memory_allocated(device)
+    else:
+        counter = SavedTensorCounter()
+        train_step(trainer, model, optimizer, batch, counter)
+        memory = counter.nbytes
+
+    start = time.perf_counter()
+    for _ in range(iters):
+        train_step(trainer, model, optimizer, batch)
+    synchronize(device)
+    step_time = (time.perf_counter() - start) / iters
+    return memory / 2 ** 20, step_time * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', default=['eegpt', 'labram', 'cbramod'])
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--every', nargs='+', type=int, default=[0, 1, 2, 4], help='0 disables checkpointing')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--channels', type=int, default=19)
+    parser.add_argument('--n-samples', type=int, default=None, help='window length, defaults per model')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--iters', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_log(level='WARNING')
+    memory_name = 'peak MB' if args.device.startswith('cuda') else 'saved MB'
+    print(f"{'model':<10} {'every':>5} {memory_name:>9} {'step ms':>8}")
+
+    for model_type in args.models:
+        n_samples = default_n_samples(model_type, args.n_samples)
+        for every in args.every:
+            trainer, model, optimizer = build_trainer(model_type, args.device, every)
+            batch = make_batch(args.batch_size, args.channels, n_samples, trainer.device)
+            memory, step_time = measure(trainer, model, optimizer, batch, args.warmup, args.iters)
+            print(f"{model_type:<10} {every:>5} {memory:>9.1f} {step_time:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
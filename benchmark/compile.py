@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Training step time of the baseline models in eager mode and with training.use_compile.
+
+Batches alternate between montages of different channel counts and classes, so the compiled encoder
+sees every shape and each head its own. The first steps include compilation and are reported
+separately, a second run with the same cache directory shows the time saved by the artifact cache.
+Example:
+
+    python -m benchmark.compile --models eegpt labram cbramod --device cuda --channels 19 32
+"""
+import argparse
+import time
+
+import torch
+
+from benchmark import utils
+from benchmark.utils import default_n_samples, make_batches, synchronize
+from common.log import setup_log
+
+
+def build_trainer(model_type: str, device: str, use_compile: bool, args):
+    trainer, model = utils.build_trainer(
+        model_type,
+        n_montages=len(args.channels),
+        device=device,
+        use_compile=use_compile,
+        compile_mode=args.mode,
+        compile_cache_dir=args.cache_dir,
+        freeze_encoder=not args.full_finetune,
+    )
+    params = trainer.setup_optim_params(model)
+    if use_compile:
+        trainer.compile_model(model)
+    optimizer = torch.optim.AdamW(params)
+    return trainer, model, optimizer
+
+
+def train_step(trainer, model, optimizer, batch: dict):
+    with trainer.autocast():
+        logits = model(batch)
+        loss = torch.nn.functional.cross_entropy(logits.float(), batch['label'])
+    optimizer.zero_grad(set_to_none=True)
+    loss.backward()
+    optimizer.step()
+
+
+def measure(trainer, model, optimizer, batches: list[dict], warmup: int, iters: int) -> tuple[float, float]:
+    """Seconds of the warmup steps and milliseconds per step afterwards."""
+    model.train()
+    start = time.perf_counter()
+    for _ in range(warmup):
+        for batch in batches:
+            train_step(trainer, model, optimizer, batch)
+    synchronize(trainer.device)
+    warmup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iters):
+        for batch in batches:
+            train_step(trainer, model, optimizer, batch)
+    synchronize(trainer.device)
+    step_time = (time.perf_counter() - start) / (iters * len(batches))
+    return warmup_time, step_time * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', default=['eegpt', 'labram', 'cbramod'])
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--channels', nargs='+', type=int, default=[19, 32], help='one montage per entry')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--n-samples', type=int, default=None, help='window length, defaults per model')
+    parser.add_argument('--mode', default=None, help="torch.compile mode, e.g. 'max-autotune'")
+    parser.add_argument('--cache-dir', default='./compile_cache')
+    parser.add_argument('--full-finetune', action='store_true', help='train the encoder as well')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--iters', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_log(level='WARNING')
+    print(f"{'model':<10} {'mode':<8} {'warmup s':>9} {'step ms':>8} {'speedup':>8}")
+
+    for model_type in args.models:
+        n_samples = default_n_samples(model_type, args.n_samples)
+        eager_time = None
+        for use_compile in (False, True):
+            trainer, model, optimizer = build_trainer(model_type, args.device, use_compile, args)
+            batches = make_batches(args.batch_size, args.channels, n_samples, trainer.device)
+            warmup_time, step_time = measure(trainer, model, optimizer, batches, args.warmup, args.iters)
+            eager_time = eager_time or step_time
+            mode = 'compile' if use_compile else 'eager'
+            print(f"{model_type:<10} {mode:<8} {warmup_time:>9.1f} {step_time:>8.1f} {eager_time / step_time:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+CPU inference throughput of the baseline models under the precision policy and thread budget.
+
+Models are built with their default configuration and a single two-class head, pretrained weights
+are loaded when the configured checkpoint exists. Example:
+
+    python -m benchmark.cpu --models eegpt labram --precisions fp32 bf16 --threads 4 8 16
+"""
+import argparse
+import time
+
+import torch
+
+from benchmark.utils import build_trainer, default_n_samples, make_batch
+from common.distributed.env import get_cpu_bf16_support, get_process_cpu
+from common.log import setup_log
+
+
+@torch.no_grad()
+def measure(trainer, batch: dict, warmup: int, iters: int) -> float:
+    """Samples per second of the eval forward pass."""
+    for _ in range(warmup):
+        with trainer.autocast():
+            trainer.model(batch)
+
+    start = time.perf_counter()
+    for _ in range(iters):
+        with trainer.autocast():
+            trainer.model(batch)
+    elapsed = time.perf_counter() - start
+    return iters * batch['data'].shape[0] / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', default=['eegpt', 'labram'])
+    parser.add_argument('--precisions', nargs='+', default=['fp32', 'bf16'], choices=['fp32', 'bf16', 'auto'])
+    parser.add_argument('--threads', nargs='+', type=int, default=[get_process_cpu()])
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--channels', type=int, default=19)
+    parser.add_argument('--n-samples', type=int, default=None, help='window length, defaults per model')
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--iters', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_log(level='WARNING')
+    torch.set_num_interop_threads(1)
+    print(f"CPU cores: {get_process_cpu()}, native bf16: {get_cpu_bf16_support()}")
+    print(f"{'model':<10} {'precision':<10} {'threads':>7} {'samples/s':>10}")
+
+    for model_type in args.models:
+        batch = make_batch(args.batch_size, args.channels, default_n_samples(model_type, args.n_samples))
+        for precision in args.precisions:
+            trainer, model = build_trainer(
+                model_type, device='cpu', use_amp=precision != 'fp32', cpu_precision=precision,
+            )
+            model.eval()
+            for num_threads in args.threads:
+                torch.set_num_threads(num_threads)
+                throughput = measure(trainer, batch, args.warmup, args.iters)
+                dtype = 'bf16' if trainer.amp_dtype == torch.bfloat16 else 'fp32'
+                print(f"{model_type:<10} {dtype:<10} {num_threads:>7} {throughput:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Synthetic batches and trainers built from a model's default configuration, shared by the benchmarks.
+"""
+from typing import Optional
+
+import torch
+
+from baseline.abstract.factory import ModelRegistry
+
+
+# samples of a 4 s window at the sampling rate the models were pretrained with
+DEFAULT_N_SAMPLES = {'eegpt': 1024, 'labram': 800, 'cbramod': 800}
+
+
+def default_n_samples(model_type: str, n_samples: Optional[int] = None) -> int:
+    return n_samples or DEFAULT_N_SAMPLES.get(model_type, 1000)
+
+
+def make_batches(
+        batch_size: int, channels: list[int], n_samples: int, device: Optional[torch.device] = None,
+) -> list[dict]:
+    """One batch per montage, montage i of the dataset bench{i} with 2 + i classes."""
+    batches = []
+    for i, n_channels in enumerate(channels):
+        batches.append({
+            'data': torch.randn(batch_size, n_channels, n_samples, device=device),
+            'chans_id': torch.arange(n_channels, device=device).expand(batch_size, -1),
+            'montage': [f'bench{i}/bench{i}'] * batch_size,
+            'label': torch.randint(0, 2 + i, (batch_size,), device=device),
+        })
+    return batches
+
+
+def make_batch(batch_size: int, n_channels: int, n_samples: int, device: Optional[torch.device] = None) -> dict:
+    return make_batches(batch_size, [n_channels], n_samples, device)[0]
+
+
+def build_trainer(model_type: str, n_montages: int = 1, **training):
+    """Trainer and model with a head per montage of ``make_batches``, ``training`` overrides its config."""
+    config = ModelRegistry.get_config_class(model_type).model_validate({
+        'model_type': model_type,
+        'training': training,
+    })
+    trainer = ModelRegistry.create_trainer(config)
+    trainer.setup_device()
+    trainer.setup_precision()
+    trainer.ds_info = {f'bench{i}': {'n_class': 2 + i} for i in range(n_montages)}
+    model = trainer.setup_model()
+    return trainer, model
+
+
+def synchronize(device: torch.device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
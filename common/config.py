@@ -3,7 +3,7 @@ Abstract configuration base class for baseline models.
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Optional, List
+from typing import Any, Dict, Optional, List
 from pydantic import BaseModel, Field
 
 
@@ -20,6 +20,16 @@ class BaseDataArgs(BaseModel):
     batch_size: int = 32
     num_workers: int = 2
 
+    in_memory: bool = False  # Materialize each split into RAM tensors instead of reading Arrow rows
+    in_memory_max_gb: float = 4.0  # Splits larger than this stay on the Arrow path
+    mp_context: str = 'spawn'  # DataLoader worker start method: 'spawn', 'forkserver' or 'fork'
+    lazy_batches: bool = False  # Compute batches on the fly in the sampler instead of pre-generating them
+    # Multitask batch scheduling: 'uniform', 'proportional', 'temperature', 'round_robin' or 'quota'
+    batch_schedule: str = 'uniform'
+    schedule_temperature: float = 1.0
+    schedule_quotas: Dict[str, float] = Field(default_factory=lambda: {})
+    stream_buffer_size: int = 4096  # Windows held per worker by the streaming pretrain loader
+
 class BaseModelArgs(BaseModel):
     """Base model configuration."""
     pretrained_path: Optional[str] = None
@@ -43,7 +53,45 @@ class BaseTrainingArgs(BaseModel):
     min_lr: float = 1e-6  # For CosineAnnealingLR
 
     use_amp: bool = True
+    grad_accum_steps: int = 1  # Loader batches accumulated into one optimizer and scheduler step
+    micro_batch_size: int = 0  # Samples per forward pass, loader batches are split into chunks, 0 disables
+    oom_micro_batch: bool = True  # Halve the micro-batch size and retry the step on out-of-memory
+    # Autocast on CPU: 'bf16', 'fp32' or 'auto' (bf16 where the CPU computes it natively), CUDA always uses bf16
+    cpu_precision: str = 'auto'
+    # Split the cores of the process between intra-op threads and DataLoader workers
+    thread_budget: bool = False
+    cpu_budget: Optional[int] = None  # Cores of the process, defaults to get_process_cpu()
     freeze_encoder: bool = True
+    # 'lora' or 'adapter' in the encoder blocks, trained with the heads on the frozen encoder, None disables
+    peft: Optional[str] = None
+    lora_rank: int = 8
+    lora_alpha: float = 16.0
+    lora_targets: List[str] = Field(default_factory=lambda: [])  # Module names in a block, e.g. ['qkv'], empty adapts all
+    adapter_dim: int = 64  # Bottleneck width of the adapters
+    # Recompute every k-th transformer block of the encoder in the backward pass instead of storing its activations
+    activation_checkpointing: int = 0
+    # torch.compile the encoder and every classification head, the routing on the montage stays eager
+    use_compile: bool = False
+    compile_mode: Optional[str] = None  # e.g. 'reduce-overhead' or 'max-autotune', defaults to torch's default
+    compile_dynamic: Optional[bool] = None  # None marks a dimension dynamic once it changes, e.g. the last batch
+    compile_cache_dir: Optional[str] = './compile_cache'  # Compiled artifacts shared between runs, None disables
+    resume: bool = True  # Continue from a matching *_last.pt in ckpt_dir, finished datasets are skipped
+
+    eval_interval: int = 1  # Evaluate valid and test splits every N epochs, the last epoch is always evaluated
+    eval_step_interval: int = 0  # Also evaluate every N training steps, 0 disables
+    eval_time_interval: float = 0.0  # Also evaluate once N seconds passed since the last evaluation, 0 disables
+    early_stopping_patience: int = 0  # Evaluations without improvement before training stops, 0 disables
+    early_stopping_min_delta: float = 0.0
+    early_stopping_metric: str = 'balanced_acc'  # Eval metric averaged over datasets, lower is better for 'loss'
+    # With a frozen encoder, train the heads on pooled encoder features cached once per split
+    embedding_cache: bool = False
+    embedding_cache_dir: str = './embedding_cache'
+
+    device: Optional[str] = None  # e.g. 'cuda:1' or 'cpu', defaults to cuda:0 when available
+    # Dataset jobs trained concurrently by the separate models pattern, one process per slot
+    parallel_datasets: int = 1
+    # Process group backend of torchrun/SLURM launches, defaults to 'nccl' with CUDA and 'gloo' otherwise
+    dist_backend: Optional[str] = None
 
     experiment_params: Dict[str, Optional[float]] = Field(default_factory=lambda: {})
 
@@ -63,7 +111,15 @@ class BaseLoggingArgs(BaseModel):
     tags: List[str] = Field(default_factory=lambda: [])
 
     log_step_interval: int = 1
+    log_flush_interval: int = 50  # Logged steps buffered on the device before they are written out
     ckpt_interval: int = 1
+    ckpt_async: bool = True  # Write checkpoints from a CPU snapshot in a background thread
+    ckpt_keep_last: int = 0  # Most recent epoch checkpoints kept per directory, 0 keeps all
+    ckpt_keep_best: int = 0  # Epoch checkpoints with the best ckpt_metric kept in addition
+    ckpt_metric: str = 'balanced_acc'  # Eval metric ranking checkpoints, lower is better for 'loss'
+    # Save only trainable parameters and buffers, with hashes of the pretrained checkpoints to rebuild the rest
+    ckpt_trainable_only: bool = False
+    ckpt_best: bool = False  # Keep <model>_<dataset>_best.pt of the best training.early_stopping_metric
 
 class BaseExperimentArgs(BaseModel):
     """Base experiment configuration."""
@@ -79,6 +135,8 @@ class AbstractConfig(BaseModel, ABC):
     multitask: bool = False
     model_type: str = "base"  # To identify which model is being used
     conf_file: Optional[str] = None
+    # In-process grid over dotted config keys, e.g. {'training.max_lr': [1e-4, 5e-4]}
+    sweep: Dict[str, List[Any]] = Field(default_factory=lambda: {})
     
     data: BaseDataArgs = Field(default_factory=BaseDataArgs)
     model: BaseModelArgs = Field(default_factory=BaseModelArgs)
@@ -2,6 +2,9 @@ import os
 import random
 from datetime import datetime
 from functools import lru_cache
+from typing import Optional
+
+import torch
 
 from common.config import BaseLoggingArgs
 from common.path import RUN_ROOT 
@@ -47,6 +50,16 @@ def get_world_size() -> int:
         return 1
 
 
+@lru_cache()
+def get_local_world_size() -> int:
+    if get_is_torch_run():
+        return int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+    elif get_is_slurm_job():
+        return int(os.environ.get("SLURM_NTASKS_PER_NODE", 1))
+    else:
+        return 1
+
+
 @lru_cache()
 def get_is_master() -> bool:
     return get_global_rank() == 0
@@ -83,6 +96,25 @@ def get_master_addr() -> str:
     else:
         return "127.0.0.1"
 
+def init_distributed(backend: Optional[str] = None, port: int = 41001) -> bool:
+    """Join the process group of a torchrun or SLURM launch, return whether training is distributed.
+
+    The backend defaults to nccl with CUDA and gloo otherwise, gloo also runs on CPU-only nodes.
+    """
+    if torch.distributed.is_initialized():
+        return True
+    if get_world_size() <= 1:
+        return False
+
+    os.environ.setdefault("MASTER_ADDR", get_master_addr())
+    os.environ.setdefault("MASTER_PORT", str(get_master_port(int(os.environ.get("SLURM_JOB_ID", 0)), port)))
+    if backend is None:
+        backend = "nccl" if torch.cuda.is_available() else "gloo"
+
+    torch.distributed.init_process_group(backend, rank=get_global_rank(), world_size=get_world_size())
+    return True
+
+
 @lru_cache()
 def get_available_cpu() -> int:
     slurm_cpus_per_task = os.getenv("SLURM_CPUS_PER_TASK")
@@ -91,6 +123,19 @@ def get_available_cpu() -> int:
 
     return os.cpu_count()
 
+@lru_cache()
+def get_process_cpu() -> int:
+    """Cores available to this process, SLURM allocates them per task, otherwise the ranks of a node share them."""
+    if os.getenv("SLURM_CPUS_PER_TASK"):
+        return get_available_cpu()
+    return max(1, get_available_cpu() // get_local_world_size())
+
+@lru_cache()
+def get_cpu_bf16_support() -> bool:
+    """Whether the CPU computes bf16 natively (AVX512-BF16 or AMX), emulated bf16 is slower than fp32."""
+    checks = ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+    return any(getattr(torch.cpu, check, lambda: False)() for check in checks)
+
 @lru_cache()
 def get_specific_dirname() -> str:
     # make sure invoke only once
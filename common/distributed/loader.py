@@ -1,21 +1,62 @@
 import logging
 import math
-from typing import Optional
+from typing import Optional, Iterator, Union
 
 import numpy as np
+import pyarrow.parquet as pq
+import s3fs
 import torch
 import datasets
 from torch import Tensor
-from torch.utils.data import Dataset, Sampler, DataLoader
+from torch.utils.data import Dataset, Sampler, DataLoader, IterableDataset, get_worker_info
 
 from common.config import AbstractConfig
 from common.type import TrainStage
-from data.processor.wrapper import load_concat_eeg_datasets
+from data.processor.wrapper import load_concat_eeg_datasets, DATASET_SELECTOR, ConcatEEGIndex
 
 logger = logging.getLogger()
 
 
+class IndexPermutation:
+    """Pseudo-random permutation of ``range(n)`` evaluated at single positions without materializing it.
+
+    A keyed Feistel network permutes the smallest power of four covering ``n``, positions it maps outside
+    the range are passed through it again until they land inside (cycle walking).
+    """
+    ROUNDS = 4
+
+    def __init__(self, n: int, key: tuple[int, ...]):
+        self.n = n
+        self.half_bits = max(1, math.ceil(math.log2(max(n, 2)) / 2))
+        self.mask = np.uint64((1 << self.half_bits) - 1)
+        self.round_keys = np.random.SeedSequence(list(key)).generate_state(self.ROUNDS, dtype=np.uint64)
+
+    def _round(self, right: np.ndarray, key: np.uint64) -> np.ndarray:
+        # splitmix64 finalizer of the half block and the round key
+        x = right ^ key
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return (x ^ (x >> np.uint64(31))) & self.mask
+
+    def _encrypt(self, x: np.ndarray) -> np.ndarray:
+        shift = np.uint64(self.half_bits)
+        left, right = x >> shift, x & self.mask
+        for key in self.round_keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << shift) | right
+
+    def __call__(self, positions: np.ndarray) -> np.ndarray:
+        x = self._encrypt(np.asarray(positions, dtype=np.uint64))
+        outside = x >= self.n
+        while outside.any():
+            x[outside] = self._encrypt(x[outside])
+            outside = x >= self.n
+        return x.astype(np.int64)
+
+
 class DistributedGroupBatchSampler(Sampler):
+    SCHEDULES = ('uniform', 'proportional', 'temperature', 'round_robin', 'quota')
+
     def __init__(
             self,
             dataset: Dataset,
@@ -26,6 +67,12 @@ class DistributedGroupBatchSampler(Sampler):
             shuffle: bool = True,
             seed: int = 0,
             drop_last=False,
+            lazy: bool = False,
+            eeg_index: Optional[ConcatEEGIndex] = None,
+            schedule: str = 'uniform',
+            temperature: float = 1.0,
+            quotas: Optional[dict[str, float]] = None,
+            even_batches: bool = True,
     ):
         super().__init__()
 
@@ -39,6 +86,7 @@ class DistributedGroupBatchSampler(Sampler):
                 raise ValueError("Must set num_replicas and rank when distributed package is not available")
 
         self.dataset = dataset
+        self.eeg_index = eeg_index
         self.sample_ratio = sample_ratio
         self.num_replicas = num_replicas
         self.rank = rank
@@ -46,25 +94,54 @@ class DistributedGroupBatchSampler(Sampler):
         self.seed = seed
         self.shuffle = shuffle
         self.drop_last = drop_last
+        self.lazy = lazy
+        # evaluation keeps every batch, ranks then yield different numbers of batches
+        self.even_batches = even_batches
+
+        # multi-dataset scheduling, 'uniform' shuffles all batches regardless of their dataset
+        if schedule not in self.SCHEDULES:
+            raise ValueError(f"Unknown schedule {schedule}, expected one of {self.SCHEDULES}")
+        self.schedule = schedule
+        self.temperature = temperature
+        self.quotas = quotas or {}
 
         if len(dataset) < self.num_replicas:
             raise ValueError("Not enough data for training")
         self._adjust_batch_size(batch_size)
 
         self.epoch = 0
+        # only the multi-dataset schedules draw from the generator, batches are keyed by seed and epoch
         self.generator = torch.Generator()
         self.generator.manual_seed(self.seed)
 
-        # group by record montage
-        self.montage_groups: dict[str, Tensor] = {}
+        # montages sorted by name with their rows, either the first row of a contiguous run or all rows
+        self.montage_names: list[str] = []
+        self.montage_rows: list[Union[int, np.ndarray]] = []
+        self.montage_sizes: Optional[np.ndarray] = None
+        # samples drawn per montage, fewer than its size with a sample_ratio below 1
+        self.montage_samples: Optional[np.ndarray] = None
+        self.montage_perms: list[Optional[IndexPermutation]] = []
         self.n_total_batches = 0
         # pre gen batches
         self.all_batches = []
+        # first batch id of every montage, batches are resolved by index arithmetic on these offsets
+        self.batch_offsets: Optional[np.ndarray] = None
+        # dataset of every montage and batches yielded per dataset on this rank
+        self.dataset_names: list[str] = []
+        self.montage_dataset: Optional[np.ndarray] = None
+        self.dataset_step_counts: dict[str, int] = {}
+        # share of the epoch's steps per dataset, only set when a multi-dataset schedule applies
+        self.schedule_weights: Optional[np.ndarray] = None
 
         self._group_by_montage()
         self._sampling_by_proportion()
         self._calculate_batch_numbers()
-        self._pre_gen_all_batches()
+        if self.schedule != 'uniform' and len(self.dataset_names) > 1:
+            self.schedule_weights = self._schedule_weights()
+        if self.lazy:
+            self._prepare_lazy_batches()
+        else:
+            self._pre_gen_all_batches()
 
 
     def _adjust_batch_size(self, batch_size):
@@ -79,23 +156,39 @@ class DistributedGroupBatchSampler(Sampler):
             self.batch_size = batch_size
 
     def _group_by_montage(self):
-        montage = np.array(self.dataset['montage'])
-        unique_montages, inverse = np.unique(montage, return_inverse=True)
-        self.montage_groups = {
-            m: torch.where(torch.from_numpy(inverse) == idx)[0]
-            for idx, m in enumerate(unique_montages)
-        }
+        if self.eeg_index is not None:
+            montage_names = np.array(self.eeg_index.montage_names)
+            inverse = np.asarray(self.eeg_index.montage_id, dtype=np.int64)
+        else:
+            montage_names, inverse = np.unique(np.array(self.dataset['montage']), return_inverse=True)
+
+        # stable sort keeps rows ascending inside every montage; groups are ordered by montage name
+        order = np.argsort(inverse, kind='stable')
+        counts = np.bincount(inverse, minlength=len(montage_names))
+        starts = np.cumsum(counts) - counts
+        row_dtype = np.int32 if len(inverse) < 2 ** 31 else np.int64
+        groups = {}
+        for montage_id in np.flatnonzero(counts):
+            rows = order[starts[montage_id]:starts[montage_id] + counts[montage_id]]
+            # a contiguous run of rows is kept as its first row only
+            contiguous = rows[-1] - rows[0] + 1 == len(rows)
+            groups[str(montage_names[montage_id])] = (int(rows[0]) if contiguous else rows.astype(row_dtype), len(rows))
+
+        self.montage_names = sorted(groups)
+        self.montage_rows = [groups[m][0] for m in self.montage_names]
+        self.montage_sizes = np.array([groups[m][1] for m in self.montage_names], dtype=np.int64)
+        self.montage_samples = self.montage_sizes.copy()
 
     def _sampling_by_proportion(self):
         if abs(self.sample_ratio - 1.0) < 1e-6:
             return
 
-        n_original = sum(len(v) for v in self.montage_groups.values())
+        n_original = int(self.montage_sizes.sum())
         if n_original == 0:
             return
 
         n_target = round(n_original * self.sample_ratio)
-        montage_counts = {montage: len(indices) for montage, indices in self.montage_groups.items()}
+        montage_counts = dict(zip(self.montage_names, self.montage_sizes.tolist()))
 
         quotas = {}
         for montage, count in montage_counts.items():
@@ -113,57 +206,64 @@ class DistributedGroupBatchSampler(Sampler):
             montage = sorted_montages[i]
             quotas[montage]['floor'] += 1
 
-        new_montage_groups = {}
-        for montage in self.montage_groups:
-            sample_num = quotas[montage]['floor']
-            indices = self.montage_groups[montage]
-            if sample_num <= 0:
-                continue
-            if sample_num >= len(indices):
-                new_montage_groups[montage] = indices
-                continue
-            else:
-                perm = torch.randperm(len(indices), generator=self.generator)
-                selected = indices[perm[:sample_num]]
-                new_montage_groups[montage] = selected
-
-        self.montage_groups = new_montage_groups
+        # the drawn samples are the first positions of the montage permutation, montages without any are dropped
+        samples = np.minimum([quotas[m]['floor'] for m in self.montage_names], self.montage_sizes)
+        keep = np.flatnonzero(samples > 0)
+        self.montage_names = [self.montage_names[i] for i in keep]
+        self.montage_rows = [self.montage_rows[i] for i in keep]
+        self.montage_sizes = self.montage_sizes[keep]
+        self.montage_samples = samples[keep]
 
     def _calculate_batch_numbers(self):
-        total_batches = 0
-        self.group_batches_counter = {}
-        for montage, indices in self.montage_groups.items():
-            num_samples = len(indices)
-            if self.drop_last:
-                num_batches = num_samples // self.batch_size
-            else:
-                # this generates batches not full
-                num_batches = math.ceil(num_samples / self.batch_size)
-
-            self.group_batches_counter[montage] = num_batches
-            total_batches += num_batches
+        if self.drop_last:
+            group_batches = self.montage_samples // self.batch_size
+        else:
+            # this generates batches not full
+            group_batches = -(-self.montage_samples // self.batch_size)
+        self.group_batches_counter = dict(zip(self.montage_names, group_batches.tolist()))
+        total_batches = int(group_batches.sum())
 
         # make number of all batches can be evenly divisible by replicas
         remainder = total_batches % self.num_replicas
-        if remainder == 0:
+        if remainder == 0 or not self.even_batches:
             self.n_total_batches = total_batches
         else:
             self.n_total_batches = total_batches - remainder
 
-        assert self.n_total_batches >= self.num_replicas
-
-        self.num_rank_batches = self.n_total_batches // self.num_replicas
+        if self.even_batches:
+            assert self.n_total_batches >= self.num_replicas
+            self.num_rank_batches = self.n_total_batches // self.num_replicas
+        else:
+            self.num_rank_batches = len(range(self.rank, self.n_total_batches, self.num_replicas))
+
+        self.batch_offsets = np.concatenate([[0], np.cumsum(group_batches)])
+        # montages are shuffled with a permutation keyed by the seed, subsampled ones even without shuffle
+        self.montage_perms = [
+            IndexPermutation(int(size), (self.seed, montage_idx))
+            if self.shuffle or samples < size else None
+            for montage_idx, (size, samples) in enumerate(zip(self.montage_sizes, self.montage_samples))
+        ]
+
+        montage_datasets = [m.split('/')[0] for m in self.montage_names]
+        self.dataset_names = sorted(set(montage_datasets))
+        self.dataset_step_counts = {name: 0 for name in self.dataset_names}
+        self.montage_dataset = np.array([self.dataset_names.index(d) for d in montage_datasets], dtype=np.int64)
+
+    def _montage_indices(self, montage_idx: int, positions: np.ndarray) -> Tensor:
+        """Dataset indices at ``positions`` of the shuffled montage."""
+        if self.montage_perms[montage_idx] is not None:
+            positions = self.montage_perms[montage_idx](positions)
+        rows = self.montage_rows[montage_idx]
+        indices = rows + positions if isinstance(rows, int) else rows[positions]
+        return torch.from_numpy(indices.astype(np.int64))
 
     def _pre_gen_all_batches(self):
         all_batches: list[Tensor] = []
-        for montage, indices in self.montage_groups.items():
-            # shuffle in single montage
-            if self.shuffle:
-                perm = torch.randperm(len(indices), generator=self.generator).tolist()
-                indices = indices[perm]
+        for montage_idx, n_samples in enumerate(self.montage_samples.tolist()):
+            indices = self._montage_indices(montage_idx, np.arange(n_samples))
 
             # gen batches in this montage
-            batch_cnt = self.group_batches_counter[montage]
+            batch_cnt = self.group_batches_counter[self.montage_names[montage_idx]]
             indices_list = list(torch.split(indices, self.batch_size))[:batch_cnt]
             all_batches.extend(indices_list)
 
@@ -175,33 +275,289 @@ class DistributedGroupBatchSampler(Sampler):
 
         self.all_batches = all_batches[:self.n_total_batches]
 
+    def _prepare_lazy_batches(self):
+        """Nothing is materialized, every batch is computed from the seed when it is yielded.
+
+        Memory is independent of the number of batches, only montages that are not a contiguous run of rows
+        keep their rows.
+        """
+        logger.info(f'All batches num {int(self.batch_offsets[-1])}, used batches num {self.n_total_batches}')
+
+    def _get_lazy_batch(self, batch_id: int) -> Tensor:
+        montage_idx = int(np.searchsorted(self.batch_offsets, batch_id, side='right')) - 1
+        start = (batch_id - int(self.batch_offsets[montage_idx])) * self.batch_size
+        end = min(start + self.batch_size, int(self.montage_samples[montage_idx]))
+        return self._montage_indices(montage_idx, np.arange(start, end))
+
+    def _batch_datasets(self, batch_ids: np.ndarray) -> np.ndarray:
+        return self.montage_dataset[np.searchsorted(self.batch_offsets, batch_ids, side='right') - 1]
+
+    def _schedule_weights(self) -> np.ndarray:
+        n_samples = np.bincount(self.montage_dataset, weights=self.montage_samples, minlength=len(self.dataset_names))
+
+        if self.schedule == 'proportional':
+            weights = n_samples
+        elif self.schedule == 'temperature':
+            weights = n_samples ** (1.0 / self.temperature)
+        elif self.schedule == 'round_robin':
+            weights = np.ones_like(n_samples)
+        else:
+            missing = [name for name in self.dataset_names if name not in self.quotas]
+            if missing:
+                logger.warning(f'No quota for datasets {missing}, they will not be sampled')
+            weights = np.array([self.quotas.get(name, 0.0) for name in self.dataset_names], dtype=np.float64)
+            if (weights < 0).any() or weights.sum() <= 0:
+                raise ValueError(f'Quotas {self.quotas} must be non-negative with a positive one for {self.dataset_names}')
+        return weights / weights.sum()
+
+    def _scheduled_batch_ids(self) -> Tensor:
+        """Order of all batch ids of an epoch following the scheduling policy.
+
+        Every dataset receives a share of the epoch's steps according to its weight. Datasets with
+        fewer batches than their share are cycled through again, larger ones are subsampled.
+        """
+        quota = self.schedule_weights * self.n_total_batches
+        steps = np.floor(quota).astype(np.int64)
+        # largest remainder assignment of the leftover steps
+        for d in np.argsort(steps - quota, kind='stable')[:self.n_total_batches - steps.sum()]:
+            steps[d] += 1
+
+        batch_dataset = torch.from_numpy(self._batch_datasets(np.arange(self.n_total_batches)))
+        sequences, positions = [], []
+        for d, n_steps in enumerate(steps.tolist()):
+            ids = torch.nonzero(batch_dataset == d, as_tuple=True)[0]
+            if n_steps == 0 or len(ids) == 0:
+                continue
+            cycles = [
+                ids[torch.randperm(len(ids), generator=self.generator)] if self.shuffle else ids
+                for _ in range(math.ceil(n_steps / len(ids)))
+            ]
+            sequences.append(torch.cat(cycles)[:n_steps])
+            positions.append((torch.arange(n_steps, dtype=torch.float64) + 0.5) / n_steps)
+
+        batch_ids = torch.cat(sequences)
+        if self.shuffle and self.schedule != 'round_robin':
+            return batch_ids[torch.randperm(len(batch_ids), generator=self.generator)]
+        # spread every dataset evenly over the epoch, ties keep dataset order
+        return batch_ids[torch.argsort(torch.cat(positions), stable=True)]
+
+    def _iter_batches(self, batch_ids, order: Optional[IndexPermutation] = None, chunk_size: int = 1024):
+        # batch ids are resolved in chunks, with an order permutation only positions of the epoch are given
+        for start in range(0, len(batch_ids), chunk_size):
+            chunk = np.asarray(batch_ids[start:start + chunk_size], dtype=np.int64)
+            if order is not None:
+                chunk = order(chunk)
+            for batch_id, dataset_idx in zip(chunk.tolist(), self._batch_datasets(chunk).tolist()):
+                self.dataset_step_counts[self.dataset_names[dataset_idx]] += 1
+                yield self._get_lazy_batch(batch_id) if self.lazy else self.all_batches[batch_id]
+
     def set_epoch(self, epoch: int) -> None:
         self.epoch = epoch
         self.generator = torch.Generator()
         self.generator.manual_seed(self.seed + self.epoch)
+        # step counts are logged per epoch
+        self.dataset_step_counts = {name: 0 for name in self.dataset_names}
+
+    def _rank_share(self, batch_ids):
+        if not self.even_batches:
+            return batch_ids[self.rank::self.num_replicas]
+        return batch_ids[self.rank * self.num_rank_batches:(self.rank + 1) * self.num_rank_batches]
 
     def __iter__(self):
-        # shuffle batches among various montage
+        if self.schedule_weights is not None:
+            return self._iter_batches(self._rank_share(self._scheduled_batch_ids()).numpy())
+        positions = self._rank_share(range(self.n_total_batches))
         if self.shuffle:
-            perm = torch.randperm(len(self.all_batches), generator=self.generator)
-            all_batches = [self.all_batches[i] for i in perm]
-        else:
-            all_batches = self.all_batches
+            # shuffle batches among various montage, the epoch order is a permutation keyed by seed and epoch
+            return self._iter_batches(positions, IndexPermutation(self.n_total_batches, (self.seed, self.epoch, 1)))
+        return self._iter_batches(positions)
+
+    def __len__(self):
+        return self.num_rank_batches
+
+
+class ShardStreamDataset(IterableDataset):
+    """Stream montage-homogeneous batches from the middle parquet shards of the builders.
+
+    Shards are shuffled once per epoch with a generator shared by all ranks and dealt to ranks
+    greedily by window count, then round-robin to DataLoader workers. Each worker cycles over its
+    shards and draws whole batches from a bounded per-montage shuffle buffer, so the full Arrow set
+    never needs to be local. Every rank yields the same number of batches per epoch, and the
+    position inside an epoch can be restored with ``load_state_dict``.
+
+    Workers hold a copy of this object, so the loader must not use persistent workers, otherwise
+    ``set_epoch`` and ``load_state_dict`` do not reach them.
+    """
+
+    def __init__(
+            self,
+            shards: list[tuple[str, int]],
+            batch_size: int,
+            num_replicas: int = 1,
+            rank: int = 0,
+            shuffle: bool = True,
+            seed: int = 0,
+            buffer_size: int = 4096,
+            storage_options: Optional[dict] = None,
+    ):
+        super().__init__()
+        if len(shards) < num_replicas:
+            raise ValueError(f"Not enough shards ({len(shards)}) for {num_replicas} replicas")
+
+        self.shards = shards
+        self.batch_size = batch_size
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.seed = seed
+        self.buffer_size = max(buffer_size, batch_size)
+        self.storage_options = storage_options
+
+        self.epoch = 0
+        self.start_step = 0
+
+        n_windows = sum(cnt for _, cnt in shards)
+        self.num_rank_batches = math.ceil(n_windows / (self.batch_size * self.num_replicas))
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+        self.start_step = 0
 
-        return iter(all_batches[self.rank * self.num_rank_batches : (self.rank+1) * self.num_rank_batches])
+    def state_dict(self, step: int) -> dict:
+        """Position after ``step`` batches of the current epoch were consumed on this rank."""
+        return {'epoch': self.epoch, 'step': step}
+
+    def load_state_dict(self, state: dict) -> None:
+        self.epoch = state['epoch']
+        self.start_step = state['step']
 
     def __len__(self):
         return self.num_rank_batches
 
+    def _assign_rank_shards(self) -> list[tuple[str, int]]:
+        order = np.arange(len(self.shards))
+        if self.shuffle:
+            order = np.random.default_rng([self.seed, self.epoch]).permutation(order)
+
+        # greedy balance of window counts across ranks, all ranks compute the same assignment
+        loads = np.zeros(self.num_replicas, dtype=np.int64)
+        rank_shards: list[list[tuple[str, int]]] = [[] for _ in range(self.num_replicas)]
+        for shard_idx in order:
+            target = int(np.argmin(loads))
+            rank_shards[target].append(self.shards[shard_idx])
+            loads[target] += self.shards[shard_idx][1]
+
+        return rank_shards[self.rank]
+
+    def _read_shard(self, path: str, fs: Optional[s3fs.S3FileSystem]) -> Iterator[dict]:
+        with (fs.open(path, 'rb') if fs else open(path, 'rb')) as f:
+            table = pq.read_table(f, use_threads=False)
+
+        montage = table.column('montage')[0].as_py()
+        chs = np.asarray(table.column('chs')[0].as_py(), dtype=np.int32)
+        data = np.asarray(table.column('data').combine_chunks().flatten(), dtype=np.float32)
+        data = data.reshape(table.num_rows, len(chs), -1)
+        task = table.column('task').to_numpy()
+        label = table.column('label').to_numpy() if 'label' in table.column_names else None
+
+        for idx in range(table.num_rows):
+            row = {'data': data[idx], 'chs': chs, 'task': task[idx], 'montage': montage}
+            if label is not None:
+                row['label'] = label[idx]
+            yield row
+
+    def _collate(self, rows: list[dict]) -> dict:
+        batch = {
+            'data': torch.from_numpy(np.stack([row['data'] for row in rows])),
+            'chs': torch.from_numpy(np.stack([row['chs'] for row in rows])),
+            'task': torch.tensor(np.array([row['task'] for row in rows], dtype=np.int32)),
+            'montage': [row['montage'] for row in rows],
+        }
+        if 'label' in rows[0]:
+            batch['label'] = torch.tensor(np.array([row['label'] for row in rows], dtype=np.int64))
+        return batch
 
-def assign_sampler_and_loader(dataset: datasets.Dataset, args: AbstractConfig, world_size: int, rank: int,):
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id, num_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+        # DataLoader fetches from workers round-robin starting at worker 0, so global batch k is
+        # assigned to logical worker k % num_workers and the rotation is shifted on resumption
+        worker_id = (worker_id + self.start_step) % num_workers
+
+        rank_shards = self._assign_rank_shards()
+        worker_shards = rank_shards[worker_id::num_workers]
+        if not worker_shards:
+            logger.warning(f'Rank {self.rank} has fewer shards than workers, worker {worker_id} reuses a shard')
+            worker_shards = [rank_shards[worker_id % len(rank_shards)]]
+
+        n_batches = len(range(worker_id, self.num_rank_batches, num_workers))
+        n_skip = len(range(worker_id, self.start_step, num_workers))
+
+        fs = s3fs.S3FileSystem(**self.storage_options) if self.storage_options else None
+        buffers: dict[str, list[dict]] = {}
+        n_buffered = 0
+        n_emitted = 0
+        n_pass = 0
+        while n_emitted < n_batches:
+            rng = np.random.default_rng([self.seed, self.epoch, self.rank, worker_id, n_pass])
+            shard_order = rng.permutation(len(worker_shards)) if self.shuffle else range(len(worker_shards))
+            for shard_idx in shard_order:
+                for row in self._read_shard(worker_shards[shard_idx][0], fs):
+                    buffers.setdefault(row['montage'], []).append(row)
+                    n_buffered += 1
+
+                    while n_buffered >= self.buffer_size and n_emitted < n_batches:
+                        ready = [m for m, rows in buffers.items() if len(rows) >= self.batch_size]
+                        if not ready:
+                            break
+                        # pick a montage proportionally to its buffered rows, then a random batch inside it
+                        sizes = np.array([len(buffers[m]) for m in ready], dtype=np.float64)
+                        montage = ready[rng.choice(len(ready), p=sizes / sizes.sum())]
+                        rows = buffers[montage]
+                        picked = set(rng.choice(len(rows), self.batch_size, replace=False).tolist()) \
+                            if self.shuffle else set(range(self.batch_size))
+                        batch_rows = [rows[i] for i in sorted(picked)]
+                        buffers[montage] = [row for i, row in enumerate(rows) if i not in picked]
+                        n_buffered -= self.batch_size
+
+                        n_emitted += 1
+                        if n_emitted > n_skip:
+                            yield self._collate(batch_rows)
+                if n_emitted >= n_batches:
+                    break
+            n_pass += 1
+
+
+def list_stream_shards(
+        dataset_names: list[str],
+        builder_configs: list[str],
+        split: datasets.NamedSplit = datasets.Split.TRAIN,
+) -> tuple[list[tuple[str, int]], Optional[dict]]:
+    split_name = {'train': 'train', 'validation': 'valid', 'test': 'test'}[str(split)]
+    shards, storage_options = [], None
+    for ds_name, ds_config in zip(dataset_names, builder_configs):
+        builder = DATASET_SELECTOR[ds_name](config_name=ds_config)
+        shards.extend(builder.list_middle_shards(split_name))
+        if builder.config.is_remote_fs:
+            storage_options = builder.s3_conf
+    return shards, storage_options
+
+
+def assign_sampler_and_loader(
+        dataset: datasets.Dataset,
+        args: AbstractConfig,
+        world_size: int,
+        rank: int,
+        eeg_index: Optional[ConcatEEGIndex] = None,
+):
     sampler = DistributedGroupBatchSampler(
         dataset=dataset,
         batch_size=args.data.batch_size,
         sample_ratio=args.data.sample_ratio,
         num_replicas=world_size,
         rank=rank,
-        seed=args.seed
+        seed=args.seed,
+        eeg_index=eeg_index,
     )
     loader = DataLoader(
         dataset,
@@ -223,16 +579,49 @@ def create_pretrain_concat_loader(
     else:
         raise ValueError(f"Create pretrain loader for stage {args.stage}")
 
-    dataset, _ = load_concat_eeg_datasets(
+    dataset, _, index = load_concat_eeg_datasets(
         dataset_list,
         builder_configs=builder_configs,
         split=split,
-        weight_option='statistics'
+        weight_option='statistics',
+        return_index=True,
     )
-    sampler, loader = assign_sampler_and_loader(dataset, args, world_size, rank)
+    sampler, loader = assign_sampler_and_loader(dataset, args, world_size, rank, eeg_index=index)
     return dataset, sampler, loader
 
 
+def create_pretrain_stream_loader(
+        args: AbstractConfig,
+        world_size: int,
+        rank: int,
+        split: datasets.Split=datasets.Split.TRAIN
+) -> tuple[ShardStreamDataset, ShardStreamDataset, DataLoader]:
+    """Streaming counterpart of ``create_pretrain_concat_loader`` reading the middle parquet shards.
+
+    The dataset takes the role of the sampler: call ``set_epoch`` on it before every epoch.
+    """
+    dataset_list = list(args.data.datasets)
+    builder_configs = ['pretrain' for _ in range(len(dataset_list))]
+    shards, storage_options = list_stream_shards(dataset_list, builder_configs, split)
+
+    dataset = ShardStreamDataset(
+        shards=shards,
+        batch_size=args.data.batch_size,
+        num_replicas=world_size,
+        rank=rank,
+        seed=args.seed,
+        buffer_size=args.data.stream_buffer_size,
+        storage_options=storage_options,
+    )
+    loader = DataLoader(
+        dataset,
+        batch_size=None,
+        num_workers=args.data.num_workers,
+        persistent_workers=False,
+    )
+    return dataset, dataset, loader
+
+
 def create_finetune_single_loader(
         args: AbstractConfig,
         ds_name: str,
@@ -240,21 +629,20 @@ def create_finetune_single_loader(
         world_size: int,
         rank: int,
         split: datasets.Split,
-        add_ds_name: bool = False,
 ):
     if args.stage != TrainStage.FINETUNE:
         raise ValueError(f"Create finetune loader for stage {args.stage}")
 
     assert ds_name in args.finetune.datasets.keys() and ds_config == args.finetune.datasets[ds_name]
-    dataset, weight = load_concat_eeg_datasets(
+    dataset, weight, index = load_concat_eeg_datasets(
         [ds_name],
         builder_configs=[ds_config],
         split=split,
         weight_option='statistics',
-        add_ds_name=add_ds_name
+        return_index=True,
     )
 
-    sampler, loader = assign_sampler_and_loader(dataset, args, world_size, rank)
+    sampler, loader = assign_sampler_and_loader(dataset, args, world_size, rank, eeg_index=index)
     return dataset, sampler, loader, weight
 
 
@@ -268,16 +656,16 @@ def create_finetune_mixed_loader(
         raise ValueError(f"Create finetune loader for stage {args.stage}")
     dataset_dict = args.finetune.datasets
 
-    dataset, weights = load_concat_eeg_datasets(
+    dataset, weights, index = load_concat_eeg_datasets(
         dataset_dict.keys(),
         builder_configs=dataset_dict.values(),
         split=split,
         weight_option=args.finetune.loss_weight_type,
-        add_ds_name=True,
-        cast_label=True
+        cast_label=True,
+        return_index=True,
     )
 
-    sampler, loader = assign_sampler_and_loader(dataset, args, world_size, rank)
+    sampler, loader = assign_sampler_and_loader(dataset, args, world_size, rank, eeg_index=index)
     return dataset, sampler, loader, weights
 
 
@@ -293,7 +681,7 @@ def create_finetune_loader_list(
     dataset_list, sampler_list, loader_list, weight_list = [], [], [], []
     for dataset_name, config_name in args.finetune.datasets.items():
         dataset, sampler, loader, distribution = create_finetune_single_loader(
-            args, dataset_name, config_name, world_size, rank, split, add_ds_name=True)
+            args, dataset_name, config_name, world_size, rank, split)
         dataset_list.append(dataset)
         sampler_list.append(sampler)
         loader_list.append(loader)
@@ -15,6 +15,8 @@ import datasets
 import mne
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 import s3fs
 from datasets import BuilderConfig, utils, DownloadManager, StreamingDownloadManager, SplitGenerator
@@ -260,6 +262,93 @@ class EEGDatasetBuilder(datasets.GeneratorBasedBuilder, ABC):
             logger.error(f"Error generating examples: {str(e)}")
             raise e
 
+    def download_and_prepare(self, *args, **kwargs):
+        super().download_and_prepare(*args, **kwargs)
+        self.write_sidecar_index()
+
+    # Sidecar index: integer montage/label/subject arrays next to the Arrow files, loaded via memmap
+    @property
+    def sidecar_dir(self) -> str:
+        return os.path.join(self.cache_dir, 'eeg_index')
+
+    @property
+    def sidecar_montages(self) -> list[str]:
+        return [f'{self.config.dataset_name}/{montage}' for montage in self.config.montage.keys()]
+
+    def _load_subject_by_key(self) -> dict[str, str]:
+        if not os.path.exists(self.info_csv_path):
+            return {}
+        info_df = pd.read_csv(self.info_csv_path, usecols=['path', 'subject'])
+        return {
+            f'{self._encode_path(path)}.parquet': str(subject)
+            for path, subject in zip(info_df['path'], info_df['subject'])
+        }
+
+    def build_sidecar_arrays(self, split: str, subject_by_key: Optional[dict[str, str]] = None) -> dict[str, ndarray]:
+        """Compute the index arrays of a split with Arrow compute kernels, without Python row objects."""
+        table = self.as_dataset(split=split).data
+        montage_id = pc.index_in(table.column('montage'), value_set=pa.array(self.sidecar_montages))
+        if montage_id.null_count:
+            unknown = pc.unique(pc.filter(table.column('montage'), pc.is_null(montage_id))).to_pylist()
+            raise ValueError(f'Montages {unknown} of {self.dataset_name} {split} are not in the builder config')
+        arrays = {'montage': montage_id.to_numpy().astype(np.int16)}
+        if 'label' in table.column_names:
+            arrays['label'] = table.column('label').to_numpy().astype(np.int32)
+
+        # sample_id is '<sha512 of raw path>.parquet_<window idx>', the prefix maps the window to its file
+        subject_by_key = subject_by_key if subject_by_key is not None else self._load_subject_by_key()
+        if subject_by_key:
+            keys = pc.utf8_slice_codeunits(table.column('sample_id'), 0, 128 + len('.parquet'))
+            file_keys = list(subject_by_key.keys())
+            subject_ids = {subject: idx for idx, subject in enumerate(sorted(set(subject_by_key.values())))}
+            # unknown files point at the trailing -1 entry
+            subject_of_file = np.array([subject_ids[subject_by_key[k]] for k in file_keys] + [-1], dtype=np.int32)
+            file_idx = pc.fill_null(pc.index_in(keys, value_set=pa.array(file_keys)), len(file_keys))
+            arrays['subject'] = subject_of_file[file_idx.to_numpy()]
+        else:
+            arrays['subject'] = np.full(table.num_rows, -1, dtype=np.int32)
+        return arrays
+
+    def _sidecar_montages_match(self) -> bool:
+        """Whether the montage ids of the sidecar index were written for the montages of the current config."""
+        vocab_path = os.path.join(self.sidecar_dir, 'vocab.json')
+        if not os.path.exists(vocab_path):
+            return False
+        with open(vocab_path) as f:
+            if json.load(f)['montage'] == self.sidecar_montages:
+                return True
+        logger.warning(f'Montages of {self.dataset_name} changed since its sidecar index was written')
+        return False
+
+    def write_sidecar_index(self, overwrite: bool = False):
+        if '://' in self.cache_dir:
+            return
+        os.makedirs(self.sidecar_dir, exist_ok=True)
+        # ids of another montage list would point at the wrong montages
+        overwrite = overwrite or not self._sidecar_montages_match()
+
+        subject_by_key = self._load_subject_by_key()
+        for split in self.info.splits.keys():
+            if not overwrite and os.path.exists(os.path.join(self.sidecar_dir, f'{split}_montage.npy')):
+                continue
+            for field_name, array in self.build_sidecar_arrays(split, subject_by_key).items():
+                np.save(os.path.join(self.sidecar_dir, f'{split}_{field_name}.npy'), array)
+            logger.info(f'Sidecar index of {self.dataset_name} {self.config.name} {split} written')
+
+        with open(os.path.join(self.sidecar_dir, 'vocab.json'), 'w') as f:
+            json.dump({'montage': self.sidecar_montages, 'subject': sorted(set(subject_by_key.values()))}, f)
+
+    def load_sidecar_index(self, split: str) -> Optional[dict[str, ndarray]]:
+        """Memory-map the index arrays of a split, None if they were not written or the montages changed since."""
+        if not self._sidecar_montages_match():
+            return None
+        arrays = {}
+        for field_name in ('montage', 'label', 'subject'):
+            path = os.path.join(self.sidecar_dir, f'{split}_{field_name}.npy')
+            if os.path.exists(path):
+                arrays[field_name] = np.load(path, mmap_mode='r')
+        return arrays if 'montage' in arrays else None
+
     def preproc(self, n_proc: Optional[int] = None):
         if self._is_preproc_cached():
             logger.info(f'Using cached summary info at {self.info_csv_path}')
@@ -446,6 +535,12 @@ class EEGDatasetBuilder(datasets.GeneratorBasedBuilder, ABC):
             'cnt': [len(examples)],})
         return mid_df
     
+    def list_middle_shards(self, split: str) -> list[tuple[str, int]]:
+        """List the persisted parquet shards of a split ('train', 'valid' or 'test') with their window counts."""
+        mid_df = pd.read_csv(self.mid_file_csv_path)
+        mid_df = mid_df[mid_df['split'] == split]
+        return [(self._build_output_dir(split, key), int(cnt)) for key, cnt in zip(mid_df['key'], mid_df['cnt'])]
+
     def _apply_random_dropout(self, examples, data_dropout_rate: float, data_dropout_seed: int) -> dict:
         """Apply random dropout to the data based on the config settings."""
         
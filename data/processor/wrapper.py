@@ -1,11 +1,15 @@
+import hashlib
 import logging
-from typing import Type
+from dataclasses import dataclass
+from typing import Type, Union, Optional, Sequence
 
 import datasets
+import numpy as np
 import torch
 from datasets import Dataset, concatenate_datasets, Value
+from numpy import ndarray
 from torch import Tensor
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Dataset as TorchDataset
 
 from data.dataset.adftd import AdftdBuilder
 from data.dataset.bcic.bcic_1a import BCIC1ABuilder
@@ -111,30 +115,127 @@ def get_dataset_montage(dataset_name: str, config_name: str) -> dict[str, list[s
 
     return montages
 
+def get_dataset_n_sample(
+        dataset_name: str,
+        config_name: str,
+        split: datasets.NamedSplit = datasets.Split.TRAIN,
+        exp_name: str = None,
+        exp_config: dict = None,
+) -> int:
+    builder_cls = DATASET_SELECTOR[dataset_name]
+    builder: EEGDatasetBuilder = builder_cls(config_name=config_name, exp_name=exp_name, exp_config=exp_config)
+    splits = builder.info.splits
+    if splits and str(split) in splits:
+        return splits[str(split)].num_examples
+    return len(builder.as_dataset(split=split))
+
+
+@dataclass
+class ConcatEEGIndex:
+    """Integer index of a concatenated split.
+
+    Montage id, label and subject id are stored per row, datasets only as row offsets, so the
+    dataset of a row is resolved by a binary search instead of a materialized ``ds_name`` column.
+    Subject ids are local to their dataset.
+    """
+    ds_names: list[str]
+    ds_offsets: ndarray
+    montage_names: list[str]
+    montage_id: ndarray
+    label: Optional[ndarray] = None
+    subject_id: Optional[ndarray] = None
+
+    def __len__(self):
+        return int(self.ds_offsets[-1])
+
+    def ds_id(self, idx: Union[int, ndarray]) -> Union[int, ndarray]:
+        return np.searchsorted(self.ds_offsets, idx, side='right') - 1
+
+    def ds_name(self, idx: int) -> str:
+        return self.ds_names[int(self.ds_id(idx))]
+
+    def select(self, indices: Union[Sequence[int], ndarray]) -> 'ConcatEEGIndex':
+        """Index of the rows ``indices``, matching ``Dataset.select`` with the same sorted indices."""
+        indices = np.asarray(indices, dtype=np.int64)
+        ds_counts = np.bincount(self.ds_id(indices), minlength=len(self.ds_names))
+        return ConcatEEGIndex(
+            ds_names=self.ds_names,
+            ds_offsets=np.concatenate([[0], np.cumsum(ds_counts)]),
+            montage_names=self.montage_names,
+            montage_id=np.asarray(self.montage_id)[indices],
+            label=np.asarray(self.label)[indices] if self.label is not None else None,
+            subject_id=np.asarray(self.subject_id)[indices] if self.subject_id is not None else None,
+        )
+
+
+def _build_concat_index(ds_names: list[str], arrays: list[dict[str, ndarray]], montages: list[list[str]]):
+    # an id outside the montages of its dataset would be shifted into the range of another one
+    for ds_name, a, m in zip(ds_names, arrays, montages):
+        if len(a['montage']) and (a['montage'].min() < 0 or a['montage'].max() >= len(m)):
+            raise ValueError(f'Montage index of {ds_name} holds ids outside its {len(m)} montages, rebuild its sidecar index')
+
+    montage_offsets = np.cumsum([0] + [len(m) for m in montages])
+    montage_id = [a['montage'].astype(np.int32) + offset for a, offset in zip(arrays, montage_offsets)]
+    has_label = all('label' in a for a in arrays)
+
+    if len(arrays) == 1:
+        # keep the memory maps of a single dataset untouched
+        return ConcatEEGIndex(
+            ds_names=ds_names,
+            ds_offsets=np.array([0, len(arrays[0]['montage'])]),
+            montage_names=montages[0],
+            montage_id=arrays[0]['montage'],
+            label=arrays[0]['label'] if has_label else None,
+            subject_id=arrays[0].get('subject'),
+        )
+
+    return ConcatEEGIndex(
+        ds_names=ds_names,
+        ds_offsets=np.cumsum([0] + [len(a['montage']) for a in arrays]),
+        montage_names=[name for m in montages for name in m],
+        montage_id=np.concatenate(montage_id),
+        label=np.concatenate([a['label'] for a in arrays]) if has_label else None,
+        subject_id=np.concatenate([a['subject'] for a in arrays]) if all('subject' in a for a in arrays) else None,
+    )
+
 
 def load_concat_eeg_datasets(
         dataset_names: list[str],
         builder_configs: list[str],
         split: datasets.NamedSplit = datasets.Split.TRAIN,
         weight_option: str = 'statistics',
-        add_ds_name: bool = False,
         cast_label: bool = False,
         exp_name: str = None,
         exp_config: dict = None,
-) -> tuple[Dataset, list[Tensor]]:
+        in_memory: bool = False,
+        in_memory_max_gb: float = 4.0,
+        return_index: bool = False,
+):
+    """Load and concatenate the splits of several datasets.
+
+    Labels and montages are read from the sidecar index written at ``download_and_prepare``,
+    or computed with Arrow kernels for sets prepared before it existed. With ``return_index``
+    the ``ConcatEEGIndex`` of the result is returned as third element.
+    """
     dataset_list = []
     weight_list = []
+    index_names, index_arrays, index_montages = [], [], []
     for ds_name, ds_config in zip(dataset_names, builder_configs):
         try:
             builder_cls = DATASET_SELECTOR[ds_name]
             builder = builder_cls(config_name=ds_config, exp_name=exp_name, exp_config=exp_config)
             # noinspection PyTypeChecker
             dataset: Dataset = builder.as_dataset(split=split)
-            if add_ds_name:
-                dataset = dataset.add_column('ds_name', [ds_name for _ in range(len(dataset))])
+
+            arrays = builder.load_sidecar_index(str(split))
+            if arrays is None:
+                arrays = builder.build_sidecar_arrays(str(split))
+            index_names.append(ds_name)
+            index_arrays.append(arrays)
+            index_montages.append(builder.sidecar_montages)
 
             if 'label' in dataset.column_names:
-                label = torch.tensor(dataset['label'], dtype=torch.int32)
+                label = torch.from_numpy(np.asarray(arrays['label'], dtype=np.int64))
                 label_cnt = torch.bincount(label, minlength=get_dataset_n_class(ds_name, ds_config))
                 log.info(f'Sample distribution for {ds_name}-{ds_config} {split}: {label_cnt}')
                 weight = calc_distribution_weight(len(dataset), label_cnt, weight_option)
@@ -150,7 +251,138 @@ def load_concat_eeg_datasets(
 
     combined_dataset: Dataset = concatenate_datasets(dataset_list)
     # combined_dataset = combined_dataset.flatten_indices()
-    return combined_dataset.with_format('torch'), weight_list
+    combined_dataset = combined_dataset.with_format('torch')
+    if in_memory:
+        combined_dataset = materialize_eeg_dataset(combined_dataset, in_memory_max_gb)
+
+    if return_index:
+        return combined_dataset, weight_list, _build_concat_index(index_names, index_arrays, index_montages)
+    return combined_dataset, weight_list
+
+
+class InMemoryEEGDataset(TorchDataset):
+    """A split materialized into contiguous tensors, grouped by montage.
+
+    Samples sharing a montage have identical shapes, so each montage is stored as one
+    [n_sample, n_channel, n_timepoint] tensor. Rows are addressed through montage id and
+    the position inside that montage block. Rows are returned in the same layout as the
+    torch-formatted Arrow dataset, so adapters and samplers need no change.
+    """
+
+    def __init__(self, dataset: Dataset):
+        meta_columns = [c for c in ('sample_id', 'task', 'montage', 'label') if c in dataset.column_names]
+        meta = dataset.select_columns(meta_columns)[:]
+
+        montages: list[str] = list(meta['montage'])
+        self.montage_names: list[str] = sorted(set(montages))
+        montage_to_id = {name: idx for idx, name in enumerate(self.montage_names)}
+
+        self.montage_id = torch.tensor([montage_to_id[m] for m in montages], dtype=torch.long)
+        self.local_index = torch.empty_like(self.montage_id)
+        self.task = torch.as_tensor(meta['task'], dtype=torch.int32)
+        self.label: Optional[Tensor] = torch.as_tensor(meta['label'], dtype=torch.int64) if 'label' in meta else None
+        self.sample_id: Optional[list[str]] = list(meta['sample_id']) if 'sample_id' in meta else None
+        # identifies the rows for caches keyed on the dataset content, like ``Dataset._fingerprint``
+        self._fingerprint: Optional[str] = getattr(dataset, '_fingerprint', None)
+
+        self.data: list[Tensor] = []
+        self.chs: list[Tensor] = []
+        for montage_idx in range(len(self.montage_names)):
+            indices = torch.nonzero(self.montage_id == montage_idx, as_tuple=True)[0]
+            self.local_index[indices] = torch.arange(len(indices))
+
+            subset = dataset.select(indices.tolist()).select_columns(['data', 'chs'])[:]
+            data = subset['data']
+            if isinstance(data, list):
+                data = torch.stack(data)
+            self.data.append(data.to(torch.float32).contiguous())
+            self.chs.append(torch.as_tensor(subset['chs'][0]).clone())
+
+    def select(self, indices: Union[Sequence[int], Tensor]) -> 'InMemoryEEGDataset':
+        """Subset of rows, sharing the montage blocks with this dataset."""
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        subset = object.__new__(InMemoryEEGDataset)
+        subset.montage_names = self.montage_names
+        subset.montage_id = self.montage_id[indices]
+        subset.local_index = self.local_index[indices]
+        subset.task = self.task[indices]
+        subset.label = self.label[indices] if self.label is not None else None
+        subset.sample_id = [self.sample_id[i] for i in indices.tolist()] if self.sample_id is not None else None
+        subset.data = self.data
+        subset.chs = self.chs
+        subset._fingerprint = hashlib.sha256(f'{self._fingerprint}'.encode() + indices.numpy().tobytes()).hexdigest()[:16]
+        return subset
+
+    def share_memory_(self) -> 'InMemoryEEGDataset':
+        """Move all tensors to shared memory so that DataLoader workers map them instead of copying."""
+        for tensor in [*self.data, *self.chs, self.montage_id, self.local_index, self.task]:
+            tensor.share_memory_()
+        if self.label is not None:
+            self.label.share_memory_()
+        return self
+
+    @property
+    def column_names(self) -> list[str]:
+        names = ['data', 'chs', 'task', 'montage']
+        if self.label is not None:
+            names.append('label')
+        if self.sample_id is not None:
+            names.insert(0, 'sample_id')
+        return names
+
+    @property
+    def nbytes(self) -> int:
+        return sum(data.numel() * data.element_size() for data in self.data)
+
+    def __len__(self):
+        return len(self.montage_id)
+
+    def _get_column(self, name: str):
+        if name == 'montage':
+            return [self.montage_names[i] for i in self.montage_id.tolist()]
+        if name == 'task':
+            return self.task
+        if name == 'label' and self.label is not None:
+            return self.label
+        if name == 'sample_id' and self.sample_id is not None:
+            return self.sample_id
+        raise KeyError(f'Column {name} is not available in memory')
+
+    def __getitem__(self, idx: Union[int, str]):
+        if isinstance(idx, str):
+            return self._get_column(idx)
+
+        montage_idx = int(self.montage_id[idx])
+        local_idx = int(self.local_index[idx])
+        row = {
+            'data': self.data[montage_idx][local_idx],
+            'chs': self.chs[montage_idx],
+            'task': self.task[idx],
+            'montage': self.montage_names[montage_idx],
+        }
+        if self.label is not None:
+            row['label'] = self.label[idx]
+        if self.sample_id is not None:
+            row['sample_id'] = self.sample_id[idx]
+        return row
+
+
+def materialize_eeg_dataset(
+        dataset: Dataset,
+        max_gb: float = 4.0,
+) -> Union[Dataset, InMemoryEEGDataset]:
+    """Load a split into RAM when its Arrow footprint is below ``max_gb``, otherwise keep it as is."""
+    size_gb = dataset.data.nbytes / 1024 ** 3
+    if size_gb > max_gb:
+        log.info(f'Dataset of {size_gb:.2f} GB exceeds the in-memory limit of {max_gb:.2f} GB, '
+                 f'falling back to Arrow')
+        return dataset
+
+    memory_dataset = InMemoryEEGDataset(dataset)
+    log.info(f'Materialized {len(memory_dataset)} samples into memory '
+             f'({memory_dataset.nbytes / 1024 ** 3:.2f} GB, {len(memory_dataset.montage_names)} montages)')
+    return memory_dataset
+
 
 def calc_distribution_weight(n: int, label_cnt: Tensor, option: str):
     if option == 'statistics':
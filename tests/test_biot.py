@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import torch
+
+from baseline.biot.model import BIOTEncoder
+from benchmark.biot import loop_channel_embedding, loop_forward
+
+
+def make_encoder(n_channels: int, offset: int) -> BIOTEncoder:
+    torch.manual_seed(0)
+    return BIOTEncoder(heads=4, depth=1, n_channels=n_channels + offset).eval()
+
+
+@pytest.mark.parametrize('n_channels', [1, 5])
+@pytest.mark.parametrize('offset', [0, 3])
+@torch.no_grad()
+def test_batched_channel_embedding_matches_channel_loop(n_channels, offset):
+    encoder = make_encoder(n_channels, offset)
+    x = torch.randn(3, n_channels, 1000)
+
+    torch.testing.assert_close(
+        encoder.channel_embedding(x, n_channel_offset=offset), loop_channel_embedding(encoder, x, offset),
+    )
+    torch.testing.assert_close(encoder(x, n_channel_offset=offset), loop_forward(encoder, x, offset))
+
+
+@pytest.mark.parametrize('offset', [0, 3])
+@torch.no_grad()
+def test_perturbed_sequence_matches_channel_loop(offset):
+    encoder = make_encoder(4, offset)
+    x = torch.randn(2, 4, 1000)
+
+    np.random.seed(7)
+    perturbed = encoder.channel_embedding(x, n_channel_offset=offset, perturb=True)
+    np.random.seed(7)
+    reference = loop_channel_embedding(encoder, x, offset, perturb=True)
+    # every channel keeps fewer time steps than it has
+    assert perturbed.shape[1] < 4 * 9
+    torch.testing.assert_close(perturbed, reference)
+
+    np.random.seed(7)
+    output = encoder(x, n_channel_offset=offset, perturb=True)
+    np.random.seed(7)
+    torch.testing.assert_close(output, loop_forward(encoder, x, offset, perturb=True))
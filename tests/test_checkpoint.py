@@ -0,0 +1,35 @@
+import torch
+
+from baseline.abstract.checkpoint import CheckpointWriter
+
+
+def epoch_files(directory):
+    return sorted(path.name for path in directory.glob('*_epoch_*.pt'))
+
+
+def write_epochs(writer, directory, epochs, scores):
+    for epoch in epochs:
+        writer.save({'epoch': epoch, 'weight': torch.full((4,), float(epoch))},
+                    directory / f'toy_a_epoch_{epoch}.pt', score=scores[epoch])
+    writer.wait()
+
+
+def test_retention_prunes_checkpoints_of_an_earlier_run(tmp_path):
+    scores = {1: 0.2, 2: 0.9, 3: 0.4, 4: 0.3, 5: 0.5, 6: 0.1}
+    # another model's checkpoints in the same directory are left alone
+    torch.save({'epoch': 1}, tmp_path / 'other_a_epoch_1.pt')
+
+    write_epochs(CheckpointWriter(asynchronous=False, keep_last=2, keep_best=1), tmp_path, [1, 2, 3], scores)
+    assert epoch_files(tmp_path) == ['other_a_epoch_1.pt', 'toy_a_epoch_2.pt', 'toy_a_epoch_3.pt']
+
+    # a restarted process continues the retention of the files on disk
+    write_epochs(CheckpointWriter(asynchronous=True, keep_last=2, keep_best=1), tmp_path, [4, 5, 6], scores)
+    assert epoch_files(tmp_path) == ['other_a_epoch_1.pt', 'toy_a_epoch_2.pt', 'toy_a_epoch_5.pt', 'toy_a_epoch_6.pt']
+    assert torch.load(tmp_path / 'toy_a_epoch_2.pt', weights_only=False)['retention_score'] == 0.9
+
+
+def test_rewritten_epoch_replaces_its_history_entry(tmp_path):
+    scores = {1: 0.5, 2: 0.6}
+    write_epochs(CheckpointWriter(asynchronous=False, keep_last=2), tmp_path, [1, 2], scores)
+    write_epochs(CheckpointWriter(asynchronous=False, keep_last=2), tmp_path, [2], scores)
+    assert epoch_files(tmp_path) == ['toy_a_epoch_1.pt', 'toy_a_epoch_2.pt']
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from data.processor.wrapper import _build_concat_index
+
+
+def test_montage_ids_are_offset_per_dataset():
+    arrays = [{'montage': np.array([1, 0, 1], dtype=np.int16)}, {'montage': np.array([0, 2], dtype=np.int16)}]
+    index = _build_concat_index(['a', 'b'], arrays, [['a/x', 'a/y'], ['b/x', 'b/y', 'b/z']])
+    assert [index.montage_names[i] for i in index.montage_id] == ['a/y', 'a/x', 'a/y', 'b/x', 'b/z']
+    assert [index.ds_name(i) for i in range(len(index))] == ['a', 'a', 'a', 'b', 'b']
+
+
+@pytest.mark.parametrize('n_datasets', [1, 2])
+@pytest.mark.parametrize('bad_id', [-1, 2])
+def test_unknown_montage_ids_are_rejected(n_datasets, bad_id):
+    arrays = [{'montage': np.array([0, 1], dtype=np.int16)} for _ in range(n_datasets)]
+    arrays[-1]['montage'][0] = bad_id
+    names = [f'd{i}' for i in range(n_datasets)]
+    with pytest.raises(ValueError, match=names[-1]):
+        _build_concat_index(names, arrays, [[f'{name}/x', f'{name}/y'] for name in names])
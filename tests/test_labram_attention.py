@@ -0,0 +1,55 @@
+import pytest
+import torch
+
+from benchmark.attention import build_attention, explicit_attention, explicit_attention_weights
+
+
+N_CHANNELS, N_PATCHES, DIM, NUM_HEADS = 3, 4, 32, 4
+N_TOKENS = N_CHANNELS * N_PATCHES + 1
+
+
+def make_inputs(window_size, with_rel_pos_bias: bool):
+    torch.manual_seed(0)
+    attn = build_attention(DIM, NUM_HEADS, window_size, torch.device('cpu'))
+    x = torch.randn(2, N_TOKENS, DIM)
+    rel_pos_bias = torch.randn(1, NUM_HEADS, N_TOKENS, N_TOKENS) if with_rel_pos_bias else None
+    return attn, x, rel_pos_bias
+
+
+@pytest.mark.parametrize('window_size', [None, (N_CHANNELS, N_PATCHES)])
+@pytest.mark.parametrize('with_rel_pos_bias', [False, True])
+def test_fused_attention_matches_explicit_attention(window_size, with_rel_pos_bias):
+    attn, x, rel_pos_bias = make_inputs(window_size, with_rel_pos_bias)
+
+    grads = []
+    outputs = []
+    for forward in (attn, lambda *args: explicit_attention(attn, *args)):
+        attn.zero_grad()
+        x_grad = x.clone().requires_grad_()
+        bias_grad = rel_pos_bias.clone().requires_grad_() if rel_pos_bias is not None else None
+        out = forward(x_grad, bias_grad)
+        out.pow(2).sum().backward()
+        outputs.append(out.detach())
+        grads.append([x_grad.grad] + [p.grad.clone() for p in attn.parameters() if p.grad is not None]
+                     + ([bias_grad.grad] if bias_grad is not None else []))
+
+    torch.testing.assert_close(outputs[0], outputs[1])
+    assert len(grads[0]) == len(grads[1])
+    for grad, ref_grad in zip(*grads):
+        torch.testing.assert_close(grad, ref_grad)
+
+
+@pytest.mark.parametrize('window_size', [None, (N_CHANNELS, N_PATCHES)])
+@pytest.mark.parametrize('with_rel_pos_bias', [False, True])
+@torch.no_grad()
+def test_returned_attention_and_qkv(window_size, with_rel_pos_bias):
+    attn, x, rel_pos_bias = make_inputs(window_size, with_rel_pos_bias)
+    weights, v = explicit_attention_weights(attn, x, rel_pos_bias)
+
+    returned = attn(x, rel_pos_bias=rel_pos_bias, return_attention=True)
+    assert returned.shape == (2, NUM_HEADS, N_TOKENS, N_TOKENS)
+    torch.testing.assert_close(returned, weights)
+
+    out, qkv = attn(x, rel_pos_bias=rel_pos_bias, return_qkv=True)
+    torch.testing.assert_close(out, explicit_attention(attn, x, rel_pos_bias))
+    torch.testing.assert_close(qkv[2], v)
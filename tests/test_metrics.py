@@ -0,0 +1,66 @@
+import pytest
+import torch
+from sklearn.metrics import (
+    accuracy_score, average_precision_score, balanced_accuracy_score, cohen_kappa_score, f1_score, roc_auc_score,
+)
+
+from baseline.abstract.metrics import StreamingClassificationMetrics
+
+
+def stream_batches(n_class: int, n_samples: int, batch_size: int, labels_used: int, seed: int):
+    """Logits correlated with the labels, split into batches of uneven size at the end."""
+    generator = torch.Generator().manual_seed(seed)
+    labels = torch.randint(0, labels_used, (n_samples,), generator=generator)
+    logits = torch.randn(n_samples, n_class, generator=generator)
+    logits[torch.arange(n_samples), labels] += 1.0
+    return list(zip(torch.split(logits, batch_size), torch.split(labels, batch_size)))
+
+
+def accumulate(n_class: int, batches) -> StreamingClassificationMetrics:
+    stream = StreamingClassificationMetrics(n_class)
+    for logits, labels in batches:
+        loss = torch.nn.functional.cross_entropy(logits, labels)
+        stream.update(logits, labels, loss)
+    return stream
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_binary_metrics_match_sklearn(seed):
+    batches = stream_batches(n_class=2, n_samples=3001, batch_size=64, labels_used=2, seed=seed)
+    metrics = accumulate(2, batches).compute()
+
+    logits = torch.cat([logits for logits, _ in batches])
+    labels = torch.cat([labels for _, labels in batches]).numpy()
+    pred = logits.argmax(dim=-1).numpy()
+    prob = torch.softmax(logits, dim=-1)[:, 1].numpy()
+
+    assert set(metrics) == {'loss', 'acc', 'balanced_acc', 'auroc', 'auc_pr'}
+    assert metrics['loss'] == pytest.approx(torch.nn.functional.cross_entropy(logits, torch.from_numpy(labels)).item())
+    assert metrics['acc'] == pytest.approx(accuracy_score(labels, pred))
+    assert metrics['balanced_acc'] == pytest.approx(balanced_accuracy_score(labels, pred))
+    # scores are binned, distinct probabilities in one of the 4096 bins are tied
+    assert metrics['auroc'] == pytest.approx(roc_auc_score(labels, prob), abs=1e-3)
+    assert metrics['auc_pr'] == pytest.approx(average_precision_score(labels, prob), abs=1e-3)
+
+
+@pytest.mark.parametrize('labels_used', [5, 4])
+def test_multiclass_metrics_match_sklearn(labels_used):
+    # with 4 labels used the last class is only ever predicted, sklearn leaves it out of the balanced accuracy
+    batches = stream_batches(n_class=5, n_samples=2500, batch_size=100, labels_used=labels_used, seed=2)
+    metrics = accumulate(5, batches).compute()
+
+    logits = torch.cat([logits for logits, _ in batches])
+    labels = torch.cat([labels for _, labels in batches]).numpy()
+    pred = logits.argmax(dim=-1).numpy()
+
+    assert set(metrics) == {'loss', 'acc', 'balanced_acc', 'cohen_kappa', 'f1'}
+    assert metrics['acc'] == pytest.approx(accuracy_score(labels, pred))
+    assert metrics['balanced_acc'] == pytest.approx(balanced_accuracy_score(labels, pred))
+    assert metrics['cohen_kappa'] == pytest.approx(cohen_kappa_score(labels, pred))
+    assert metrics['f1'] == pytest.approx(f1_score(labels, pred, average='weighted'))
+
+
+def test_binary_single_class_sets_auc_to_zero():
+    batches = stream_batches(n_class=2, n_samples=200, batch_size=50, labels_used=1, seed=3)
+    metrics = accumulate(2, batches).compute()
+    assert metrics['auroc'] == 0.0 and metrics['auc_pr'] == 0.0
@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from toy_trainer import ToyTrainer, toy_config
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CountingTrainer(ToyTrainer):
+    """Records the trained (dataset, epoch) pairs and raises before training ``interrupt_at``."""
+
+    def __init__(self, cfg, interrupt_at=None):
+        super().__init__(cfg)
+        self.interrupt_at = interrupt_at
+        self.trained = []
+
+    def train_epoch(self, train_loader, train_sampler):
+        if (self.eval_ds_name, self.epoch) == self.interrupt_at:
+            raise Interrupted()
+        self.trained.append((self.eval_ds_name, self.epoch))
+        return super().train_epoch(train_loader, train_sampler)
+
+
+def results(trainer, ds_name: str) -> pd.DataFrame:
+    path = next(path for path in trainer.saved_results if f'_{ds_name}_' in path.name)
+    return pd.read_csv(path)
+
+
+def test_rerun_skips_finished_datasets_and_resumes_the_interrupted_one(tmp_path):
+    reference = CountingTrainer(toy_config(str(tmp_path / 'reference')))
+    reference.run()
+
+    first = CountingTrainer(toy_config(str(tmp_path / 'run')), interrupt_at=('b', 1))
+    with pytest.raises(Interrupted):
+        first.run()
+    first.checkpoint_writer.wait()
+    assert first.trained == [('a', 0), ('a', 1), ('a', 2), ('b', 0)]
+
+    rerun = CountingTrainer(toy_config(str(tmp_path / 'run')))
+    rerun.run()
+    assert rerun.trained == [('b', 1), ('b', 2)]
+
+    metrics = ['split', 'epoch', 'loss', 'balanced_acc']
+    for ds_name in ('a', 'b'):
+        pd.testing.assert_frame_equal(results(rerun, ds_name)[metrics], results(reference, ds_name)[metrics])
+
+
+def test_changed_configuration_trains_from_scratch(tmp_path):
+    CountingTrainer(toy_config(str(tmp_path))).run()
+    rerun = CountingTrainer(toy_config(str(tmp_path), max_lr=1e-3))
+    rerun.run()
+    assert rerun.trained == [(ds_name, epoch) for ds_name in ('a', 'b') for epoch in range(3)]
@@ -0,0 +1,141 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from common.distributed.loader import DistributedGroupBatchSampler, IndexPermutation
+from data.processor.wrapper import ConcatEEGIndex
+
+
+def make_index(interleaved: bool) -> ConcatEEGIndex:
+    """Two datasets with three montages of uneven sizes, rows of a montage contiguous or interleaved."""
+    sizes = [37, 120, 58]
+    montage_id = np.repeat(np.arange(len(sizes)), sizes).astype(np.int32)
+    if interleaved:
+        montage_id = np.random.default_rng(0).permutation(montage_id)
+    return ConcatEEGIndex(
+        ds_names=['a', 'b'],
+        ds_offsets=np.array([0, 100, len(montage_id)]),
+        montage_names=['a/m1', 'a/m0', 'b/m0'],
+        montage_id=montage_id,
+    )
+
+
+def epoch_batches(sampler: DistributedGroupBatchSampler, epoch: int) -> list[list[int]]:
+    sampler.set_epoch(epoch)
+    return [batch.tolist() for batch in sampler]
+
+
+@pytest.mark.parametrize('n', [1, 2, 5, 64, 1000])
+def test_index_permutation_is_permutation(n):
+    perm = IndexPermutation(n, (3, 7))
+    values = perm(np.arange(n))
+    assert sorted(values.tolist()) == list(range(n))
+    assert np.array_equal(perm(np.arange(n)[::-1]), values[::-1])
+
+
+@pytest.mark.parametrize('interleaved', [False, True])
+@pytest.mark.parametrize('sample_ratio', [1.0, 0.6])
+@pytest.mark.parametrize('shuffle, drop_last, even_batches', [
+    (True, False, True), (True, True, True), (False, False, True), (True, False, False),
+])
+def test_lazy_batches_match_eager(interleaved, sample_ratio, shuffle, drop_last, even_batches):
+    index = make_index(interleaved)
+    for num_replicas in (1, 3):
+        for rank in range(num_replicas):
+            kwargs = dict(
+                dataset=index, batch_size=16, sample_ratio=sample_ratio, num_replicas=num_replicas, rank=rank,
+                shuffle=shuffle, seed=11, drop_last=drop_last, eeg_index=index, even_batches=even_batches,
+            )
+            eager = DistributedGroupBatchSampler(lazy=False, **kwargs)
+            lazy = DistributedGroupBatchSampler(lazy=True, **kwargs)
+            assert len(lazy) == len(eager)
+            for epoch in (0, 1, 4):
+                batches = epoch_batches(eager, epoch)
+                assert epoch_batches(lazy, epoch) == batches
+                assert len(batches) == len(eager)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_ranks_share_disjoint_montage_batches(lazy):
+    index = make_index(interleaved=True)
+    montage_id = np.asarray(index.montage_id)
+    samplers = [
+        DistributedGroupBatchSampler(index, 16, num_replicas=3, rank=rank, seed=2, lazy=lazy, eeg_index=index)
+        for rank in range(3)
+    ]
+    for epoch in (0, 1):
+        batches = list(itertools.chain.from_iterable(epoch_batches(sampler, epoch) for sampler in samplers))
+        indices = list(itertools.chain.from_iterable(batches))
+        assert len(indices) == len(set(indices))
+        assert all(len(set(montage_id[batch])) == 1 for batch in batches)
+    # batches keep their samples across epochs and only change order
+    assert sorted(epoch_batches(samplers[0], 0) + epoch_batches(samplers[1], 0) + epoch_batches(samplers[2], 0)) \
+        == sorted(epoch_batches(samplers[0], 1) + epoch_batches(samplers[1], 1) + epoch_batches(samplers[2], 1))
+
+
+@pytest.mark.parametrize('schedule', ['uniform', 'temperature', 'round_robin'])
+def test_dataset_step_counts_are_per_epoch(schedule):
+    index = make_index(interleaved=False)
+    sampler = DistributedGroupBatchSampler(index, 16, num_replicas=1, rank=0, eeg_index=index, schedule=schedule)
+    for epoch in range(3):
+        epoch_batches(sampler, epoch)
+        assert sum(sampler.dataset_step_counts.values()) == len(sampler)
+
+
+def make_datasets_index(sizes: dict[str, int]) -> ConcatEEGIndex:
+    """One montage per dataset with the given number of samples."""
+    montage_id = np.repeat(np.arange(len(sizes)), list(sizes.values())).astype(np.int32)
+    return ConcatEEGIndex(
+        ds_names=list(sizes),
+        ds_offsets=np.concatenate([[0], np.cumsum(list(sizes.values()))]),
+        montage_names=[f'{name}/m0' for name in sizes],
+        montage_id=montage_id,
+    )
+
+
+@pytest.mark.parametrize('schedule, kwargs, expected', [
+    ('uniform', {}, {'big': 90, 'mid': 30, 'small': 10}),
+    ('proportional', {}, {'big': 90, 'mid': 30, 'small': 10}),
+    ('temperature', {'temperature': 3.0}, {'big': 60, 'mid': 41, 'small': 29}),
+    ('round_robin', {}, {'big': 44, 'mid': 43, 'small': 43}),
+    ('quota', {'quotas': {'big': 1.0, 'mid': 1.0, 'small': 2.0}}, {'big': 33, 'mid': 32, 'small': 65}),
+])
+@pytest.mark.parametrize('num_replicas', [1, 2])
+def test_schedule_dataset_shares(schedule, kwargs, expected, num_replicas):
+    sizes = {'big': 900, 'mid': 300, 'small': 100}
+    index = make_datasets_index(sizes)
+    sample_dataset = np.repeat(list(sizes), list(sizes.values()))
+    samplers = [
+        DistributedGroupBatchSampler(
+            index, 10, num_replicas=num_replicas, rank=rank, seed=5, eeg_index=index, schedule=schedule, **kwargs,
+        )
+        for rank in range(num_replicas)
+    ]
+    for epoch in (0, 1):
+        counts = dict.fromkeys(sizes, 0)
+        for sampler in samplers:
+            for batch in epoch_batches(sampler, epoch):
+                datasets = set(sample_dataset[batch])
+                assert len(datasets) == 1
+                counts[datasets.pop()] += 1
+        assert counts == expected
+        assert {
+            name: sum(sampler.dataset_step_counts[name] for sampler in samplers) for name in sizes
+        } == expected
+
+
+def test_round_robin_spreads_datasets_over_the_epoch():
+    index = make_datasets_index({'big': 900, 'mid': 300, 'small': 100})
+    sampler = DistributedGroupBatchSampler(index, 10, num_replicas=1, rank=0, eeg_index=index, schedule='round_robin')
+    montage_id = np.asarray(index.montage_id)
+    order = [int(montage_id[batch[0]]) for batch in epoch_batches(sampler, 0)]
+    # every window of three consecutive steps visits each dataset once
+    assert all(sorted(order[i:i + 3]) == [0, 1, 2] for i in range(0, len(order) - 3, 3))
+
+
+@pytest.mark.parametrize('quotas', [{'a': 0.0, 'b': 0.0}, {'a': 1.0, 'b': -1.0}])
+def test_quota_schedule_needs_a_positive_quota(quotas):
+    index = make_index(interleaved=False)
+    with pytest.raises(ValueError, match='positive'):
+        DistributedGroupBatchSampler(index, 16, num_replicas=1, rank=0, eeg_index=index, schedule='quota', quotas=quotas)
@@ -0,0 +1,78 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from common.distributed.loader import ShardStreamDataset
+
+
+N_CHANNELS = {'ds/m0': 4, 'ds/m1': 6}
+N_TIMES = 5
+
+
+@pytest.fixture(scope='module')
+def shards(tmp_path_factory) -> list[tuple[str, int]]:
+    """Parquet shards of one montage each, every value of a window is its global row id."""
+    directory = tmp_path_factory.mktemp('shards')
+    shards, row_id = [], 0
+    for i, n_rows in enumerate([23, 31, 17, 40, 26, 35]):
+        montage = list(N_CHANNELS)[i % 2]
+        n_channels = N_CHANNELS[montage]
+        ids = np.arange(row_id, row_id + n_rows)
+        row_id += n_rows
+        table = pa.table({
+            'montage': [montage] * n_rows,
+            'chs': [list(range(n_channels))] * n_rows,
+            'data': [np.full(n_channels * N_TIMES, idx, dtype=np.float32) for idx in ids],
+            'task': np.zeros(n_rows, dtype=np.int32),
+            'label': ids % 3,
+        })
+        path = directory / f'shard_{i}.parquet'
+        pq.write_table(table, path)
+        shards.append((str(path), n_rows))
+    return shards
+
+
+def make_dataset(shards, **kwargs) -> ShardStreamDataset:
+    return ShardStreamDataset(shards, batch_size=4, seed=3, buffer_size=8, **kwargs)
+
+
+def epoch_batches(dataset: ShardStreamDataset, num_workers: int = 0) -> list[dict]:
+    return list(DataLoader(dataset, batch_size=None, num_workers=num_workers, persistent_workers=False))
+
+
+def row_ids(batch: dict) -> list[int]:
+    return batch['data'][:, 0, 0].long().tolist()
+
+
+@pytest.mark.parametrize('num_replicas', [1, 2, 3])
+def test_ranks_yield_equal_montage_homogeneous_batches(shards, num_replicas):
+    datasets = [make_dataset(shards, num_replicas=num_replicas, rank=rank) for rank in range(num_replicas)]
+    n_windows = sum(n_rows for _, n_rows in shards)
+    assert all(len(dataset) == -(-n_windows // (4 * num_replicas)) for dataset in datasets)
+
+    for epoch in (0, 1):
+        for dataset in datasets:
+            dataset.set_epoch(epoch)
+            batches = epoch_batches(dataset)
+            assert len(batches) == len(dataset)
+            for batch in batches:
+                montage = set(batch['montage'])
+                assert len(montage) == 1
+                assert batch['data'].shape == (4, N_CHANNELS[montage.pop()], N_TIMES)
+                assert batch['label'].tolist() == [idx % 3 for idx in row_ids(batch)]
+
+
+@pytest.mark.parametrize('num_workers', [0, 2])
+@pytest.mark.parametrize('step', [0, 3, 4])
+def test_resumed_epoch_reproduces_the_tail(shards, num_workers, step):
+    full = make_dataset(shards, num_replicas=2, rank=1)
+    full.set_epoch(1)
+    reference = [row_ids(batch) for batch in epoch_batches(full, num_workers)]
+    assert len(reference) == len(full)
+
+    resumed = make_dataset(shards, num_replicas=2, rank=1)
+    resumed.load_state_dict(full.state_dict(step))
+    assert [row_ids(batch) for batch in epoch_batches(resumed, num_workers)] == reference[step:]
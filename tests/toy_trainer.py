@@ -0,0 +1,88 @@
+"""Small trainer on synthetic montage data for tests of the training loops."""
+import datasets
+import numpy as np
+from torch import nn
+
+from baseline.abstract.adapter import AbstractDataLoaderFactory
+from baseline.abstract.classifier import MultiHeadClassifier
+from baseline.abstract.trainer import AbstractTrainer
+from common.config import AbstractConfig
+
+
+N_SAMPLES = 50
+
+
+def make_dataset(n: int, seed: int = 0) -> datasets.Dataset:
+    """Windows of two montages with 4 and 6 channels and 3 classes."""
+    rng = np.random.default_rng(seed)
+    rows = {'sample_id': [], 'data': [], 'chs': [], 'task': [], 'montage': [], 'label': []}
+    for i in range(n):
+        n_chs = 6 if i % 3 == 0 else 4
+        rows['sample_id'].append(f'f_{i}')
+        rows['data'].append(rng.standard_normal((n_chs, N_SAMPLES)).astype(np.float32))
+        rows['chs'].append(np.arange(n_chs, dtype=np.int32))
+        rows['task'].append(0)
+        rows['montage'].append('ds/b' if i % 3 == 0 else 'ds/a')
+        rows['label'].append(int(rng.integers(0, 3)))
+    features = datasets.Features({
+        'sample_id': datasets.Value('string'),
+        'data': datasets.Sequence(datasets.Sequence(datasets.Value('float32'))),
+        'chs': datasets.Sequence(datasets.Value('int32')),
+        'task': datasets.Value('int32'),
+        'montage': datasets.Value('string'),
+        'label': datasets.Value('int64'),
+    })
+    return datasets.Dataset.from_dict(rows, features=features).with_format('torch')
+
+
+class ToyConfig(AbstractConfig):
+    model_type: str = 'toy'
+
+    def validate_config(self) -> bool:
+        return True
+
+
+class ToyDataLoaderFactory(AbstractDataLoaderFactory):
+    def create_adapter(self, dataset, dataset_names, dataset_configs):
+        return dataset
+
+
+class ToyModel(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.encoder = nn.Linear(N_SAMPLES, 16)
+        self.classifier = MultiHeadClassifier(16, [8], {'ds': 3})
+
+    def forward(self, batch):
+        return self.classifier(self.encoder(batch['data'].float()), batch['montage'][0].split('/')[0])
+
+
+class ToyTrainer(AbstractTrainer):
+    """Every dataset of the config is served by synthetic windows of the 'ds' head."""
+
+    def __init__(self, cfg: ToyConfig):
+        super().__init__(cfg)
+        self.dataloader_factory = ToyDataLoaderFactory(batch_size=16, num_workers=0, seed=cfg.seed)
+        self.loss_fn = nn.CrossEntropyLoss()
+
+    def collect_dataset_info(self, mixed: bool, ds_name: str = ''):
+        self.ds_info = {'ds': {'n_class': 3, 'category': ['a', 'b', 'c']}}
+
+    def setup_model(self):
+        self.model = ToyModel()
+        return self.model
+
+    def load_checkpoint(self, checkpoint_path):
+        pass
+
+    def create_single_dataloader(self, ds_name, ds_config, split=datasets.Split.TRAIN):
+        dataset = make_dataset(60, seed=sorted(self.ds_conf).index(ds_name))
+        return self.dataloader_factory.create_dataloader_from_dataset(dataset, ['ds'], [ds_config], split)
+
+
+def toy_config(output_dir: str, **training) -> ToyConfig:
+    return ToyConfig(
+        data={'datasets': {'a': 'x', 'b': 'x'}},
+        training={'max_epochs': 3, 'use_amp': False, 'freeze_encoder': False, 'device': 'cpu', **training},
+        logging={'output_dir': output_dir, 'ckpt_dir': f'{output_dir}/ckpt', 'log_step_interval': 1000},
+    )